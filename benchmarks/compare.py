@@ -0,0 +1,54 @@
+# Diff two run_benchmarks.py results: median ms per page / interaction, old vs new.
+#
+# usage: python benchmarks/compare.py benchmarks/results/abc1234.json benchmarks/results/def5678.json
+#        python benchmarks/compare.py old.json new.json --threshold 15 --fail   -> exit 1 on a regression
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% change that counts as slower / faster (default 10)")
+    parser.add_argument("--fail", action="store_true", help="exit with status 1 if anything got slower than the threshold")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'page':<6}{'interaction':<16}{'old ms':>10}{'new ms':>10}{'change':>10}")
+
+    regressions = 0
+    for page in sorted(set(old["pages"]) | set(new["pages"])):
+        old_page, new_page = old["pages"].get(page, {}), new["pages"].get(page, {})
+        for name in [n for n in {**old_page, **new_page} if n != "errors"]:
+            before = old_page.get(name, {}).get("median_ms")
+            after = new_page.get(name, {}).get("median_ms")
+            if before is None or after is None:
+                print(f"{page:<6}{name:<16}{before or '-':>10}{after or '-':>10}{'':>10}")
+                continue
+
+            change = (after - before) / before * 100 if before else 0.0
+            flag = ""
+            if change > args.threshold:
+                flag, regressions = "  ⚠️ slower", regressions + 1
+            elif change < -args.threshold:
+                flag = "  ✅ faster"
+            print(f"{page:<6}{name:<16}{before:>10.1f}{after:>10.1f}{change:>+9.1f}%{flag}")
+
+        for name, messages in new_page.get("errors", {}).items():
+            print(f"{page:<6}{name:<16}⚠️ {messages[0]}")
+
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
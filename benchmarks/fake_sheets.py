@@ -0,0 +1,177 @@
+# Local stand-ins for Google Sheets and the AgGrid browser side, so the benchmarks run headless and offline.
+#
+# FakeClient / FakeSpreadsheet / FakeWorksheet cover the slice of gspread the app uses:
+#   client.open(name), sheet.worksheet(title), sheet.worksheets(), sheet.add_worksheet(...), sheet.values_batch_get(ranges),
+#   worksheet.get_all_records(), worksheet.get_all_values(), worksheet.update(range, values), worksheet.batch_update(data),
+#   worksheet.append_row(row), worksheet.append_rows(rows), worksheet.clear()
+# Every spreadsheet starts with one header-only tab per country, like generate_blank_gsheet.py sets them up,
+# plus a few override rows for the first country so the load / merge path does real work.
+#
+# Each fake call is booked in gsheets_metrics like the real API call it stands for (the real client is counted at its
+# HTTP layer, which the fake doesn't have), so the diagnostics panel and the benchmarks see the same call counts.
+#
+# The grid stand-in: AppTest can't type into a custom component, so install() wraps st_aggrid.AgGrid to return
+# the queued edits as the grid's edited cells. That is what the real grid sends back after an analyst edits a cell
+# (EDITED_CELLS in grid_js.py).
+
+import gspread
+import pandas as pd
+from google.oauth2 import service_account
+from gspread.utils import a1_to_rowcol
+
+from gsheets_metrics import record_call
+
+# spreadsheet -> header row, as created by generate_blank_gsheet.py / generate_blank_gsheet_sim.py
+SPREADSHEET_HEADERS = {
+    "analyst_overrides_short": ["year", "short_name", "Adjustment", "Analyst Comment"],
+    "analyst_overrides_long": ["year", "short_name", "Adjustment", "Analyst Comment"],
+    "analyst_overrides_sim": ["year", "short_name", "Custom Value"],
+}
+
+# a few override rows for the first country in every year, per spreadsheet
+FIXTURE_ROWS = {
+    "analyst_overrides_short": [["governance_factor", 1, "benchmark fixture"], ["govdebt_factor", -0.5, ""]],
+    "analyst_overrides_long": [["voice_acct", 0.5, "benchmark fixture"], ["ir_rev", -0.5, ""]],
+    "analyst_overrides_sim": [["wealth_factor", 1.0], ["govdebt_factor", -1.0]],
+}
+
+
+READ_OPERATIONS = {"metadata", "values_get", "values_batch_get"}
+
+
+def _count(operation, spreadsheet, tab="", payload=None):
+    kind = "drive" if operation.startswith("drive") else ("read" if operation in READ_OPERATIONS else "write")
+    record_call(operation, kind, spreadsheet, tab, 0.0, len(str(payload)) if payload is not None else 0, 200)
+
+
+class FakeWorksheet:
+    def __init__(self, title, rows=None, spreadsheet=""):
+        self.title = title
+        self.spreadsheet = spreadsheet
+        self.values = [list(r) for r in (rows or [])]  # header row first, like the sheet grid
+
+    def get_all_records(self):
+        _count("values_get", self.spreadsheet, self.title, self.values)
+        if len(self.values) < 2:
+            return []
+        keys = self.values[0]
+        return [dict(zip(keys, row + [""] * (len(keys) - len(row)))) for row in self.values[1:]]
+
+    def get_all_values(self):
+        # the API hands back every cell as a formatted string, rows padded to the same width
+        _count("values_get", self.spreadsheet, self.title, self.values)
+        width = max((len(row) for row in self.values), default=0)
+        return [[str(v) for v in row] + [""] * (width - len(row)) for row in self.values]
+
+    def update(self, range_name, values):
+        # the app always writes the whole tab from A1
+        _count("values_update", self.spreadsheet, self.title)
+        self.values = [list(r) for r in values]
+
+    def batch_update(self, data):
+        # single cells, [{"range": "C5", "values": [[value]]}, ...], as save_override_deltas sends them
+        _count("values_batch_update", self.spreadsheet, self.title, data)
+        for item in data:
+            row, col = a1_to_rowcol(item["range"])
+            while len(self.values) < row:
+                self.values.append([])
+            cells = self.values[row - 1]
+            cells += [""] * (col - len(cells))
+            cells[col - 1] = item["values"][0][0]
+
+    def append_row(self, row):
+        _count("values_append", self.spreadsheet, self.title)
+        self.values.append(list(row))
+
+    def append_rows(self, rows):
+        _count("values_append", self.spreadsheet, self.title)
+        self.values += [list(row) for row in rows]
+
+    def clear(self):
+        _count("values_clear", self.spreadsheet, self.title)
+        self.values = []
+
+
+class FakeSpreadsheet:
+    def __init__(self, title):
+        self.title = title
+        self.tabs = {}
+
+    def worksheet(self, title):
+        _count("metadata", self.title)  # gspread looks the tab up in the spreadsheet metadata
+        if title not in self.tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.tabs[title]
+
+    def worksheets(self):
+        _count("metadata", self.title)
+        return list(self.tabs.values())
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        _count("batch_update", self.title)
+        self.tabs[title] = FakeWorksheet(title, spreadsheet=self.title)
+        return self.tabs[title]
+
+    def values_batch_get(self, ranges):
+        # the API hands back every cell as a formatted string
+        value_ranges = []
+        for rng in ranges:
+            title = rng.split("!")[0].strip("'").replace("''", "'")
+            values = self.tabs[title].values if title in self.tabs else []
+            value_ranges.append({"range": rng, "values": [[str(v) for v in row] for row in values]})
+        _count("values_batch_get", self.title, f"{len(ranges)} tabs", value_ranges)
+        return {"valueRanges": value_ranges}
+
+
+class FakeClient:
+    def __init__(self, spreadsheets):
+        self.spreadsheets = spreadsheets
+
+    def open(self, title):
+        # drive lookup by title, then the spreadsheet metadata
+        _count("drive_get", title)
+        if title not in self.spreadsheets:
+            raise gspread.exceptions.SpreadsheetNotFound(title)
+        _count("metadata", title)
+        return self.spreadsheets[title]
+
+
+def build_fake_client(countries, years):
+    """A client holding every spreadsheet the app opens, one tab per country, fixture rows for countries[0]."""
+    spreadsheets = {}
+    for name, header in SPREADSHEET_HEADERS.items():
+        sheet = FakeSpreadsheet(name)
+        for country in countries:
+            sheet.tabs[country] = FakeWorksheet(country, [header], spreadsheet=name)
+        sheet.tabs[countries[0]].values += [[year] + row for year in years for row in FIXTURE_ROWS[name]]
+        spreadsheets[name] = sheet
+    return FakeClient(spreadsheets)
+
+
+## Grid edits: {column that identifies the grid: [(short_name, column, value), ...]}
+## "Rating (notches)" -> main table grid, "Raw Value" -> supplementary / simulation grids
+
+GRID_EDITS = {}
+
+
+def install(countries, years):
+    """Points gspread at the fake client and wraps AgGrid. Returns the fake client (to inspect what got saved)."""
+    import st_aggrid
+    from st_aggrid.collectors.custom import CustomResponse
+
+    client = build_fake_client(countries, years)
+    gspread.authorize = lambda creds: client
+    service_account.Credentials.from_service_account_info = classmethod(lambda cls, info, **kwargs: object())
+
+    real_aggrid = getattr(st_aggrid.AgGrid, "__wrapped__", st_aggrid.AgGrid)
+
+    def AgGrid(data=None, *args, **kwargs):
+        response = real_aggrid(data, *args, **kwargs)
+        for marker, edits in GRID_EDITS.items():
+            if isinstance(data, pd.DataFrame) and marker in data.columns and edits:
+                return CustomResponse([list(edit) for edit in edits])
+        return response
+
+    AgGrid.__wrapped__ = real_aggrid
+    st_aggrid.AgGrid = AgGrid
+    return client
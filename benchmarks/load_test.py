@@ -0,0 +1,490 @@
+# Concurrent-analyst load test: how many analysts can one Streamlit container serve at the same time?
+#
+# Starts the app in a real Streamlit server (a subprocess, the same as `streamlit run`), backed by the in-memory
+# Sheets stand-in (fake_sheets.py). Then it connects N browser-like sessions to the server's websocket.
+# Each session has its own session_state, logs in with the write or read password and replays an analyst
+# workflow in a loop until the level's time is up:
+#   write: browse countries, edit an adjustment in the grid, save, export, simulate + save on Country Simulation
+#   read:  browse countries / years, export, Historical and Peer Comparison
+# A step is timed from the rerun request to the server's script_finished. Exports also fetch the generated file.
+#
+# Per concurrency level it reports throughput (steps / s), latency p50 / p95 / p99 per step, errors,
+# the server's RSS (start / peak / end), what its caches and session state hold at the end (memory_utils.py)
+# and the Sheets API calls made (gsheets_metrics.py, counted in the server).
+#
+# usage: python benchmarks/load_test.py                                -> 1, 4, 8, 16 sessions, 60 s each
+#        python benchmarks/load_test.py --sessions 2 10 --duration 30 --writers 0.25 --output load.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+import websockets
+from streamlit.dataframe_util import convert_arrow_bytes_to_pandas_df
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from run_benchmarks import FAKE_SECRETS, git_commit
+
+MAIN_SCRIPT = "Sovereign_Credit_Rating_Model.py"
+FINISHED = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY}
+
+
+## The server. `load_test.py --serve <port> <status file>` runs the app with the Sheets stand-in installed.
+## The status file gets the server's Sheets API counters twice a second, for the load test to read.
+
+def serve(port, status_file):
+    import fake_sheets
+    import gsheets_metrics
+    import memory_utils
+    from streamlit.web import bootstrap
+
+    os.chdir(REPO_DIR)
+    transform = pd.read_excel("transform_data.xlsx", usecols=["name", "year"])
+    countries = sorted(pd.read_excel("index_country.xlsx")["name"].dropna().unique())
+    fake_sheets.install(countries, sorted(transform["year"].unique().tolist()))
+
+    secrets = Path(status_file).with_suffix(".toml")
+    secrets.write_text("".join(
+        f"[{section}]\n" + "".join(f'{key} = "{value}"\n' for key, value in values.items())
+        for section, values in FAKE_SECRETS.items()
+    ))
+
+    def report_status():
+        while True:
+            status = {**gsheets_metrics.quota_usage(), "memory_mb": memory_utils.latest_totals()}
+            Path(status_file).write_text(json.dumps(status))
+            time.sleep(0.5)
+
+    memory_utils.start_sampler(interval_s=5)  # cache / session state sizes while the sessions run
+    threading.Thread(target=report_status, daemon=True).start()
+    flag_options = {
+        "server.port": port,
+        "server.headless": True,
+        "server.fileWatcherType": "none",
+        "browser.gatherUsageStats": False,
+        "secrets.files": [str(secrets)],
+    }
+    bootstrap.load_config_options(flag_options)  # what `streamlit run --server.port ...` does before starting
+    bootstrap.run(MAIN_SCRIPT, False, [], flag_options)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    # resident memory of the server process (Linux; None elsewhere)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+## A browser-like session: one websocket, its own session_state on the server
+
+class Session:
+    def __init__(self, base_url, role):
+        self.base_url = base_url
+        self.role = role
+        self.ws = None
+        self.session_id = ""
+        self.pages = {}  # page name -> page_script_hash
+        self.page_hash = ""
+        self.widgets = {}  # widget id -> WidgetState the "browser" holds for the current page
+        self.grid_edits = {}  # grid id -> {(short_name, column): value}, the edit log each grid keeps in the browser
+        self.elements = []  # (type, proto, fragment id or "") on screen
+        self.errors = []
+
+    async def connect(self):
+        url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.ws = await websockets.connect(url, subprotocols=["streamlit"], max_size=None)
+        await self.rerun()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, trigger=None, fragment_id=""):
+        """
+        Sends a rerun with the current widget states (+ a one-off button trigger), waits for the run to finish.
+        Like the browser, a widget inside an st.fragment asks for a rerun of just that fragment (fragment_id).
+        """
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.widget_states.widgets.extend(self.widgets.values())
+        if trigger is not None:
+            msg.rerun_script.widget_states.widgets.append(trigger)
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+        await self.ws.send(msg.SerializeToString())
+
+        self.errors = []
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(await self.ws.recv())
+            kind = fm.WhichOneof("type")
+            if kind == "new_session":
+                # a new run (st.rerun() starts one too): what's on screen is redrawn from scratch,
+                # or for a fragment run, just that fragment
+                rerun_fragments = set(fm.new_session.fragment_ids_this_run)
+                self.elements = [e for e in self.elements if rerun_fragments and e[2] not in rerun_fragments]
+                self.pages = {page.page_name: page.page_script_hash for page in fm.new_session.app_pages}
+                if fm.new_session.HasField("initialize"):
+                    self.session_id = fm.new_session.initialize.session_id
+            elif kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                element = fm.delta.new_element
+                element_type = element.WhichOneof("type")
+                self.elements.append((element_type, getattr(element, element_type), fm.delta.fragment_id))
+                if element_type == "exception":
+                    self.errors.append(f"{element.exception.type}: {element.exception.message}")
+            elif kind == "script_finished" and fm.script_finished in FINISHED:
+                return
+
+    async def goto(self, page_name):
+        # like clicking a page in the sidebar: new page, no widget state carried over
+        self.page_hash = self.pages[page_name]
+        self.widgets = {}
+        await self.rerun()
+
+    def find(self, element_type, label=None, key=None, with_fragment=False):
+        for found_type, element, fragment_id in self.elements:
+            if found_type != element_type:
+                continue
+            if (label is not None and getattr(element, "label", None) == label) or (
+                    key is not None and element.id.endswith(f"-{key}")):
+                return (element, fragment_id) if with_fragment else element
+        raise LookupError(f"no {element_type} {label or key!r} on the page")
+
+    async def select(self, label, choose):
+        box = self.find("selectbox", label=label)
+        state = WidgetState(id=box.id)
+        state.string_value = choose(list(box.options))
+        self.widgets[box.id] = state
+        await self.rerun()
+
+    async def multiselect(self, label_prefix, choose):
+        box = next(e for t, e, _ in self.elements if t == "multiselect" and e.label.startswith(label_prefix))
+        state = WidgetState(id=box.id)
+        state.string_array_value.data.extend(choose(list(box.options)))
+        self.widgets[box.id] = state
+        await self.rerun()
+
+    async def type_text(self, label, text):
+        box = self.find("text_input", label=label)
+        state = WidgetState(id=box.id)
+        state.string_value = text
+        self.widgets[box.id] = state
+
+    async def click(self, label=None, key=None):
+        button, fragment_id = self.find("button", label=label, key=key, with_fragment=True)
+        await self.rerun(trigger=WidgetState(id=button.id, trigger_value=True), fragment_id=fragment_id)
+
+    async def edit_grid(self, column, short_name, edit_column, value):
+        """Edits one cell of the AgGrid that has `column`: sends back every cell edited in that grid, as the browser does."""
+        for element_type, element, fragment_id in self.elements:
+            if element_type != "component_instance" or "agGrid" not in element.component_name:
+                continue
+            frames = [arg for arg in element.special_args if arg.WhichOneof("value") == "arrow_dataframe"]
+            if not frames:
+                continue
+            df = convert_arrow_bytes_to_pandas_df(frames[0].arrow_dataframe.data.data)
+            if column not in df.columns:
+                continue
+
+            # a grid with new data is a new element id, and starts a new log (EDITED_CELLS in grid_js.py)
+            edits = self.grid_edits.setdefault(element.id, {})
+            edits[(short_name, edit_column)] = value
+            state = WidgetState(id=element.id)
+            state.json_value = json.dumps([[name, col, v] for (name, col), v in edits.items()])
+            self.widgets[element.id] = state
+            await self.rerun(fragment_id=fragment_id)
+            return
+        raise LookupError(f"no grid with a {column!r} column on the page")
+
+    async def download(self, key):
+        """Clicks a download button: deferred exports are built on the server first, then the file is fetched."""
+        button = self.find("download_button", key=key)
+        url = button.url
+        if button.deferred_file_id:
+            msg = BackMsg()
+            msg.backend_operation_request.request_id = f"load-{random.getrandbits(32)}"
+            msg.backend_operation_request.session_id = self.session_id
+            msg.backend_operation_request.deferred_file.file_id = button.deferred_file_id
+            await self.ws.send(msg.SerializeToString())
+            while True:
+                fm = ForwardMsg()
+                fm.ParseFromString(await self.ws.recv())
+                if fm.WhichOneof("type") == "backend_operation_response":
+                    response = fm.backend_operation_response
+                    if response.error_msg:
+                        raise RuntimeError(response.error_msg)
+                    url = response.deferred_file.url
+                    break
+        content = await asyncio.to_thread(lambda: requests.get(self.base_url + url, timeout=120).content)
+        if not content:
+            raise RuntimeError(f"empty download from {key}")
+
+
+## Workflows. Each step is one analyst action; the harness times it.
+
+def any_option(options):
+    return random.choice(options)
+
+
+def recent_year(options):
+    return random.choice(options[:3])
+
+
+def write_workflow(session):
+    return [
+        ("browse_country", lambda: session.select("Select Country", any_option)),
+        ("browse_year", lambda: session.select("Select Year", recent_year)),
+        ("edit_adjustment", lambda: session.edit_grid("Rating (notches)", "governance_factor", "Adjustment", random.choice([-1, 0.5, 1]))),
+        ("save", lambda: session.click(key="short_save")),
+        ("export", lambda: session.download("short_excel")),
+        ("simulation_page", lambda: session.goto("Simulation")),
+        ("simulate", lambda: session.edit_grid("Custom Value", "wealth_factor", "Custom Value", round(random.uniform(-1, 1), 2))),
+        ("simulation_save", lambda: session.click(key="sim_save")),
+        ("main_page", lambda: session.goto("Sovereign Credit Rating Model")),
+    ]
+
+
+def read_workflow(session):
+    return [
+        ("browse_country", lambda: session.select("Select Country", any_option)),
+        ("browse_year", lambda: session.select("Select Year", recent_year)),
+        ("export", lambda: session.download("short_excel")),
+        ("history_page", lambda: session.goto("Historical Comparison")),
+        ("history_country", lambda: session.select("Select Country", any_option)),
+        ("peers_page", lambda: session.goto("Peer Comparison")),
+        ("peers_pick", lambda: session.multiselect("Choose up to", lambda options: random.sample(options, 5))),
+        ("main_page", lambda: session.goto("Sovereign Credit Rating Model")),
+    ]
+
+
+async def analyst(base_url, role, deadline, think_s, samples, errors, once=False):
+    session = Session(base_url, role)
+    try:
+        await session.connect()
+        await session.type_text("Enter access password", FAKE_SECRETS["passwords"][role])
+        start = time.perf_counter()
+        await session.click(label="Login")
+        samples.setdefault("login", []).append((time.perf_counter() - start) * 1000)
+
+        steps = write_workflow(session) if role == "write" else read_workflow(session)
+        while time.monotonic() < deadline:
+            for name, step in steps:
+                if time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(random.expovariate(1 / think_s) if think_s else 0)
+                start = time.perf_counter()
+                try:
+                    await step()
+                except (LookupError, RuntimeError, KeyError) as err:
+                    errors.setdefault(name, []).append(repr(err))
+                    continue
+                samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+                for message in session.errors:
+                    errors.setdefault(name, []).append(message)
+            if once:
+                break
+    finally:
+        await session.close()
+
+
+async def sample_rss(pid, stop, rss):
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            rss.append(value)
+        await asyncio.sleep(0.5)
+
+
+def read_status(status_file):
+    try:
+        return json.loads(Path(status_file).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+async def run_level(base_url, pid, status_file, n_sessions, writers, duration, think_s):
+    samples, errors, rss = {}, {}, []
+    n_writers = max(1, round(n_sessions * writers)) if writers > 0 else 0
+    roles = ["write" if i < n_writers else "read" for i in range(n_sessions)]
+    calls_before = read_status(status_file).get("total_calls", 0)
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pid, stop, rss))
+    start = time.monotonic()
+    await asyncio.gather(*[
+        analyst(base_url, role, start + duration, think_s, samples, errors) for role in roles
+    ], return_exceptions=False)
+    elapsed = time.monotonic() - start
+    stop.set()
+    await sampler
+
+    status = read_status(status_file)
+    steps = {
+        name: {
+            "count": len(ms),
+            "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1),
+            "max_ms": round(max(ms), 1),
+        }
+        for name, ms in sorted(samples.items())
+    }
+    all_ms = [value for name, ms in samples.items() if name != "login" for value in ms]
+    return {
+        "sessions": n_sessions,
+        "writers": roles.count("write"),
+        "elapsed_s": round(elapsed, 1),
+        "throughput_steps_per_s": round(len(all_ms) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(all_ms, 50)), 1) if all_ms else None,
+        "p95_ms": round(float(np.percentile(all_ms, 95)), 1) if all_ms else None,
+        "p99_ms": round(float(np.percentile(all_ms, 99)), 1) if all_ms else None,
+        "errors": sum(len(messages) for messages in errors.values()),
+        "rss_mb": {
+            "start": round(rss[0], 1) if rss else None,
+            "peak": round(max(rss), 1) if rss else None,
+            "end": round(rss[-1], 1) if rss else None,
+        },
+        "memory_mb": {name: round(mb, 1) for name, mb in status.get("memory_mb", {}).items() if mb is not None},
+        "sheets_api": {
+            "calls": status.get("total_calls", 0) - calls_before,
+            "calls_per_min": round((status.get("total_calls", 0) - calls_before) / elapsed * 60, 1),
+            "reads_last_min": status.get("reads"),
+            "writes_last_min": status.get("writes"),
+            "read_quota_pct": round(status.get("read_quota_pct", 0), 1),
+        },
+        "steps": steps,
+        "error_samples": {name: messages[:3] for name, messages in errors.items()},
+    }
+
+
+def wait_for_server(base_url, server, timeout=120):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with code {server.returncode}")
+        try:
+            if requests.get(base_url + "/_stcore/health", timeout=2).ok:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit("Server did not come up")
+
+
+async def warm_up(base_url):
+    # one pass of each workflow so the levels measure a warm server (caches filled, pages imported)
+    errors = {}
+    for role in ["write", "read"]:
+        await analyst(base_url, role, time.monotonic() + 600, 0, {}, errors, once=True)
+    for name, messages in errors.items():
+        print(f"   ⚠️ warm-up {name}: {messages[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app with N concurrent analyst sessions.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8, 16], help="concurrency levels (default 1 4 8 16)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds per level (default 60)")
+    parser.add_argument("--writers", type=float, default=0.25, help="share of sessions with the write role (default 0.25)")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between steps, in seconds (default 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON file (default benchmarks/results/load_<commit>.json)")
+    parser.add_argument("--keep-log", default=None, help="copy the server's log here when done")
+    parser.add_argument("--serve", nargs=2, metavar=("PORT", "STATUS_FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), args.serve[1])
+        return
+
+    random.seed(args.seed)
+    port = free_port()
+    base_url = f"http://localhost:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        status_file = str(Path(tmp) / "status.json")
+        server_log = open(Path(tmp) / "server.log", "w")
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--serve", str(port), status_file],
+            cwd=REPO_DIR, stdout=server_log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_for_server(base_url, server)
+            print(f"⏳ Warming up {base_url} (pid {server.pid})", flush=True)
+            asyncio.run(warm_up(base_url))
+
+            levels = []
+            for n in args.sessions:
+                print(f"⏳ {n} sessions for {args.duration:.0f}s", flush=True)
+                level = asyncio.run(run_level(base_url, server.pid, status_file, n, args.writers, args.duration, args.think))
+                levels.append(level)
+                print(
+                    f"   {level['throughput_steps_per_s']:>6.2f} steps/s   p50 {level['p50_ms']} ms   p95 {level['p95_ms']} ms   "
+                    f"p99 {level['p99_ms']} ms   errors {level['errors']}   RSS {level['rss_mb']['start']} -> "
+                    f"{level['rss_mb']['end']} MB (peak {level['rss_mb']['peak']}; caches "
+                    f"{level['memory_mb'].get('cache_data', 0) + level['memory_mb'].get('cache_resource', 0):.0f} MB, "
+                    f"session state {level['memory_mb'].get('session_state', 0):.1f} MB)   "
+                    f"Sheets API {level['sheets_api']['calls_per_min']} calls/min "
+                    f"({level['sheets_api']['read_quota_pct']:.0f}% of the read quota)",
+                    flush=True,
+                )
+                for name, messages in level["error_samples"].items():
+                    print(f"   ⚠️ {name}: {messages[0]}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            server_log.close()
+            if args.keep_log:
+                Path(args.keep_log).write_text((Path(tmp) / "server.log").read_text())
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpu",
+            "duration_s": args.duration,
+            "writers": args.writers,
+            "think_s": args.think,
+        },
+        "levels": levels,
+    }
+    output = Path(args.output) if args.output else REPO_DIR / "benchmarks" / "results" / f"load_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"✅ Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# End-to-end rerun benchmarks for the app: every page is driven headless with Streamlit's AppTest,
+# against the repo's own data workbooks, fake secrets and the in-memory Sheets stand-in (fake_sheets.py).
+#
+# For each page it times
+#   cold          first run with every st.cache_data / st.cache_resource cleared (a fresh server)
+#   warm          the same run again, nothing changed
+#   + the page's interactions (country change, year change, grid edit, save, ...), one after the other
+# Each scenario is repeated --repeat times; the JSON keeps every sample plus the median and min in ms,
+# and the median number of Google Sheets API calls the rerun made (gsheets_metrics.py, booked by the fake client).
+#
+# usage: python benchmarks/run_benchmarks.py                         -> benchmarks/results/<commit>.json
+#        python benchmarks/run_benchmarks.py --pages main 01 --repeat 5 --output before.json
+#        python benchmarks/compare.py before.json after.json        -> what got slower / faster
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import fake_sheets
+import gsheets_metrics
+
+FAKE_SECRETS = {
+    "passwords": {"write": "benchmark-write", "read": "benchmark-read"},
+    "gcp_service_account": {"private_key": "fake"},
+}
+
+
+## Interactions. Each takes the AppTest (already run once) and the repeat number, and changes something
+## before the timed rerun. The repeat number picks a different country / year each round so no rerun is a no-op.
+
+def select_by_label(label, pick):
+    def interact(at, i):
+        box = next(s for s in at.selectbox if s.label == label)
+        box.select(pick(box.options, i))
+    return interact
+
+
+def next_option(options, i):
+    return options[(i + 1) % len(options)]
+
+
+def last_option(options, i):
+    return options[-1 - (i % max(1, len(options) - 1))]
+
+
+def set_state(key, value):
+    def interact(at, i):
+        at.session_state[key] = value(i) if callable(value) else value
+    return interact
+
+
+def grid_edit(marker, short_name, column):
+    # queue an edit for the grid that has `marker` in its columns; it shows up in AgGrid's response on the rerun
+    def interact(at, i):
+        fake_sheets.GRID_EDITS[marker] = [(short_name, column, float(i % 3 + 1))]
+    return interact
+
+
+def click(key):
+    def interact(at, i):
+        at.button(key=key).click()
+    return interact
+
+
+def peer_sample(n):
+    # n countries spread across the list, shifted each round
+    def pick(i):
+        names = sorted(pd.read_excel(REPO_DIR / "transform_data.xlsx", usecols=["name"])["name"].unique())
+        return names[i % 7::max(1, len(names) // n)][:n]
+    return pick
+
+
+PAGES = {
+    "main": ("Sovereign_Credit_Rating_Model.py", [
+        ("country_change", select_by_label("Select Country", next_option)),
+        ("year_change", select_by_label("Select Year", last_option)),
+        ("grid_edit", grid_edit("Rating (notches)", "governance_factor", "Adjustment")),
+        ("save", click("short_save")),
+    ]),
+    "01": ("pages/01_Country_Comparison.py", [
+        ("country_change", select_by_label("Select Country", next_option)),
+        ("year_change", select_by_label("Select Year", last_option)),
+        ("bucket_change", select_by_label("Peer Group (based on Avg Public Rating)", next_option)),
+    ]),
+    "02": ("pages/02_Historical_Comparison.py", [
+        ("country_change", select_by_label("Select Country", next_option)),
+        ("overlay_5", set_state("compare_names", peer_sample(5))),
+    ]),
+    "03": ("pages/03_Peer_Comparison.py", [
+        ("year_change", select_by_label("Select Year", last_option)),
+        ("peers_5", set_state("country_compare", peer_sample(5))),
+        ("peers_30", set_state("country_compare", peer_sample(30))),
+        ("bucket_change", select_by_label("Show me all countries that are rated...", next_option)),
+    ]),
+    "04": ("pages/04_Simulation.py", [
+        ("country_change", select_by_label("Select Country", next_option)),
+        ("year_change", select_by_label("Select Year", last_option)),
+        ("grid_edit", grid_edit("Custom Value", "wealth_factor", "Custom Value")),
+        ("save", click("sim_save")),
+    ]),
+}
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    errors = [e.message for e in at.exception]
+    return elapsed_ms, errors
+
+
+def run_page(script, interactions, repeat, timeout):
+    samples = {name: [] for name in ["cold", "warm"] + [name for name, _ in interactions]}
+    api_calls = {name: [] for name in samples}
+    errors = {}
+
+    for i in range(repeat):
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        fake_sheets.GRID_EDITS.clear()
+
+        at = AppTest.from_file(str(REPO_DIR / script), default_timeout=timeout)
+        for section, values in FAKE_SECRETS.items():
+            at.secrets[section] = values
+        at.session_state["authenticated"] = True
+        at.session_state["role"] = "write"
+
+        steps = [("cold", None), ("warm", None)] + interactions
+        for name, interact in steps:
+            if interact is not None:
+                interact(at, i)
+            calls_before = gsheets_metrics.quota_usage()["total_calls"]
+            elapsed_ms, step_errors = timed_run(at)
+            samples[name].append(round(elapsed_ms, 1))
+            api_calls[name].append(gsheets_metrics.quota_usage()["total_calls"] - calls_before)
+            if step_errors:
+                errors.setdefault(name, step_errors[:3])
+
+    results = {
+        name: {
+            "median_ms": round(statistics.median(values), 1),
+            "min_ms": round(min(values), 1),
+            "samples_ms": values,
+            "api_calls": statistics.median(api_calls[name]),
+        }
+        for name, values in samples.items()
+    }
+    if errors:
+        results["errors"] = errors
+    return results
+
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "*.py"], cwd=REPO_DIR).returncode != 0
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cold / warm reruns and interactions of every app page.")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES), help="pages to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per page (default 3)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a single run counts as hung")
+    parser.add_argument("--output", default=None, help="JSON file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    # the app reads its workbooks relative to the repo root
+    os.chdir(REPO_DIR)
+    transform = pd.read_excel("transform_data.xlsx", usecols=["name", "year"])
+    countries = sorted(pd.read_excel("index_country.xlsx")["name"].dropna().unique())
+    fake_sheets.install(countries, sorted(transform["year"].unique().tolist()))
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "pandas": pd.__version__,
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpu",
+            "repeat": args.repeat,
+        },
+        "pages": {},
+    }
+
+    for page in args.pages:
+        script, interactions = PAGES[page]
+        print(f"⏳ {page}: {script}", flush=True)
+        report["pages"][page] = run_page(script, interactions, args.repeat, args.timeout)
+        for name, result in report["pages"][page].items():
+            if name != "errors":
+                print(f"   {name:<15} {result['median_ms']:>9.1f} ms (min {result['min_ms']:.1f}), {result['api_calls']:g} API calls")
+        for name, messages in report["pages"][page].get("errors", {}).items():
+            print(f"   ⚠️ {name}: {messages[0]}")
+
+    output = Path(args.output) if args.output else REPO_DIR / "benchmarks" / "results" / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"✅ Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+# Formatted Excel exports for the main rating page (main 11 factor table + supplementary constituent table)
+# These used to live inside Sovereign_Credit_Rating_Model.py and ran on every rerun.
+# Now the page only calls them when someone actually clicks an export button (and caches the result),
+# and the batch scripts can import them too.
+
+from io import BytesIO
+from weakref import WeakKeyDictionary
+
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.formatting.rule import ColorScaleRule
+
+## Shared style building blocks. Created once at import, re-used by every cell and every workbook.
+
+dark_blue   = PatternFill("solid", fgColor="FF1A3B73")
+gray_fill   = PatternFill("solid", fgColor="FFF2F2F2")
+light_blue  = PatternFill("solid", fgColor="FFB6CEE4")
+gray_e9     = PatternFill("solid", fgColor="FFE9E9EB")
+tint_da     = PatternFill("solid", fgColor="FFDAEEF3")
+bold_font   = Font(bold=True)
+bold_white_font = Font(bold=True, color="FFFFFFFF")  # bold + white-text
+blue_font   = Font(color="FF0000FF")
+bold_blue_font = Font(color="FF0000FF", bold=True)
+maroon_font = Font(color="FFB21740")
+left_align  = Alignment(horizontal="left")
+right_align = Alignment(horizontal="right")
+top_align   = Alignment(vertical="top")
+wrap_top_left = Alignment(wrapText=True, vertical="top", horizontal="left")
+thin_side   = Side(style="thin")
+no_side     = Side(style=None)
+
+_borders = {}
+
+# workbook -> {style combination: named style name}. weak so finished workbooks can be garbage collected
+_named_styles = WeakKeyDictionary()
+
+def make_border(top=False, bottom=False, left=False, right=False):
+    # one Border object per combination of sides, shared by every cell that needs it
+    key = (top, bottom, left, right)
+    if key not in _borders:
+        _borders[key] = Border(
+            top    = thin_side if top    else no_side,
+            bottom = thin_side if bottom else no_side,
+            left   = thin_side if left   else no_side,
+            right  = thin_side if right  else no_side,
+        )
+    return _borders[key]
+
+
+class CellStyles:
+    """
+    Collects the font / fill / border / alignment / number format each cell should end up with,
+    then writes every distinct combination to the workbook once as a NamedStyle.
+
+    Works like setting cell.font / cell.fill directly (later calls win), except nothing touches
+    the cells until apply(). So a 30 row table ends up with a handful of named styles
+    instead of hundreds of per-cell style records. Sheets in the same workbook (the rating book)
+    share one set of named styles.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.specs = {}
+
+    def set(self, row, column, **attrs):
+        self.specs.setdefault((row, column), {}).update(attrs)
+
+    def apply(self):
+        wb = self.ws.parent
+        named = _named_styles.setdefault(wb, {})
+        for (row, column), spec in self.specs.items():
+            key = (
+                spec.get("font", DEFAULT_FONT),
+                spec.get("fill", PatternFill()),
+                spec.get("border", Border()),
+                spec.get("alignment", Alignment()),
+                spec.get("number_format", "General"),
+            )
+            if key not in named:
+                style = NamedStyle(
+                    name=f"LS {len(named) + 1}",
+                    font=key[0], fill=key[1], border=key[2], alignment=key[3], number_format=key[4],
+                )
+                wb.add_named_style(style)
+                named[key] = style.name
+            self.ws.cell(row=row, column=column).style = named[key]
+
+
+def _to_bytes(wb):
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def generate_custom_export(df, selected_name, selected_year) -> bytes:
+    """Main credit rating table (11 factor model) -> formatted .xlsx bytes."""
+    wb = Workbook()
+    write_custom_export(wb.active, df, selected_name, selected_year)
+    return _to_bytes(wb)
+
+
+def write_custom_export(ws, df, selected_name, selected_year):
+    """Writes the formatted main credit rating table onto an (empty) worksheet."""
+    styles = CellStyles(ws)
+
+    # 1) Insert 5 blank rows at the top
+    ws.insert_rows(idx=1, amount=5)
+
+    # 2) Populate A1/A2/A3/A4
+    ws["A1"] = "Country"
+    ws["A2"] = selected_name
+    ws["A3"] = "Year"
+    ws["A4"] = selected_year
+
+    # 3) Write DataFrame header at row 6, data from row 7 onward
+    header_row = 6
+    for col_idx, col_name in enumerate(df.columns, start=1):
+        ws.cell(row=header_row, column=col_idx, value=col_name)
+    for r, row in enumerate(df.itertuples(index=False), start=header_row+1):
+        for c, val in enumerate(row, start=1):
+            ws.cell(row=r, column=c, value=val)
+
+    ncols      = df.shape[1]
+    data_start = header_row + 1
+    data_end   = data_start + len(df) - 1
+
+    # 4) Style A2/A4: gray fill, bold font
+    for r in (2, 4):
+        styles.set(r, 1, fill=gray_fill, font=bold_font, alignment=left_align)
+
+    # 5) Bold entire Column A and auto-fit its width
+    max_w = 0
+    for r in range(1, data_end + 1):
+        styles.set(r, 1, font=bold_font)
+        length = len(str(ws.cell(row=r, column=1).value or ""))
+        if length > max_w:
+            max_w = length
+    ws.column_dimensions["A"].width = max_w + 2
+
+    # 6) Style A1/A3: dark blue fill, white font
+    for r in (1, 3):
+        styles.set(r, 1, fill=dark_blue, font=bold_white_font, alignment=left_align)  # ensure white font and bolded
+
+    # 7) Header row (A6:F6): dark blue fill, bold+white text, borders
+    for col in range(1, ncols + 1):
+        styles.set(header_row, col, fill=dark_blue, font=bold_white_font, border=make_border(
+            top   = True,
+            left  = (col == 1),
+            right = (col == ncols)
+        ))
+
+    # 8) Number formats & zero suppression
+    for r in range(data_start, data_end + 1):
+        for col_idx in (2, 3, 4):
+            if isinstance(ws.cell(row=r, column=col_idx).value, (int, float)):
+                styles.set(r, col_idx, number_format="0.00")
+        e = ws.cell(row=r, column=5)
+        if isinstance(e.value, (int, float)):
+            if e.value == 0:
+                e.value = None
+            else:
+                styles.set(r, 5, number_format="0.00")
+
+    # 9) Blue font in E7:F22 (or up to data_end)
+    for r in range(data_start, min(data_end, 22) + 1):
+        styles.set(r, 5, font=blue_font)
+        styles.set(r, 6, font=blue_font)
+
+    # 10) Shade specific rows A8:F8, A12:F12, A16:F16, A19:F19, A23:F23
+    for r in (8, 12, 16, 19, 23):
+        for c in range(1, ncols + 1):
+            styles.set(r, c, fill=light_blue)
+
+    # 11) Fill A7 with light gray
+    styles.set(7, 1, fill=gray_e9)
+
+    # 12) Fill A9–A11, A13–A15, A17–A18, A20–A22 with tint_da
+    for start, end in ((9, 11), (13, 15), (17, 18), (20, 22)):
+        for r in range(start, end + 1):
+            styles.set(r, 1, fill=tint_da)
+
+    # 13) Bold fonts in D24, D25, E24, F24, F25
+    for (r, c) in ((24, 4), (25, 4), (24, 5), (24, 6), (25, 6)):
+        styles.set(r, c, font=bold_font)
+
+    # 14) Fill A24:F25 with gray_fill
+    for r in (24, 25):
+        for c in range(1, ncols + 1):
+            styles.set(r, c, fill=gray_fill)
+
+    # 15) Fixed widths for columns A–F
+    # Define desired widths in Excel’s column-width units
+    fixed_widths = {
+    1: 25.0,  # A
+    2: 10,   # B
+    3: 12,  # C
+    4: 14.5,  # D
+    5: 11.5,     # E
+    6: 57      # F
+    }
+
+    for col_idx, width in fixed_widths.items():
+        letter = get_column_letter(col_idx)
+        ws.column_dimensions[letter].width = width
+
+    # 16) Full outside border from A1 to F25
+    for r in range(1, 26):
+        for c in range(1, ncols + 1):
+            if r in (1, 25) or c in (1, ncols):
+                styles.set(r, c, border=make_border(
+                    top    = (r == 1),
+                    bottom = (r == 25),
+                    left   = (c == 1),
+                    right  = (c == ncols)
+                ))
+    # 16b) Wrap text and align cells in case user writes long analyst adjustment
+    # Wrap, top-align, left-align F7:F22
+    for r in range(7, 23):
+        styles.set(r, 6, alignment=wrap_top_left)
+    # Top-align A7:E22
+    for col_idx in range(1, 6):
+        for r in range(7, 23):
+            styles.set(r, col_idx, alignment=top_align)
+
+    # 17) Write the collected styles
+    styles.apply()
+
+
+def generate_custom_export_long(df, selected_name, selected_year) -> bytes:
+    """Supplementary credit rating table (constituent variables) -> formatted .xlsx bytes."""
+    wb = Workbook()
+    write_custom_export_long(wb.active, df, selected_name, selected_year)
+    return _to_bytes(wb)
+
+
+def write_custom_export_long(ws, df, selected_name, selected_year):
+    """Writes the formatted supplementary credit rating table onto an (empty) worksheet."""
+    styles = CellStyles(ws)
+
+    # 1) Insert 5 blank rows
+    ws.insert_rows(idx=1, amount=5)
+
+    # 2) Populate A1–A4
+    ws["A1"] = "Country"
+    ws["A2"] = selected_name
+    ws["A3"] = "Year"
+    ws["A4"] = selected_year
+
+    # 3) Write headers at row 6, data from row 7
+    header_row = 6
+    for ci, col in enumerate(df.columns, start=1):
+        ws.cell(row=header_row, column=ci, value=col)
+    data_start = header_row + 1
+    for ri, row in enumerate(df.itertuples(index=False), start=data_start):
+        for ci, v in enumerate(row, start=1):
+            ws.cell(row=ri, column=ci, value=v)
+    data_end = data_start + len(df) - 1
+
+    # 4) Bold all col A
+    for r in range(1, data_end + 1):
+        styles.set(r, 1, font=bold_font)
+
+    # 5) Shade A1/A3 dark blue + white font
+    for r in (1, 3):
+        styles.set(r, 1, fill=dark_blue, font=bold_white_font)
+
+    # 6) Shade A2/A4 gray + bold
+    for r in (2, 4):
+        styles.set(r, 1, fill=gray_fill, font=bold_font, alignment=left_align)
+
+    # 7) Bold & shade header row A6:F6
+    for c in range(1, 7):
+        styles.set(header_row, c, font=bold_white_font, fill=dark_blue)
+    # 8) Shade A7 gray
+    styles.set(7, 1, fill=gray_fill)
+
+    # 9) Shade A9–A11, A13–A23, A25–A29, A31–A35 with tint_da
+    for start,end in ((9,11),(13,23),(25,29),(31,35)):
+        for r in range(start, end+1):
+            styles.set(r, 1, fill=tint_da)
+
+    # 10) Shade rows 8,12,24,30 (A–F) light_blue
+    for r in (8,12,24,30):
+        for c in range(1,7):
+            styles.set(r, c, fill=light_blue)
+
+    # 11) Bold B7, B9,B10,B11,B13,B14,B17,B25,B29,B31,B32,B35
+    for r in (7,9,10,11,13,14,17,25,29,31,32,35):
+        styles.set(r, 2, font=bold_font)
+
+    # 12) Maroon font in B15,B16,B18–B23,B26–B28,B33–B34
+    for block in [(15,16),(18,23),(26,28),(33,34)]:
+        for r in range(block[0], block[1]+1):
+            styles.set(r, 2, font=maroon_font)
+
+    # 13) Fill C7:D7 with "-" and align C7:E7 right
+    for c in range(3,4):
+        ws.cell(row=7, column=c, value="-")
+    for c in (3,4,5):
+        styles.set(5, c, alignment=right_align)
+
+    # 14) Column C formatting:
+    fmt_map = {
+        9: ("#,##0", None),    # C9 no decimals, thousand comma
+        10: ("0.0", None),
+        11: ("0.0", None),
+        13: ("0.0", None),
+    }
+    for r, (nf, _) in fmt_map.items():
+        styles.set(r, 3, number_format=nf)
+    # C18–C23 one decimal
+    for r in range(18,24):
+        styles.set(r, 3, number_format="0.0")
+    # C26–C29 one decimal
+    for r in range(26,30):
+        styles.set(r, 3, number_format="0.0")
+    # C31,C33,C34 one decimal
+    for r in (31,33,34):
+        styles.set(r, 3, number_format="0.0")
+    # C14,C17,C25,C32 replace with "-" and align right
+    for r in (14,17,25,32):
+        ws.cell(row=r, column=3, value="-")
+        styles.set(r, 3, alignment=right_align)
+    # C15,C16,C35 no decimal
+    for r in (15,16,35):
+        if isinstance(ws.cell(row=r, column=3).value, (int, float)):
+            styles.set(r, 3, number_format="0")
+
+    # 15) Column D 2 decimals for D9–D35
+    for r in range(9,36):
+        if isinstance(ws.cell(row=r, column=4).value, (int,float)):
+            styles.set(r, 4, number_format="0.00")
+
+    # 16) Column E formatting & zero suppression
+    for r in range(7,36):
+        c = ws.cell(row=r, column=5)
+        if isinstance(c.value, (int,float)):
+            if c.value == 0:
+                c.value = None
+            else:
+                styles.set(r, 5, number_format="0.00")
+    # bold+blue E9–E11, E13–E14, E17, E25,E29,E31,E32,E35
+    for r in (9,10,11,13,14,17,25,29,31,32,35):
+        styles.set(r, 5, font=bold_blue_font)
+    # maroon E15,E16,E18–E23,E26–E28,E33–E34
+    for block in [(15,16),(18,23),(26,28),(33,34)]:
+        for r in range(block[0], block[1]+1):
+            styles.set(r, 5, font=maroon_font)
+
+    # 17) Maroon font in F15,F16,F18–F23,F26–F28,F33–F34
+    for block in [(15,16),(18,23),(26,28),(33,34)]:
+        for r in range(block[0], block[1]+1):
+            styles.set(r, 6, font=maroon_font)
+    # blue, non-bold font in F9–F11, F13–F14, F17, F25, F29, F31, F32, F35
+    for r in (9,10,11,13,14,17,25,29,31,32,35):
+        styles.set(r, 6, font=blue_font)
+
+    # 18) Column widths A–F
+    widths = {"A":25,"B":52,"C":10,"D":12,"E":11.5,"F":57}
+    for col, w in widths.items():
+        ws.column_dimensions[col].width = w
+
+    # 19) Outside border A1:F35
+    for r in range(1,36):
+        for c in range(1,7):
+            if r in (1,35) or c in (1,6):
+                styles.set(r, c, border=make_border(
+                    top    = (r==1),
+                    bottom = (r==35),
+                    left   = (c==1),
+                    right  = (c==6)
+                ))
+    # 19b) Wrap text and align cells in case user writes long analyst adjustment
+    # Wrap text, top-align & left-align F7:F35
+    for r in range(7, 36):
+        styles.set(r, 6, alignment=wrap_top_left)  # F column
+    # Top-align A7:E35 (all other cells in the grid)
+    for col_idx in range(1, 6):  # A–E
+        for r in range(7, 36):
+            styles.set(r, col_idx, alignment=top_align)
+
+    # 20) Write the collected styles
+    styles.apply()
+
+
+## LS rating list (generate_LS_rating_list.py): one row per country, one sheet.
+## Written with a write-only workbook, so rows stream straight to the file and each column's style is built once
+## instead of walking every cell afterwards. All ranges come from the length of the data, not a fixed row count.
+
+ls_list_header_fill = light_blue
+ls_list_border = Border(*(Side(style="thin", color="000000"),) * 4)  # left, right, top, bottom
+ls_list_two_dp = ["public_rating", "model_rating", "Adjustment", "LS_rating", "distance_lower_bound"]
+ls_list_autofit = ["name", "public_rating", "model_rating", "Adjustment", "distance_lower_bound", "Analyst"]
+ls_list_dot_col = "ERV_Dot"
+
+
+def write_LS_rating_list(df, output_path, sheet_name="Ratings"):
+    """Writes the LS rating list to output_path with header shading, borders, number formats and an autofilter."""
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    columns = list(df.columns)
+    n_rows = len(df)
+    last_col = get_column_letter(len(columns))
+
+    # column widths have to be set before the first row is written
+    for ci, col in enumerate(columns, start=1):
+        letter = get_column_letter(ci)
+        if col in ls_list_autofit:
+            # widest value in the column (blank cells count as 0) + 2, same as autofitting the written sheet
+            lengths = [0 if _is_blank(v) else len(str(v)) for v in df[col]]
+            ws.column_dimensions[letter].width = max([len(str(col))] + lengths) + 2
+        elif col == ls_list_dot_col:
+            ws.column_dimensions[letter].width = 26
+
+    # one style per column. the first column is bold, the rating columns 2dp, the dot column monospaced
+    col_styles = []
+    for ci, col in enumerate(columns, start=1):
+        style = {"border": ls_list_border}
+        if ci == 1:
+            style["font"] = bold_font
+        if col in ls_list_two_dp:
+            style["number_format"] = "0.00"
+        if col == ls_list_dot_col:
+            style["font"] = Font(name="Consolas")
+            style["alignment"] = left_align
+        col_styles.append(style)
+
+    def make_cell(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        for attr, v in style.items():
+            setattr(cell, attr, v)
+        return cell
+
+    ws.append([make_cell(col, {"fill": ls_list_header_fill, "border": ls_list_border}) for col in columns])
+    for row in df.itertuples(index=False):
+        ws.append([make_cell(None if _is_blank(v) else v, style) for v, style in zip(row, col_styles)])
+
+    ws.auto_filter.ref = f"A1:{last_col}{n_rows + 1}"
+    wb.save(output_path)
+
+
+def _is_blank(value):
+    # NaN / None -> blank cell, like DataFrame.to_excel
+    return value is None or (isinstance(value, float) and value != value)
+
+
+## Rating gap matrix export (Peer Comparison page): the model rating gap for every pair in a group
+## plus each country's factor notches, so any pair's breakdown is one row minus another.
+## Write-only like the LS rating list: an "ALL" bucket is ~140 x 140 cells.
+
+gap_header_fill = dark_blue
+gap_scale = ColorScaleRule(
+    start_type="min", start_color="FFF8696B",
+    mid_type="num", mid_value=0, mid_color="FFFFFFFF",
+    end_type="max", end_color="FF63BE7B",
+)
+
+
+def generate_gap_matrix_export(gap_df, notches_df, selected_year, group_label) -> bytes:
+    """
+    gap_df: (countries x countries) model rating gaps, row minus column.
+    notches_df: factor notches + ratings per country (rating_gaps.factor_notches).
+    -> formatted .xlsx bytes with one sheet each.
+    """
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+
+    def make_cell(ws, value, **style):
+        cell = WriteOnlyCell(ws, value=None if _is_blank(value) else value)
+        for attr, v in style.items():
+            setattr(cell, attr, v)
+        return cell
+
+    def write_table(ws, df, title, color_scale=False):
+        n_rows, n_cols = df.shape
+        last_col = get_column_letter(n_cols + 1)
+
+        ws.column_dimensions["A"].width = max([len(str(v)) for v in df.index] + [12]) + 2
+        for ci in range(2, n_cols + 2):
+            ws.column_dimensions[get_column_letter(ci)].width = 12
+        ws.freeze_panes = "B3"
+
+        ws.append([make_cell(ws, title, font=bold_font)])
+        ws.append([make_cell(ws, None)] + [
+            make_cell(ws, col, fill=gap_header_fill, font=bold_white_font, alignment=wrap_top_left) for col in df.columns
+        ])
+        for name, row in zip(df.index, df.to_numpy()):
+            ws.append([make_cell(ws, name, font=bold_font)] + [make_cell(ws, v, number_format="0.00") for v in row])
+
+        if color_scale and n_rows:
+            ws.conditional_formatting.add(f"B3:{last_col}{n_rows + 2}", gap_scale)
+
+    write_table(
+        wb.create_sheet("Model rating gaps"), gap_df,
+        f"{selected_year} model rating gap in notches (row country minus column country), {group_label}",
+        color_scale=True,
+    )
+    write_table(
+        wb.create_sheet("Factor notches"), notches_df,
+        f"{selected_year} factor contributions in notches, {group_label}. A pair's gap = difference of their rows",
+    )
+    return _to_bytes(wb)
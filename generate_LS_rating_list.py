@@ -1,19 +1,29 @@
+import argparse
 import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
 from gsheets_utils import load_override_from_gsheet, save_override_to_gsheet
+from gsheets_metrics import instrument_client, report
 import os #--> helps to save user edits on to pc
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
+from export_utils import write_LS_rating_list
+from rating_format import letter_lookup, ratings_to_letters, erv_distance, erv_dot_lines
 
 import streamlit as st
 import time
+import json
+import requests
 
 ## set the references year that you want
 choose_year = 2025
 
+## command line options
+## python generate_LS_rating_list.py           -> resumes from a recent checkpoint if a previous run was cut short
+## python generate_LS_rating_list.py --fresh   -> ignores any checkpoint and reads every country's overrides again
+parser = argparse.ArgumentParser(description="Build the LS rating list from the model ratings and the analyst overrides.")
+parser.add_argument("--fresh", action="store_true", help="ignore any checkpoint and read every country again")
+parser.add_argument("--max-age", type=float, default=6, help="hours a checkpoint can be resumed from (default 6)")
+args = parser.parse_args()
+
 ## get the relevant excel files in. Transform into df and dictionary where relevant
 
 # get the name, rating, and predicted rating into a df
@@ -23,10 +33,8 @@ df_rating = df_transform.loc[
     ['name', 'rating', 'predicted_rating']
 ].reset_index(drop=True)
 
-# get the ratings scale into an excel, and then into a dictonary
+# get the ratings scale into an excel (turned into a letter lookup array further down)
 rating_index = pd.read_excel("index_rating_scale.xlsx")
-#zip pairs the two columns row by row to help make into a dict
-rating_dict = dict(zip(rating_index['Numeric'], rating_index['Credit Rating'])) 
 
 # Extract list of unique countries
 countries = df_rating['name'].unique().tolist()
@@ -38,46 +46,136 @@ def init_gsheets_client():
     creds_info = dict(st.secrets["gcp_service_account"])
     creds_info["private_key"] = creds_info["private_key"].replace("\\n", "\n")
     creds = Credentials.from_service_account_info(creds_info, scopes=scope)
-    return gspread.authorize(creds)
+    return instrument_client(gspread.authorize(creds))  # counts every Sheets API call (gsheets_metrics.py)
 
 client = init_gsheets_client()
 
-sheet_short = client.open("analyst_overrides_short")
-
 ## pull out rating adjustments into a df
 
-adjustment_records = []
+# the fetch loop below checkpoints every country it finishes into a local json file
+# if a quota error / network blip kills the run, rerunning the script picks up where it stopped
+# transient errors (429s, 5xx, dropped connections) are retried with exponential backoff
+# the checkpoint remembers when its first country was read. analysts keep editing overrides, so one older than
+# --max-age hours (e.g. left over from a run that crashed days ago) is ignored instead of republishing stale numbers
+checkpoint_path = f"LS_rating_checkpoint_{choose_year}.json"
+max_attempts = 5   # tries per country before we give up on it for this run
+base_delay = 2     # seconds. doubles after every failed attempt (2, 4, 8, 16...)
+
+def load_checkpoint(path, max_age_hours):
+    # returns (started, done): when the checkpoint's oldest entry was read, and the countries done so far
+    now = time.time()
+    if not os.path.exists(path):
+        return now, {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    started = checkpoint.get("started")
+    if not isinstance(started, (int, float)) or "countries" not in checkpoint:
+        print(f"🗑️ Ignoring {path}: no start time in it (written by an older version of this script), starting fresh")
+        return now, {}
+    age_hours = (now - started) / 3600
+    if age_hours > max_age_hours:
+        print(f"🗑️ Ignoring {path}: started {age_hours:.1f}h ago, over the {max_age_hours:g}h limit. starting fresh")
+        return now, {}
+    return started, checkpoint["countries"]
+
+def save_checkpoint(path, started, done):
+    # write to a temp file first then swap it in, so a crash mid-write can't corrupt the checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"year": choose_year, "started": started, "countries": done}, f, indent=2)
+    os.replace(tmp_path, path)
+
+def is_transient(err):
+    # 429 (quota) and 5xx from google are worth retrying. other api errors (403, 404...) are not
+    if isinstance(err, gspread.exceptions.APIError):
+        status = getattr(err.response, "status_code", None)
+        return status is None or status == 429 or status >= 500
+    return isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def with_retry(fn, label):
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn()
+        except Exception as err:
+            if not is_transient(err) or attempt == max_attempts:
+                raise
+            delay = base_delay * 2 ** (attempt - 1)
+            print(f"\n🔁 {label}: {err!r} (attempt {attempt}/{max_attempts}), retrying in {delay}s…", end="", flush=True)
+            time.sleep(delay)
+
+def read_total_adjustment(country):
+    ws = sheet_short.worksheet(country)
+    records = ws.get_all_records()
+    df_sheet = pd.DataFrame(records)
+
+    # ── DROP THE PREDICTED/FINAL ROWS ── 
+    if "short_name" in df_sheet.columns:
+        df_sheet = df_sheet.loc[
+            ~df_sheet["short_name"].isin(["predicted_rating", "final_rating"])
+        ]
+
+    # If sheet is empty or no 'year' column, assume zero adjustment
+    if 'year' not in df_sheet.columns or df_sheet.empty:
+        return 0.0
+    return float(
+        df_sheet.loc[df_sheet['year'] == choose_year, 'Adjustment']
+        .sum()
+    )
+
+sheet_short = with_retry(lambda: client.open("analyst_overrides_short"), "opening analyst_overrides_short")
+
+# done maps country -> {"Adjustment": float, "status": "fetched" | "defaulted"}
+# failed countries are never written to the checkpoint, so the next run tries them again
+if args.fresh:
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    started, done = time.time(), {}
+else:
+    started, done = load_checkpoint(checkpoint_path, args.max_age)
+if done:
+    started_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(started))
+    print(f"♻️ Resuming from {checkpoint_path} (started {started_at}): {len(done)} of {len(countries)} countries already done")
+
+failed = {}
 
 for country in countries:
+    if country in done:
+        continue
     try:
         print(f"⏳ Reading overrides for {country}…", end="", flush=True)
-        ws = sheet_short.worksheet(country)
-        records = ws.get_all_records()
+        total_adj = with_retry(lambda: read_total_adjustment(country), country)
         print(" done")                # shows you it finished
-        time.sleep(1)
-        df_sheet = pd.DataFrame(records)
-        
-        # ── DROP THE PREDICTED/FINAL ROWS ── 
-        if "short_name" in df_sheet.columns:
-            df_sheet = df_sheet.loc[
-                ~df_sheet["short_name"].isin(["predicted_rating", "final_rating"])
-            ]
-
-        # If sheet is empty or no 'year' column, assume zero adjustment
-        if 'year' not in df_sheet.columns or df_sheet.empty:
-            total_adj = 0.0
-        else:
-            total_adj = (
-                df_sheet.loc[df_sheet['year'] == choose_year, 'Adjustment']
-                .sum()
-            )
-        adjustment_records.append({'name': country, 'Adjustment': total_adj})
+        done[country] = {"Adjustment": total_adj, "status": "fetched"}
     except gspread.exceptions.WorksheetNotFound:
         # If the tab is missing, treat adjustment as zero
-        print(f"⚠️ {country} tab not found; assuming 0 adjustment")
-        adjustment_records.append({'name': country, 'Adjustment': 0.0})
+        print(f"\n⚠️ {country} tab not found; assuming 0 adjustment")
+        done[country] = {"Adjustment": 0.0, "status": "defaulted"}
+    except Exception as err:
+        print(f"\n❌ {country} failed: {err!r}")
+        failed[country] = repr(err)
+        continue
+    save_checkpoint(checkpoint_path, started, done)
     time.sleep(1) # throttle before next iteration
 
+## reconcile what we got before publishing anything
+
+fetched = [c for c in countries if done.get(c, {}).get("status") == "fetched"]
+defaulted = [c for c in countries if done.get(c, {}).get("status") == "defaulted"]
+
+print("\n📋 Override fetch reconciliation")
+print(f"   ✅ fetched:   {len(fetched)}")
+print(f"   ⚠️ defaulted: {len(defaulted)} (tab missing, 0 adjustment)" + (f" -> {', '.join(defaulted)}" if defaulted else ""))
+print(f"   ❌ failed:    {len(failed)}" + (f" -> {', '.join(failed)}" if failed else ""))
+
+# API calls made, per operation, and how close we came to the per-minute quota (429s are what usually fail a country)
+print(report())
+
+# never publish a list with silently missing overrides. rerun the script to retry just the failed countries
+if failed:
+    raise SystemExit(f"Stopping before export. {len(failed)} countries failed; progress saved to {checkpoint_path}")
+
+adjustment_records = [{'name': c, 'Adjustment': done[c]["Adjustment"]} for c in countries]
+
 df_adjustment = pd.DataFrame(adjustment_records)
 
 ## Merge main ratings df and the adjustment df
@@ -101,33 +199,18 @@ df_LS_rating.rename(columns={
 }, inplace=True)
 
 #map LS_ratings to letter
-
-def rating_to_letter(x):
-    key = int(round(x))
-    return rating_dict.get(key, "Unknown")
-
-df_LS_rating["LS_letter"] = df_LS_rating["LS_rating"].apply(rating_to_letter)
+#one lookup array for the 1-22 scale, indexed by the rounded rating for the whole column at once (see rating_format.py)
+rating_letters = letter_lookup(rating_index)
+df_LS_rating["LS_letter"] = ratings_to_letters(df_LS_rating["LS_rating"], rating_letters)
 
 #create dot columns to help shift within ERV
 
-df_LS_rating["distance_lower_bound"] = df_LS_rating["LS_rating"] - (df_LS_rating["LS_rating"].round()-0.5) 
-df_LS_rating.loc[df_LS_rating["LS_rating"] <= 1,  "distance_lower_bound"] = 0.0 #done to handle edge cases
-df_LS_rating.loc[df_LS_rating["LS_rating"] >= 22, "distance_lower_bound"] = 1.0 #done to handle edge cases
-
-# 1) helper to build a 21‑char line, dot moves from right (0.0) to left (1.0)
-def build_dot_line(val, width=21):
-    # compute position: 0-->20, 1-->0
-    pos = round((1 - val) * (width - 1))
-    # build blank line + dot
-    line = " " * pos + "⚫" + " " * (width - 1 - pos)
-    return line
-
-# 2) apply to make a new column
-df_LS_rating["ERV_Dot"] = (
-    df_LS_rating["distance_lower_bound"]
-    .round(2)                       # keep 2‑decimals if you like
-    .apply(build_dot_line)
-)
+#distance of the rating from the bottom of its notch (0 → 1). pinned at the edges of the scale
+df_LS_rating["distance_lower_bound"] = erv_distance(df_LS_rating["LS_rating"])
+
+#21-char line with the dot moving from right (0.0) to left (1.0). all 21 possible lines are prebuilt,
+#so each row just picks one by its (2 decimal) position
+df_LS_rating["ERV_Dot"] = erv_dot_lines(df_LS_rating["distance_lower_bound"])
 
 #import the coverage_list and merge into the main df
 df_coverage = pd.read_excel("coverage_list.xlsx")
@@ -140,61 +223,18 @@ df_LS_rating = pd.merge(
 
 
 ## export fhe file into excel for sharing
+## streams the rows into a write-only workbook with one style per column (see write_LS_rating_list in export_utils.py)
+## header shading, borders, 2dp formats and the autofilter all follow the number of countries, so nothing is hard-coded to 137
 output_path = "LS_rating.xlsx"
 
-with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-    # 1) write the raw data
-    df_LS_rating.to_excel(writer, index=False, sheet_name="Ratings")
-    
-    # 2) grab workbook & sheet
-    wb = writer.book
-    ws = writer.sheets["Ratings"]
-    
-    # 3) Auto‑fit widths on columns A, B, C, D, G and J
-    for col in ["A", "B", "C", "D", "G","J"]:
-        max_len = max(
-            len(str(cell.value)) if cell.value is not None else 0
-            for cell in ws[col]
-        )
-        ws.column_dimensions[col].width = max_len + 2
-    
-    # 3.1) Force monospaced font + left‑align for the ERV_Dot column (H)
-    for cell in ws["H"][1:]:   # skip header in row 1
-        cell.font      = Font(name="Consolas")
-        cell.alignment = Alignment(horizontal="left")
-    
-    # 3.2) force column H to width 26
-    ws.column_dimensions['H'].width = 26
-
-    # 4) Shade header row A1:J1 light‑blue
-    header_fill = PatternFill("solid", fgColor="FFB6CEE4")
-    for cell in ws[1]:
-        cell.fill = header_fill
-
-    # 5) Bold font for all cells A2:A138
-    bold = Font(bold=True)
-    for row in ws.iter_rows(min_row=2, max_row=138, min_col=1, max_col=1):
-        for cell in row:
-            cell.font = bold
-
-    # 6) 2‑decimal formatting for B2:B138, C2:C138, D2:D138, E2:E138, G2:G138
-    two_dp = "0.00"
-    for col in ["B", "C", "D", "E", "G"]:
-        for row in range(2, 139):
-            ws[f"{col}{row}"].number_format = two_dp
-
-    # 7) Apply thin border on every cell A1:J138
-    thin = Side(style="thin", color="000000")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-    for row in ws.iter_rows(min_row=1, max_row=138, min_col=1, max_col=10):
-        for cell in row:
-            cell.border = border
-
-    # 8) Turn on Excel’s AutoFilter for the block A1:J138
-    ws.auto_filter.ref = "A1:J138"
-
-# at this point writer.save() has been called
+write_LS_rating_list(df_LS_rating, output_path)
+
 print(f"Exported and formatted LS Ratings to {output_path}")
 
+# the run is complete, so drop the checkpoint. next run starts fresh from google sheets
+# (a run that had nothing left to fetch never wrote one)
+if os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+
 #df_LS_rating.to_excel(output_path, index = False, engine="openpyxl")
 #print(f"Exported LS Ratings to {output_path}")
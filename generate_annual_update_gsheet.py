@@ -4,6 +4,7 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
 import time
+from gsheets_metrics import instrument_client, report
 
 # Set up to connect to google sheets
 # note this is a simpler configuration as we are just hooking up form my pc to google sheets
@@ -11,7 +12,7 @@ import time
 
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 creds = ServiceAccountCredentials.from_json_keyfile_name("gcp_service_account.json", scope)
-client = gspread.authorize(creds)
+client = instrument_client(gspread.authorize(creds))  # counts every Sheets API call (gsheets_metrics.py)
 
 # --- Open your sheet (must be created manually and shared first) --- #
 
@@ -84,4 +85,7 @@ for worksheet in spreadsheet.worksheets():
     print(f"  -> Added {len(rows_to_append)} rows for {TARGET_YEAR}")
     time.sleep(0.5)
 
-print("Done.")
\ No newline at end of file
+print("Done.")
+
+# API calls made, per operation, and how close we came to the per-minute quota
+print(report())
@@ -4,6 +4,7 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
 import time
+from gsheets_metrics import instrument_client, report
 
 # Set up to connect to google sheets
 # note this is a simpler configuration as we are just hooking up form my pc to google sheets
@@ -11,7 +12,7 @@ import time
 
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 creds = ServiceAccountCredentials.from_json_keyfile_name("gcp_service_account.json", scope)
-client = gspread.authorize(creds)
+client = instrument_client(gspread.authorize(creds))  # counts every Sheets API call (gsheets_metrics.py)
 
 # Load list of countries
 # Adjust path and column name as needed
@@ -49,4 +50,7 @@ num_tabs = len(sheet.worksheets())
 
 print(f"\n📊 Summary:")
 print(f"🌍 Unique countries from list: {num_countries}")
-print(f"📄 Total tabs in Google Sheet: {num_tabs}")
\ No newline at end of file
+print(f"📄 Total tabs in Google Sheet: {num_tabs}")
+
+# API calls made, per operation, and how close we came to the per-minute quota
+print(report())
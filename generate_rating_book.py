@@ -0,0 +1,74 @@
+import argparse
+import time
+
+import pandas as pd
+import gspread
+from google.oauth2.service_account import Credentials
+import streamlit as st
+
+from gsheets_utils import load_overrides_batch
+from gsheets_metrics import instrument_client, report
+from rating_book import build_book_tables, build_rating_book
+
+## Builds the formatted main + supplementary rating tables for every country in coverage_list.xlsx in one go
+## (the same workbooks as the export buttons on the main page), instead of exporting country by country.
+##
+## usage: python generate_rating_book.py --year 2025                 -> LS_rating_book_2025.zip (one folder per country)
+##        python generate_rating_book.py --year 2025 --format xlsx   -> LS_rating_book_2025.xlsx (2 sheets per country)
+##
+## reads the google credentials from .streamlit/secrets.toml like generate_LS_rating_list.py
+
+def init_gsheets_client():
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds_info = dict(st.secrets["gcp_service_account"])
+    creds_info["private_key"] = creds_info["private_key"].replace("\\n", "\n")
+    creds = Credentials.from_service_account_info(creds_info, scopes=scope)
+    return instrument_client(gspread.authorize(creds))  # counts every Sheets API call (gsheets_metrics.py)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the rating tables for every covered country.")
+    parser.add_argument("--year", type=int, default=2025, help="reference year (default 2025)")
+    parser.add_argument("--format", choices=["zip", "xlsx"], default="zip", help="zip of workbooks or one multi-sheet workbook")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for the zip format (default: all cores)")
+    parser.add_argument("--output", default=None, help="output file (default LS_rating_book_<year>.<format>)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    ## load the model data
+    df_transform = pd.read_excel("transform_data.xlsx")
+    df_raw = pd.read_excel("raw_data.xlsx")
+    coeff_index = pd.read_excel("coefficients_2024_WGI_new.xlsx")
+    rating_index = pd.read_excel("index_rating_scale.xlsx")
+    variable_index = pd.read_excel("index_variable_name.xlsx")
+    rating_dict = dict(zip(rating_index['Numeric'], rating_index['Credit Rating']))
+    countries = pd.read_excel("coverage_list.xlsx")["name"].tolist()
+
+    ## pull every country's overrides for the year with batched reads (a few calls per spreadsheet)
+    client = init_gsheets_client()
+    print("⏳ Reading analyst overrides…", flush=True)
+    overrides_short = load_overrides_batch(client.open("analyst_overrides_short"), countries, args.year)
+    overrides_long = load_overrides_batch(client.open("analyst_overrides_long"), countries, args.year)
+    print(report())
+
+    ## build the tables and render the book
+    tables, skipped = build_book_tables(
+        args.year, countries, df_transform, df_raw, coeff_index, variable_index, rating_dict,
+        overrides_short, overrides_long,
+    )
+    for name in skipped:
+        print(f"⚠️ No {args.year} data for {name}; left out of the book")
+
+    print(f"⏳ Rendering {len(tables)} countries…", flush=True)
+    book = build_rating_book(tables, args.year, fmt=args.format, workers=args.workers)
+
+    output = args.output or f"LS_rating_book_{args.year}.{args.format}"
+    with open(output, "wb") as f:
+        f.write(book)
+    print(f"✅ Saved {output} ({len(tables)} countries) in {time.perf_counter() - start:.1f}s")
+
+
+# the guard matters: the worker processes re-import this file and must not rerun the export
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,88 @@
+# Shared plumbing for the functions below:
+# one pooled requests.Session (keeps the TLS connection to GitHub alive between calls)
+# and a small ETag cache so repeat downloads of an unchanged file cost a cheap 304
+# Streamlit runs every session's script in its own thread, so creating the session and every cache read / write
+# happen under _lock. (The session's connection pool is itself thread safe, and we don't use its cookies.)
+# The cache is an LRU capped at _ETAG_CACHE_SIZE files, one DataFrame each.
+
+import threading
+from collections import OrderedDict
+
+_ETAG_CACHE_SIZE = 128
+
+_lock = threading.Lock()
+_session = None
+_etag_cache = OrderedDict()  # (repo, path, ref) -> (etag, DataFrame), least recently used first
+
+def _get_session():
+    import requests
+
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+
+def _etag_cache_get(key):
+    with _lock:
+        cached = _etag_cache.get(key)
+        if cached:
+            _etag_cache.move_to_end(key)
+        return cached
+
+
+def _etag_cache_put(key, value):
+    with _lock:
+        _etag_cache[key] = value
+        _etag_cache.move_to_end(key)
+        while len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+
+
+def _etag_cache_drop(key):
+    with _lock:
+        _etag_cache.pop(key, None)
+
+
 # Goal of this function:
 # To download a CSV file from your GitHub repo, and load it into a pandas DataFrame — or return a blank DataFrame if the file doesn't exist.
 
-def load_df_from_github(repo, path, token):
-    import requests
+def load_df_from_github(repo, path, token, ref="main", api_url="https://api.github.com"):
     from io import StringIO
     import pandas as pd
-    import time
+    import requests
 
-    # Add a fake query param to bust HTTP caching
-    timestamp = int(time.time())
-    url = f"https://raw.githubusercontent.com/{repo}/main/{path}?nocache={timestamp}"
-    
-    headers = {"Authorization": f"token {token}"}
+    url = f"{api_url}/repos/{repo}/contents/{path}"
+
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.raw+json"
+    }
 
-    response = requests.get(url, headers=headers)
+    cache_key = (repo, path, ref)
+    cached = _etag_cache_get(cache_key)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+
+    response = _get_session().get(url, headers=headers, params={"ref": ref})
+    if response.status_code == 304 and cached:
+        return cached[1].copy()
     if response.status_code == 200:
-        return pd.read_csv(StringIO(response.text))
-    else:
+        df = pd.read_csv(StringIO(response.text))
+        etag = response.headers.get("ETag")
+        if etag:
+            _etag_cache_put(cache_key, (etag, df))
+        return df.copy()
+    if response.status_code == 404:
+        _etag_cache_drop(cache_key)
         return pd.DataFrame(columns=["short_name", "Adjustment", "Analyst Comment"])
 
-#This defines the function with 3 parameters:
+    # anything else (403 rate limit, 5xx...) says nothing about the file, so don't pass it off as "no overrides"
+    print(f"Error reading {path} from GitHub:", response.status_code, response.text[:200])
+    raise requests.HTTPError(f"GitHub returned {response.status_code} for {path}", response=response)
+
+#This defines the function with 4 parameters:
 #repo: Your GitHub repo name, like "kaimin86/credit-rating-deploy"
 #path: The path to the CSV file inside your repo, e.g. "overrides/USA_2024.csv"
 #token: Your GitHub personal access token, used to authenticate
@@ -34,16 +97,19 @@ def load_df_from_github(repo, path, token):
 #pandas → to parse the CSV
 #Even though you're likely importing these at the top of the file too, having them here makes the function more self-contained
 
-#This builds the URL to the raw file on GitHub.
-#URL becomes: https://raw.githubusercontent.com/kaimin86/credit-rating-deploy/main/overrides/USA_2024.csv
-#This is a direct public URL to the raw file content.
+#ref: Branch, tag or commit sha to read from (defaults to "main")
+
+#This builds the URL to the file on GitHub's contents API.
+#URL becomes: https://api.github.com/repos/kaimin86/credit-rating-deploy/contents/overrides/USA_2024.csv?ref=main
+#The Accept header "application/vnd.github.raw+json" asks for the raw CSV text instead of the base64 JSON wrapper.
 
 #This sets the header to include your GitHub token.
 #Even if your repo is public, this makes it more secure and avoids any rate limits from GitHub.
 
-#Makes a GET request to fetch the CSV file from GitHub.
+#Makes a GET request to fetch the CSV file from GitHub, through the shared requests.Session.
+#The session re-uses one pooled connection, so we skip a TLS handshake on every call.
 #If the file exists → you get a 200 response and file content
-#If the file doesn’t exist → you get a 404
+#If the file doesn't exist → you get a 404
 
 #Checks if the file was successfully found and loaded
 # If it exists, it:
@@ -51,17 +117,23 @@ def load_df_from_github(repo, path, token):
 #Loads it as a DataFrame with pd.read_csv(...)
 #Returns the resulting DataFrame
 
-#If the file does not exist (404 error), return an empty DataFrame with the right column structure — so the rest of your app won’t crash.
+#If the file does not exist (404 error), return an empty DataFrame with the right column structure — so the rest of your app won't crash.
+#Any other status (403 when we hit the rate limit, 5xx when GitHub is down) raises requests.HTTPError instead.
+#Otherwise a rate limited app would quietly show every country as having no overrides.
 
-#Special Note: In the middle of the code. I had to tweak the URL because of the time taken for Github to push/pull edits
-#It adds a "fake" query parameter (?nocache=timestamp) to your GitHub raw file URL to bypass HTTP caching.
-#when you request https://raw.githubusercontent.com/kaimin86/credit-rating-deploy/main/overrides/USA_2024.csv
-#Streamlit Cloud (or requests) might reuse a cached version — especially if it just downloaded that URL seconds ago.
-#Even if the GitHub file was updated, your app may still see the "old" version from memory or a CDN.
-#url = f"https://raw.githubusercontent.com/{repo}/main/{path}?nocache={int(time.time())}" --> what we do instead
-#Every time you reload, the nocache value changes (based on time)
-#This tricks GitHub/CDN/requests into treating it as a new URL
-#Result: you always get the freshest version of the override file
+#api_url: base url of the API. Only change this to point at a local fake server when testing
+
+#Special Note: Caching and freshness
+#We used to add a "fake" query parameter (?nocache=timestamp) to the raw.githubusercontent.com URL so the CDN never served a stale copy.
+#That meant a full download on every single call.
+#Now we ask the contents API (which is not CDN cached) and send the ETag we got last time in an If-None-Match header.
+#If the file is unchanged GitHub answers 304 Not Modified with no body, and we hand back the DataFrame we parsed last time.
+#If the file changed we get a 200 with the new content and a new ETag, which replaces the cache entry.
+#Result: you always get the freshest version of the override file, and unchanged files are nearly free to re-check.
+#Conditional requests that return 304 also don't count against GitHub's API rate limit.
+#We return a .copy() so callers can edit the frame without corrupting the cached one.
+#The cache keeps the _ETAG_CACHE_SIZE most recently read files and drops the least recently used one after that,
+#so reading many countries / commits over a long running app can't grow it without limit.
 
 # Goal of this function:
 # Uploads a pandas DataFrame to a GitHub repository as a CSV file.
@@ -73,16 +145,16 @@ def load_df_from_github(repo, path, token):
 #path: Path to save the file in the repo, e.g., 'overrides/USA_2024.csv'
 #commit_message: The commit message to show in GitHub
 #token: GitHub personal access token (ideally from st.secrets)
+#api_url: base url of the API. Only change this to point at a local fake server when testing
 
 #Returns:
-#True if successful, False otherwise
+#dict with the new "blob_sha" and "commit_sha" if successful, None otherwise
+#(so `if push_df_to_github(...):` still works the way it did when this returned True/False)
 
-def push_df_to_github(df, repo, path, commit_message, token):
+def push_df_to_github(df, repo, path, commit_message, token, api_url="https://api.github.com"):
     import base64
-    import requests
-    import time
 
-    url = f"https://api.github.com/repos/{repo}/contents/{path}"
+    url = f"{api_url}/repos/{repo}/contents/{path}"
     csv_string = df.to_csv(index=False)
     encoded_content = base64.b64encode(csv_string.encode()).decode()
 
@@ -91,7 +163,8 @@ def push_df_to_github(df, repo, path, commit_message, token):
         "Accept": "application/vnd.github.v3+json"
     }
 
-    response = requests.get(url, headers=headers)
+    session = _get_session()
+    response = session.get(url, headers=headers)
     sha = response.json().get("sha") if response.status_code == 200 else None
 
     data = {
@@ -102,13 +175,17 @@ def push_df_to_github(df, repo, path, commit_message, token):
     if sha:
         data["sha"] = sha
 
-    put_response = requests.put(url, headers=headers, json=data)
+    put_response = session.put(url, headers=headers, json=data)
 
     if put_response.status_code in (200, 201):
-        return True
+        result = put_response.json()
+        return {
+            "blob_sha": result["content"]["sha"],
+            "commit_sha": result["commit"]["sha"]
+        }
     else:
         print("Error pushing to GitHub:", put_response.json())
-        return False
+        return None
 
 
 #Build the API URL for the file.
@@ -145,13 +222,118 @@ def push_df_to_github(df, repo, path, commit_message, token):
 #Send a PUT request to GitHub with the payload.
 #This either: Creates the file (if it didn’t exist) or Overwrites it (if it did)
 
-#Return True if:
+#Return the new blob + commit SHAs if:
 #201: file was created
 #200: file was updated
-#Otherwise, return False.
+#Otherwise, return None.
+
+#The commit SHA is the important one. Reading the file at that exact commit
+#(load_df_from_github(..., ref=commit_sha)) is guaranteed to show what we just wrote,
+#so there is no need to sleep or poll before st.rerun() anymore.
+
+# Goal of this function:
+# Uploads many DataFrames to the GitHub repository as CSV files in ONE commit.
+# push_df_to_github costs a GET + PUT (and one commit) per file, so saving 20 override files = 40 requests and 20 commits.
+# This goes through the lower level Git Data API instead and always costs 5 requests, however many files there are.
+
+#Parameters:
+#files: dict of {path in repo: DataFrame}, e.g. {"overrides/USA_2024.csv": df_usa, "overrides/FRA_2024.csv": df_fra}
+#repo: GitHub repo in the format 'username/repo-name'
+#commit_message: The commit message to show in GitHub
+#token: GitHub personal access token (ideally from st.secrets)
+#branch: branch to commit to (usually "main")
+#api_url: base url of the API. Only change this to point at a local fake server when testing
+#max_retries: how many times to rebuild the commit if someone else pushed to the branch while we were working
+
+#Returns:
+#dict with the new "commit_sha" and a "blob_shas" dict of {path: blob sha} if successful, None otherwise
 
-#one minor edit at the end st.rerun() is too fast. It takes time to send and the new analyst input data to Github and get it updated
-#Add time.sleep(1.5) before rerun to see freshest output
+def _git_blob_sha(data):
+    # what git (and GitHub) names a file's contents: sha1 of "blob <size in bytes>\0" + the bytes
+    import hashlib
+
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def push_dfs_to_github(files, repo, commit_message, token, branch="main",
+                       api_url="https://api.github.com", max_retries=3):
+    base = f"{api_url}/repos/{repo}/git"
+
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    session = _get_session()
+
+    contents = {path: df.to_csv(index=False) for path, df in files.items()}
+    tree_entries = [
+        {"path": path, "mode": "100644", "type": "blob", "content": text}
+        for path, text in contents.items()
+    ]
+    # the create-tree response only lists the top level of the tree, so "overrides/USA_2024.csv" never shows up in it.
+    # a blob's sha only depends on its bytes, so we work them out here instead
+    blob_shas = {path: _git_blob_sha(text.encode()) for path, text in contents.items()}
+
+    for attempt in range(max_retries):
+        # 1) where does the branch point right now?
+        ref_response = session.get(f"{base}/ref/heads/{branch}", headers=headers)
+        if ref_response.status_code != 200:
+            print("Error reading branch from GitHub:", ref_response.json())
+            return None
+        parent_sha = ref_response.json()["object"]["sha"]
+
+        # 2) which tree does that commit have? our new tree is built on top of it
+        commit_response = session.get(f"{base}/commits/{parent_sha}", headers=headers)
+        if commit_response.status_code != 200:
+            print("Error reading commit from GitHub:", commit_response.json())
+            return None
+        base_tree_sha = commit_response.json()["tree"]["sha"]
+
+        # 3) one tree holding every file. GitHub creates the blobs from the inline content
+        tree_response = session.post(f"{base}/trees", headers=headers,
+                                     json={"base_tree": base_tree_sha, "tree": tree_entries})
+        if tree_response.status_code != 201:
+            print("Error creating tree on GitHub:", tree_response.json())
+            return None
+        tree = tree_response.json()
+
+        # 4) one commit pointing at that tree
+        new_commit_response = session.post(f"{base}/commits", headers=headers,
+                                           json={"message": commit_message, "tree": tree["sha"], "parents": [parent_sha]})
+        if new_commit_response.status_code != 201:
+            print("Error creating commit on GitHub:", new_commit_response.json())
+            return None
+        commit_sha = new_commit_response.json()["sha"]
+
+        # 5) move the branch to the new commit. force=False means GitHub refuses (422)
+        # if the branch moved since step 1, in which case we start again from the new head
+        update_response = session.patch(f"{base}/refs/heads/{branch}", headers=headers,
+                                        json={"sha": commit_sha, "force": False})
+        if update_response.status_code == 200:
+            return {"commit_sha": commit_sha, "blob_shas": blob_shas}
+        if update_response.status_code != 422:
+            print("Error updating branch on GitHub:", update_response.json())
+            return None
+
+    print(f"Error pushing to GitHub: {branch} kept moving, gave up after {max_retries} attempts")
+    return None
+
+#Why the Git Data API?
+#The contents API (push_df_to_github) only knows about one file at a time, and every PUT is its own commit.
+#Underneath, a git commit is just: a tree (the folder listing, pointing at blobs = file contents) + a parent commit + a message.
+#So we build that ourselves:
+#ref -> parent commit -> its tree -> new tree (old tree + our files) -> new commit -> move the branch
+#Either every file lands in the one commit, or (if any step fails) the branch is untouched. Nothing half-saved.
+
+#The new tree's entries carry the CSV text inline ("content"), which makes GitHub create the blobs for us.
+#That saves a separate POST /git/blobs per file, so the request count stays at 5 no matter how many files we push.
+
+#blob_shas are computed locally (_git_blob_sha) rather than read off the create-tree response.
+#That response only lists the top level entries, so for any file in a folder it would have nothing to match.
+#They are the same shas GitHub gives the blobs, so callers can compare them with what's on the branch later.
+
+#Reading the result back:
+#load_df_from_github(repo, path, token, ref=result["commit_sha"]) reads any of the pushed files at exactly that commit.
 
 ## Special note on token: This is specially generated by Github and unique to this particular repository
 ## saved in a secrets.toml file that streamlit recognizes
@@ -160,8 +342,12 @@ def push_df_to_github(df, repo, path, commit_message, token):
 # Goal of this function:
 # Only allows re run once github properly updates
 # Helps my analyst see fresh updated data once they click save. else it was showing stale data
+# Pass the commit_sha returned by push_df_to_github and this becomes a single read of that exact commit.
+# Without a commit_sha it falls back to the old behaviour of polling main once a second.
+# api_url is passed on to load_df_from_github (a local fake server when testing).
 
-def wait_for_override_to_update(repo, path, token, df_before, max_retries=10):
+def wait_for_override_to_update(repo, path, token, df_before, max_retries=10, commit_sha=None,
+                                api_url="https://api.github.com"):
     import time
     import pandas as pd
     
@@ -174,10 +360,14 @@ def wait_for_override_to_update(repo, path, token, df_before, max_retries=10):
 
     df_before_norm = normalize_df(df_before)
 
+    if commit_sha:
+        df_after = load_df_from_github(repo, path, token, ref=commit_sha, api_url=api_url)
+        return not normalize_df(df_after).equals(df_before_norm)
+
     for attempt in range(max_retries):
         time.sleep(1)
 
-        df_after = load_df_from_github(repo, path, token)
+        df_after = load_df_from_github(repo, path, token, api_url=api_url)
         df_after_norm = normalize_df(df_after)
 
         if not df_after_norm.equals(df_before_norm):
@@ -186,9 +376,24 @@ def wait_for_override_to_update(repo, path, token, df_before, max_retries=10):
     return False
 
 
-def wait_until_override_row_matches(repo, path, token, target_row, max_retries=60, delay=1):
-    import time
+def _override_row_matches(df, target_row):
     import pandas as pd
+
+    # Normalize for safe comparison
+    df["Adjustment"] = pd.to_numeric(df["Adjustment"], errors="coerce").fillna(0)
+    df["Analyst Comment"] = df["Analyst Comment"].fillna("").astype(str)
+
+    match = df[
+        (df["short_name"] == target_row["short_name"]) &
+        (df["Adjustment"].round(4) == round(target_row["Adjustment"], 4)) &
+        (df["Analyst Comment"].str.strip() == target_row["Analyst Comment"].strip())
+    ]
+    return not match.empty
+
+
+def wait_until_override_row_matches(repo, path, token, target_row, max_retries=60, delay=1, commit_sha=None,
+                                    api_url="https://api.github.com"):
+    import time
     """
     Polls GitHub until a specific row in the override file matches expected values.
     Only triggers rerun when exact override appears.
@@ -200,28 +405,22 @@ def wait_until_override_row_matches(repo, path, token, target_row, max_retries=6
     - target_row: dict with expected override (e.g. {"short_name": "GDP", "Adjustment": -0.2, "Analyst Comment": "Revised"})
     - max_retries: number of times to retry
     - delay: seconds to wait between retries
+    - commit_sha: commit returned by push_df_to_github. If given, we read that commit once instead of polling
+    - api_url: base url of the API, passed on to load_df_from_github (a local fake server when testing)
 
     Returns:
     - True if update detected
     - False if timeout
     """
-    #from github_utils import load_df_from_github  # remove the dot if inside same file
+    if commit_sha:
+        df = load_df_from_github(repo, path, token, ref=commit_sha, api_url=api_url)
+        return _override_row_matches(df, target_row)
 
     for attempt in range(max_retries):
         time.sleep(delay)
-        df = load_df_from_github(repo, path, token)
+        df = load_df_from_github(repo, path, token, api_url=api_url)
 
-        # Normalize for safe comparison
-        df["Adjustment"] = pd.to_numeric(df["Adjustment"], errors="coerce").fillna(0)
-        df["Analyst Comment"] = df["Analyst Comment"].fillna("").astype(str)
-
-        match = df[
-            (df["short_name"] == target_row["short_name"]) &
-            (df["Adjustment"].round(4) == round(target_row["Adjustment"], 4)) &
-            (df["Analyst Comment"].str.strip() == target_row["Analyst Comment"].strip())
-        ]
-
-        if not match.empty:
+        if _override_row_matches(df, target_row):
             return True
 
-    return False
\ No newline at end of file
+    return False
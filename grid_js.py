@@ -0,0 +1,615 @@
+# The AgGrid set-up shared by the editable rating tables: the JsCode formatters / cell styles / editable rules,
+# the header CSS, and the grid options for each table built from them.
+# These used to be written out inline in Sovereign_Credit_Rating_Model.py and again in pages/04_Simulation.py,
+# and rebuilt on every rerun: a GridOptionsBuilder pass plus a dozen JsCode objects (each one a few regex passes) per table.
+#
+# Now the JsCode objects are made once, at import, and the grid options are cached per table layout
+# (column names + dtypes, which is all GridOptionsBuilder.from_dataframe looks at). The JsCode in them is turned into
+# the grid's "::JSCODE::" strings once as well, so AgGrid's own pass over the options finds nothing left to convert.
+#
+# usage: LS_gridOptions = short_grid_options(grid_layout(short_table_df), rating_dict)
+#        response = AgGrid(short_table_df, gridOptions=LS_gridOptions, custom_css=HEADER_CSS, allow_unsafe_jscode=True,
+#                          update_on=["cellValueChanged"], data_return_mode="CUSTOM", custom_jscode_for_grid_return=EDITED_CELLS, ...)
+#        edits = grid_edits(response)   -> [(short_name, column, value), ...], see apply_grid_edits in rating_tables.py
+
+import json
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import GridOptionsBuilder, JsCode
+from st_aggrid.shared import walk_gridOptions
+
+from rating_tables import SUBFACTORS
+
+
+## Formatters: control how values display in a column. The underlying data in the df is not changed
+
+### “If the value is missing, show blank. If it’s a letter like 'A', just display it as-is — don't try to force into a numeric”
+### and show numeric values with 2 decimals
+COMBINED_FORMATTER = JsCode("""
+function(params) {
+  const v = params.value;
+  // 1) Blank out null/undefined/empty
+  if (v === undefined || v === null || v === '') {
+    return '';
+  }
+  // 2) If numeric, show one decimal
+  if (!isNaN(v)) {
+    return parseFloat(v).toFixed(2);
+  }
+  // 3) Otherwise (e.g. letter ratings), just display as string
+  return v.toString();
+}
+""")
+
+HIDE_NA_FORMATTER = JsCode("""
+function(params) {
+    return params.value === undefined || params.value === null ? '' : params.value.toString();
+}
+""")
+
+### null / undefined / zero → blank, numbers → 2 decimals, everything else → cast to string
+HIDE_ZERO_FORMATTER = JsCode("""
+function(params) {
+  const v = params.value;
+  // 1) blank out null/undefined and zero
+  if (v === undefined || v === null || v === 0) {
+    return '';
+  }
+  // 2) if it’s numeric, show two decimals
+  if (!isNaN(v)) {
+    return parseFloat(v).toFixed(2);
+  }
+  // 3) otherwise (e.g. letter), just render as string
+  return v.toString();
+}
+""")
+
+### raw values (and the simulation's custom values) are formatted by row: thousands, 0/1 flags, 1 decimal
+RAWVALUE_FORMATTER = JsCode("""
+function(params) {
+  const v  = params.value;
+  const id = params.data.short_name;
+
+  // 1) Handle null/undefined/empty
+  if (v === undefined || v === null || v === '') {
+    // show “–” for these specific headers
+    const dashRows = [
+      'default_factor',
+      'governance_factor',
+      'fiscalperf_factor',
+      'reservebuffer_factor'
+    ];
+    return dashRows.includes(id) ? '–' : '';
+  }
+
+  // 2) Parse number
+  const num = parseFloat(v);
+  if (isNaN(num)) {
+    // if it wasn’t numeric, just show it as text
+    return v.toString();
+  }
+
+  // 3) Formatting by row key
+  switch (id) {
+    case 'wealth_factor':
+      // comma thousands, no decimals
+      return num.toLocaleString(undefined, {
+        minimumFractionDigits: 0,
+        maximumFractionDigits: 0
+      });
+
+    case 'default_hist':
+    case 'reservestatus_factor':
+      // integer (0 or 1)
+      return num.toFixed(0);
+
+    default:
+      // everything else: one decimal place
+      return num.toFixed(1);
+  }
+}
+""")
+
+
+## Cell styles: how values look in a column (bold, colours...)
+
+### main table
+MODEL_ROWS_BOLD_STYLE = JsCode("""
+      function(params) {
+        const id = params.data.short_name;
+        if (id === 'predicted_rating' || id === 'final_rating') {
+          return {
+            color: 'black',
+            'font-weight': 'bold'
+          };
+        }
+        return null;  // leave all other rows with their default style
+      }
+""")
+
+### main table Adjustment + Analyst Comment: analyst input in blue, the model output rows in bold black
+OVERRIDE_STYLE = JsCode("""
+  function(params) {
+    const id = params.data.short_name;
+    if (id === 'predicted_rating' || id === 'final_rating') {
+      return { color: 'black', 'font-weight': 'bold' };
+    }
+    return { color: 'blue',  'font-weight': 'normal' };
+  }
+""")
+
+### supplementary + simulation tables: constituent variables in maroon
+PURPLE_VALUES_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  const purpleIds = [
+    'default_hist',
+    'default_decay',
+    'voice_acct',
+    'pol_stab',
+    'gov_eff',
+    'reg_qual',
+    'rule_law',
+    'cont_corrupt',
+    'fb_avg',
+    'gov_rev_gdp',
+    'ir_rev',
+    'reserve_gdp',
+    'import_cover'
+  ];
+  if (purpleIds.includes(id)) {
+    return { color: '#B21740' };
+  }
+  return null;
+}
+""")
+
+PURPLE_DESCRIPTION_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  const purpleIds = [
+    'default_hist',
+    'default_decay',
+    'voice_acct',
+    'pol_stab',
+    'gov_eff',
+    'reg_qual',
+    'rule_law',
+    'cont_corrupt',
+    'fb_avg',
+    'gov_rev_gdp',
+    'ir_rev',
+    'reserve_gdp',
+    'import_cover'
+  ];
+  if (purpleIds.includes(id)) {
+    // purple, normal weight
+    return { color: '#B21740', 'font-weight': 'normal' };
+  }
+  // all other rows: black, bold
+  return { color: 'black', 'font-weight': 'bold' };
+}
+""")
+
+ADJUSTMENT_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // list of rows to render in blue + bold
+  const blueIds = [
+    'wealth_factor',
+    'size_factor',
+    'growth_factor',
+    'inflation_factor',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'govdebt_factor',
+    'extperf_factor',
+    'reservebuffer_factor',
+    'reservestatus_factor'
+  ];
+  if (blueIds.includes(id)) {
+    return {
+      color: '#0000FF',
+      'font-weight': 'bold'
+    };
+  }
+  // everything else: maroon-ish, normal weight
+  return {
+    color: '#B21740',
+    'font-weight': 'normal'
+  };
+}
+""")
+
+ANALYST_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  const blueIds = [
+    'wealth_factor',
+    'size_factor',
+    'growth_factor',
+    'inflation_factor',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'govdebt_factor',
+    'extperf_factor',
+    'reservebuffer_factor',
+    'reservestatus_factor'
+  ];
+  if (blueIds.includes(id)) {
+    return { color: '#0000FF' };      // blue, no bold
+  }
+  return { color: '#B21740' };        // maroon-ish, no bold
+}
+""")
+
+FACTOR_STYLE_LONG = JsCode("""
+function(params) {
+  const style = {};
+  // header sentinels to skip
+  const headers = [
+    "eco_header",
+    "insti_header",
+    "fiscal_header",
+    "ext_header",
+    "final_header"
+  ];
+  // Shade every non-header row
+  if (!headers.includes(params.data.short_name)) {
+    style['background-color'] = '#DAEEF3';
+  }
+  // Bold all text
+  style['font-weight'] = 'bold';
+  return style;
+}
+""")
+
+### simulation table
+CUSTOMVALUE_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // list of rows to render in blue + bold
+  const blueIds = [
+    'wealth_factor',
+    'size_factor',
+    'growth_factor',
+    'inflation_factor',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'govdebt_factor',
+    'extperf_factor',
+    'reservebuffer_factor',
+    'reservestatus_factor'
+  ];
+  if (blueIds.includes(id)) {
+    return {
+      color: '#0000FF',
+      'font-weight': 'bold'
+    };
+  }
+  // everything else: blue, normal weight
+  return {
+    color: '#0000FF',
+    'font-weight': 'normal'
+  };
+}
+""")
+
+RATINGIMPACT_STYLE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // list of rows to render in red + bold
+  const blueIds = [
+    'wealth_factor',
+    'size_factor',
+    'growth_factor',
+    'inflation_factor',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'govdebt_factor',
+    'extperf_factor',
+    'reservebuffer_factor',
+    'reservestatus_factor'
+  ];
+  if (blueIds.includes(id)) {
+    return {
+      color: '#FF0000',
+      'font-weight': 'bold'
+    };
+  }
+  // everything else: red, normal weight
+  return {
+    color: '#FF0000',
+    'font-weight': 'normal'
+  };
+}
+""")
+
+### bold + shaded pillar header rows, every table (getRowStyle)
+PILLAR_ROW_STYLE = JsCode("""
+  function(params) {
+    // list of the exact Factor values you want to style
+    const headers = [
+      "REAL ECONOMY PILLAR (25%)",
+      "MONETARY & INSTITUTIONS PILLAR (44%)",
+      "FISCAL PILLAR (17%)",
+      "EXTERNAL PILLAR (14%)",
+      "SOVEREIGN CREDIT RATING"
+    ];
+    // if this row’s Factor is one of the headers, return a style object
+    if (headers.includes(params.data.Factor)) {
+      return {
+        "font-weight":      "bold",
+        "background-color": "#B6CEE4"   // light tint—change as you like
+      };
+    }
+    return null;  // otherwise use default styling
+  }
+""")
+
+### Loomis Excel-like header row: overrides the theme
+HEADER_CSS = {
+    # header cell label (the text container)
+    ".ag-header-cell-label": {
+        "background-color": "#1A3B73 !important",
+        "color":            "white !important",
+        "font-weight":      "bold !important",
+        #"font-size":        "16px !important" #messes wtih alignment..
+    },
+    # the very header row wrapper (fills behind the labels)
+    ".ag-header": {
+        "background-color": "#1A3B73 !important",
+    },
+}
+
+
+## Editable rules: passed into the editable arg to control which cells can or cannot be edited
+
+### main table: not the headers or the model output rows
+EDITABLE_OVERRIDE = JsCode("""
+  function(params) {
+    const id = params.data.short_name;
+    // editable only if:
+    //  • it's not a header (id !== '')
+    //  • it's not the model output rows
+    return id !== '' && id !== 'predicted_rating' && id !== 'final_rating';
+  }
+""")
+
+### supplementary table Adjustment: not the headers, const, or the factors that roll up from their constituent variables
+EDITABLE_ADJUSTMENT_LONG = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // list of short_name values that should NOT be editable
+  const locked = [
+    '',                  // blank header rows
+    'const',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'reservebuffer_factor'
+  ];
+  // return false (lock) when id is in our locked list; true otherwise
+  return !locked.includes(id);
+}
+""")
+
+### simulation table Custom Value: as above, and the pillar header rows too
+EDITABLE_CUSTOM_VALUE = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // list of short_name values that should NOT be editable
+  const locked = [
+    '',                  // blank header rows
+    'const',
+    'default_factor',
+    'governance_factor',
+    'fiscalperf_factor',
+    'reservebuffer_factor',
+    'eco_header',
+    'insti_header',
+    'fiscal_header',
+    'ext_header'
+  ];
+  // return false (lock) when id is in our locked list; true otherwise
+  return !locked.includes(id);
+}
+""")
+
+EDITABLE_ANALYST_LONG = JsCode("""
+function(params) {
+  const id = params.data.short_name;
+  // lock only blank header rows and the 'const' row
+  if (id === '' || id === 'const') {
+    return false;
+  }
+  return true;
+}
+""")
+
+
+## Live recalculation: runs in the browser when an analyst edits a cell
+
+### Live rating: when an analyst changes an Adjustment, the grid itself re-adds the adjustments and updates the
+### model rating row (sum of adjustments) and the LS Final Rating row (notches + letter). Same maths as
+### refresh_short_totals in rating_tables.py, incl. Python's round() and the 1-22 clamp, so the analyst sees the
+### new rating as they type without waiting on the server. The server does the same sum on its copy of the table
+### (the export) and on load after a Save.
+LIVE_RATING_TEMPLATE = """
+  function(params) {
+    const scale = __RATING_SCALE__;  // numeric rating -> letter, from index_rating_scale.xlsx
+    const num = v => { const n = parseFloat(v); return isNaN(n) ? 0 : n; };
+
+    let adjSum = 0, predicted = null, final = null;
+    params.api.forEachNode(node => {
+      const id = node.data.short_name;
+      if (id === 'predicted_rating') { predicted = node; }
+      else if (id === 'final_rating') { final = node; }
+      else { adjSum += num(node.data.Adjustment); }
+    });
+    if (!predicted || !final) {
+      return;
+    }
+
+    const adjusted = num(predicted.data['Rating (notches)']) + adjSum;
+    // round half to even like Python, then clamp onto the 1-22 scale (clamp_letter)
+    const floor = Math.floor(adjusted), frac = adjusted - floor;
+    const rounded = (frac > 0.5 || (frac === 0.5 && floor % 2 !== 0)) ? floor + 1 : floor;
+    const notch = Math.min(22, Math.max(1, rounded));
+
+    // write straight into the row data: setDataValue would fire cellValueChanged (and a grid return) per cell
+    predicted.data.Adjustment = adjSum;
+    final.data['Rating (notches)'] = adjusted;
+    final.data['Analyst Comment'] = scale[notch] || 'N/A';
+    params.api.refreshCells({ rowNodes: [predicted, final], force: true });
+  }
+"""
+
+### Live roll-up: editing a constituent variable's Adjustment re-adds its factor's adjustment in the grid
+### (same as refresh_long_rollups), instead of waiting for the Save rerun to show it
+LIVE_ROLLUP = JsCode("""
+function(params) {
+  const subfactors = __SUBFACTORS__;  // factor -> its constituent variables (SUBFACTORS in rating_tables.py)
+  const num = v => { const n = parseFloat(v); return isNaN(n) ? 0 : n; };
+
+  const rows = {};
+  params.api.forEachNode(node => { rows[node.data.short_name] = node; });
+
+  const changed = [];
+  for (const [factor, ids] of Object.entries(subfactors)) {
+    if (!ids.includes(params.data.short_name) || !rows[factor]) {
+      continue;
+    }
+    rows[factor].data.Adjustment = ids.reduce((sum, id) => sum + (rows[id] ? num(rows[id].data.Adjustment) : 0), 0);
+    changed.push(rows[factor]);
+  }
+  if (changed.length) {
+    params.api.refreshCells({ rowNodes: changed, force: true });
+  }
+}
+""".replace("__SUBFACTORS__", json.dumps(SUBFACTORS)))
+
+
+## Edit transport: what the grid sends back to the page when a cell changes (AgGrid data_return_mode="CUSTOM").
+## Not the whole table, just the cells edited since the grid loaded: [[short_name, column, new value], ...],
+## latest value per cell. Every edit since load, not only the latest one: a component value is state, not an event,
+## so if two edits land before the page reruns only the second value would reach Python.
+## The log lives on this grid's api; new data (another country-year, or a Save) mounts a new grid and a new log.
+EDITED_CELLS = JsCode("""
+function({streamlitRerunEventTriggerName, eventData}) {
+  const api = eventData.api;
+  const edits = api.lsEditedCells = api.lsEditedCells || new Map();
+  if (streamlitRerunEventTriggerName === 'cellValueChanged') {
+    const cell = eventData.data.short_name + '|' + eventData.colDef.field;
+    edits.set(cell, [eventData.data.short_name, eventData.colDef.field, eventData.newValue]);
+  }
+  return Array.from(edits.values());
+}
+""")
+
+
+def grid_edits(grid_response):
+    """The (short_name, column, value) cells an analyst edited in an EDITED_CELLS grid, [] before the first edit."""
+    return [tuple(edit) for edit in (grid_response.raw_data or [])]
+
+
+## Grid options, one cached dict per table layout. Shared by every session: AgGrid only reads them
+## (its JsCode pass writes back the same strings, as they are converted already)
+
+def grid_layout(df):
+    """(column, dtype) pairs of a table: the cache key for its grid options."""
+    return tuple((col, str(dtype)) for col, dtype in df.dtypes.items())
+
+
+def _builder(layout):
+    # GridOptionsBuilder only needs the columns and their dtypes, so an empty frame of the same layout will do
+    gb = GridOptionsBuilder.from_dataframe(pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in layout}))
+    gb.configure_default_column(
+        editable=False, #cannot edit
+        sortable=False, #cannot sort
+        filter=False, #cannot filter
+        resizable=False, #cannot resize
+        suppressHeaderMenuButton=True #hide the 3 dots button for me. FINALLY!
+    )
+    return gb
+
+
+def _build(gb):
+    options = gb.build()
+    options["getRowStyle"] = PILLAR_ROW_STYLE
+    walk_gridOptions(options, lambda v: v.js_code if isinstance(v, JsCode) else v)
+    return options
+
+
+@st.cache_resource
+def short_grid_options(layout, rating_dict):
+    """Main table (11 factor model): analysts edit Adjustment + Analyst Comment, the final rating updates live."""
+    gb = _builder(layout)
+    live_rating = JsCode(LIVE_RATING_TEMPLATE.replace("__RATING_SCALE__", json.dumps({int(k): v for k, v in rating_dict.items()})))
+
+    gb.configure_column("short_name", hide=True)
+    gb.configure_column("Factor", valueFormatter=COMBINED_FORMATTER, maxWidth=320,minWidth=320, cellStyle={"font-weight": "bold"})
+    gb.configure_column("coefficient", valueFormatter=COMBINED_FORMATTER,maxWidth=100,minWidth=100)
+    gb.configure_column("Z-score Value", valueFormatter=COMBINED_FORMATTER,maxWidth=120,minWidth=120)
+    gb.configure_column("Rating (notches)", valueFormatter=COMBINED_FORMATTER,maxWidth=140,minWidth=140,cellStyle=MODEL_ROWS_BOLD_STYLE)
+    gb.configure_column("Adjustment", valueFormatter=HIDE_ZERO_FORMATTER,editable=EDITABLE_OVERRIDE, filter=False, headerClass="ag-header-cell-label-left",
+                        onCellValueChanged=live_rating,
+                        cellClass="ag-left-aligned-cell",maxWidth=110,minWidth=110,cellStyle=OVERRIDE_STYLE)
+    gb.configure_column("Analyst Comment", valueFormatter=HIDE_NA_FORMATTER,editable=EDITABLE_OVERRIDE,maxWidth=500,minWidth=500,
+                        cellStyle=OVERRIDE_STYLE)
+    ### cellClass="ag-right-aligned-cell" aligns the column contents either left or right
+    ### headerClass="ag-header-cell-label-left" aligns header text to the left or right
+
+    options = _build(gb)
+    #With that set, clicking your Save button (or anywhere outside the cell) will commit the zero-length string as an actual edit.
+    options["stopEditingWhenCellsLoseFocus"] = True
+    return options
+
+
+@st.cache_resource
+def long_grid_options(layout):
+    """Supplementary table (constituent variables): Adjustment + Analyst Comment, factor roll-ups update live."""
+    gb = _builder(layout)
+    gb.configure_column("short_name", hide=True)
+    gb.configure_column("Factor", valueFormatter=COMBINED_FORMATTER, cellStyle=FACTOR_STYLE_LONG,maxWidth=320,minWidth=320)
+    gb.configure_column("Constituent Variables", valueFormatter=COMBINED_FORMATTER, cellStyle=PURPLE_DESCRIPTION_STYLE,
+                        maxWidth=420,minWidth=420)
+    gb.configure_column("Raw Value", valueFormatter=RAWVALUE_FORMATTER, cellStyle = PURPLE_VALUES_STYLE,maxWidth=100,minWidth=100)
+    gb.configure_column("Z-score Value", valueFormatter=COMBINED_FORMATTER, cellStyle = PURPLE_VALUES_STYLE,maxWidth=120,minWidth=120)
+
+    ## Make adjustment and analyst rationale columns editable
+    gb.configure_column("Adjustment",valueFormatter=HIDE_ZERO_FORMATTER, cellStyle = ADJUSTMENT_STYLE,
+                        editable = EDITABLE_ADJUSTMENT_LONG, onCellValueChanged=LIVE_ROLLUP,
+                        filter=False, headerClass="ag-header-cell-label-left",
+                        cellClass="ag-left-aligned-cell",maxWidth=110,minWidth=110)
+    gb.configure_column("Analyst Comment",valueFormatter=HIDE_NA_FORMATTER, cellStyle = ANALYST_STYLE,
+                        editable = EDITABLE_ANALYST_LONG,maxWidth=500,minWidth=500)
+    return _build(gb)
+
+
+@st.cache_resource
+def sim_grid_options(layout):
+    """Simulation table: analysts type a Custom Value per variable, Rating Impact shows what it does to the rating."""
+    gb = _builder(layout)
+    gb.configure_column("short_name", hide=True)
+    gb.configure_column("Factor", valueFormatter=COMBINED_FORMATTER, cellStyle=FACTOR_STYLE_LONG,maxWidth=320,minWidth=320)
+    gb.configure_column("Constituent Variables", valueFormatter=COMBINED_FORMATTER, cellStyle=PURPLE_DESCRIPTION_STYLE,
+                        maxWidth=420,minWidth=420)
+    gb.configure_column("Raw Value", valueFormatter=RAWVALUE_FORMATTER, filter=False, cellStyle = PURPLE_VALUES_STYLE,maxWidth=120,minWidth=120)
+    gb.configure_column("Z-score Value", valueFormatter=COMBINED_FORMATTER, filter=False, cellStyle = PURPLE_VALUES_STYLE,maxWidth=140,minWidth=140)
+
+    ## Make Custom Value columns editable
+    gb.configure_column("Custom Value",valueFormatter=RAWVALUE_FORMATTER, cellStyle = CUSTOMVALUE_STYLE,
+                        editable = EDITABLE_CUSTOM_VALUE, filter=False, headerClass="ag-header-cell-label-left",
+                        cellClass="ag-left-aligned-cell",maxWidth=120,minWidth=120)
+
+    ## Make Configuration for Rating Impact column
+    gb.configure_column("Rating Impact",valueFormatter=COMBINED_FORMATTER, cellStyle = RATINGIMPACT_STYLE,
+                        filter=False, headerClass="ag-header-cell-label-left",
+                        cellClass="ag-left-aligned-cell",maxWidth=140,minWidth=140)
+    return _build(gb)
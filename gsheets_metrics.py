@@ -0,0 +1,246 @@
+# Google Sheets API call accounting: every request a gspread client makes, by operation, spreadsheet and tab,
+# with its latency, response size and status. 429s are tracked against the per-minute quota.
+#
+# Why: all analysts share one service account, so they all draw on the same per-user quota
+# (60 reads + 60 writes a minute by default). That quota, not CPU, is what caps how many analysts
+# can work at once. Going over it gets a 429 and a failed load / save.
+#
+# How: instrument_client(client) wraps the client's HTTP layer (client.http_client.request), which every gspread call
+# goes through: Client.open, Spreadsheet.worksheet, Worksheet.get_all_records / update / append_rows, values_batch_get...
+# So gsheets_utils, gsheets_utils_sim, the app pages and the batch scripts are all counted without touching them.
+#
+# usage: client = instrument_client(gspread.authorize(creds))
+#        ...
+#        print(report())          -> CLI scripts, at the end of the run
+#        quota_usage() / call_stats() / calls_per_minute()   -> the app's diagnostics panel (perf_utils.py)
+
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from urllib.parse import unquote, urlparse
+
+import pandas as pd
+
+# Sheets API default quota per user per project (the service account is the one "user"), per minute.
+# Drive calls (Client.open lists files by title) count against the separate Drive quota.
+READ_QUOTA_PER_MIN = 60
+WRITE_QUOTA_PER_MIN = 60
+
+CALL_WINDOW = 20000  # calls kept for the tables / percentiles; lifetime counts are kept separately
+
+_calls = deque(maxlen=CALL_WINDOW)  # (finished at, operation, kind, spreadsheet, tab, ms, bytes, status)
+_totals = Counter()  # lifetime: calls, reads, writes, drive, errors, throttled
+_lock = threading.Lock()  # every session's script thread writes here
+
+_names = {}  # spreadsheet id -> title, filled in by the wrapped Client.open
+_opening = threading.local()  # title of the spreadsheet being opened on this thread (its calls come before we know the id)
+
+
+## Recording
+
+def record_call(operation, kind, spreadsheet, tab, elapsed_ms, size_bytes, status):
+    """
+    Books one API call. kind is "read", "write" or "drive" (which quota it draws on).
+    status is the HTTP status (429 = over quota), or None if the request never got a response.
+    """
+    now = time.time()
+    with _lock:
+        _calls.append((now, operation, kind, spreadsheet, tab, elapsed_ms, size_bytes, status))
+        _totals["calls"] += 1
+        _totals[kind] += 1
+        if status is None or status >= 400:
+            _totals["errors"] += 1
+        if status == 429:
+            _totals["throttled"] += 1
+
+
+def reset_metrics():
+    with _lock:
+        _calls.clear()
+        _totals.clear()
+
+
+BATCH_OPERATIONS = {"batchGet": "values_batch_get", "batchUpdate": "values_batch_update", "batchClear": "values_batch_clear"}
+
+
+def _parse_request(method, endpoint, params):
+    # (operation, kind, spreadsheet id, tab) from a Sheets / Drive API request.
+    # The endpoints are gspread's, not a public interface: anything we don't recognise (or can't parse) is booked
+    # as "other" against the quota its method draws on, rather than misread as a values call.
+    # tests/test_gsheets_metrics.py pins every form the app relies on to the installed gspread.
+    kind = "read" if str(method).upper() == "GET" else "write"
+    try:
+        return _parse_sheets_request(method, endpoint, params, kind)
+    except Exception:
+        return "other", kind, None, ""
+
+
+def _parse_sheets_request(method, endpoint, params, kind):
+    url = urlparse(endpoint)
+    if "/drive/" in url.path:
+        return "drive_" + method.lower(), "drive", None, ""
+    if "/spreadsheets/" not in url.path:
+        return "other", kind, None, ""
+
+    parts = url.path.split("/spreadsheets/", 1)[-1]
+    sheet_id, _, rest = parts.partition("/")
+    sheet_id, _, action = sheet_id.partition(":")  # spreadsheets/{id}:batchUpdate
+
+    if not rest:
+        return {"": "metadata", "batchUpdate": "batch_update"}.get(action, "other"), kind, sheet_id, ""
+    if rest != "values" and not rest.startswith(("values/", "values:")):
+        return "other", kind, sheet_id, ""  # developerMetadata, sheets/{id}:copyTo, ...
+
+    # values/{range}, values/{range}:append, values:batchGet, ...  gspread quotes the range, so a raw ':' marks an action
+    rest = rest[len("values"):]
+    if rest.startswith(":"):
+        ranges = (params or {}).get("ranges") or []
+        tab = _tab(ranges[0]) if len(ranges) == 1 else (f"{len(ranges)} tabs" if ranges else "")
+        return BATCH_OPERATIONS.get(rest[1:], "values_" + rest[1:]), kind, sheet_id, tab
+
+    range_name, _, action = rest.lstrip("/").partition(":")
+    if action:
+        operation = "values_" + action
+    else:
+        operation = "values_get" if kind == "read" else "values_update"
+    return operation, kind, sheet_id, _tab(unquote(range_name))
+
+
+def _tab(range_name):
+    # "'Cote d''Ivoire'!A1:D10" -> "Cote d'Ivoire"
+    tab = range_name.rsplit("!", 1)[0] if "!" in range_name else range_name
+    if tab.startswith("'") and tab.endswith("'"):
+        tab = tab[1:-1].replace("''", "'")
+    return tab
+
+
+def instrument_client(client):
+    """Counts every request the gspread client makes from now on. Returns the client (safe to call twice)."""
+    http = getattr(client, "http_client", None)
+    if http is None or getattr(http, "_metrics_wrapped", False):
+        return client
+
+    request = http.request
+
+    def counted_request(method, endpoint, params=None, *args, **kwargs):
+        operation, kind, sheet_id, tab = _parse_request(method, endpoint, params)
+        spreadsheet = getattr(_opening, "title", None) or _names.get(sheet_id, sheet_id or "")
+        start = time.perf_counter()
+        response, status = None, None
+        try:
+            response = request(method, endpoint, params, *args, **kwargs)
+            status = response.status_code
+            return response
+        except Exception as err:
+            # gspread raises APIError for any non-2xx response; it keeps the response
+            response = getattr(err, "response", None)
+            status = getattr(response, "status_code", None)
+            raise
+        finally:
+            size = len(response.content) if response is not None and response.content else 0
+            record_call(operation, kind, spreadsheet, tab, (time.perf_counter() - start) * 1000, size, status)
+
+    http.request = counted_request
+    http._metrics_wrapped = True
+
+    # name the spreadsheet: Client.open's own calls (drive lookup + metadata) happen before the id is known
+    open_spreadsheet = client.open
+
+    def counted_open(title, *args, **kwargs):
+        _opening.title = title
+        try:
+            sheet = open_spreadsheet(title, *args, **kwargs)
+        finally:
+            _opening.title = None
+        _names[sheet.id] = title
+        return sheet
+
+    client.open = counted_open
+    return client
+
+
+## Reporting
+
+def _frame():
+    with _lock:
+        rows = list(_calls)
+    columns = ["at", "operation", "kind", "spreadsheet", "tab", "ms", "bytes", "status"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def call_stats(by=("operation", "spreadsheet")):
+    """Calls, errors, 429s, latency p50 / p95 and bytes per group, most called first. by can include "tab"."""
+    df = _frame()
+    by = list(by)
+    columns = by + ["calls", "errors", "throttled", "p50_ms", "p95_ms", "total_kb"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df["errors"] = df["status"].isna() | (df["status"] >= 400)
+    df["throttled"] = df["status"] == 429
+    stats = df.groupby(by, sort=False).agg(
+        calls=("ms", "size"),
+        errors=("errors", "sum"),
+        throttled=("throttled", "sum"),
+        p50_ms=("ms", "median"),
+        p95_ms=("ms", lambda ms: ms.quantile(0.95)),
+        total_kb=("bytes", lambda b: b.sum() / 1024),
+    )
+    return stats.reset_index().sort_values("calls", ascending=False, ignore_index=True)[columns]
+
+
+def quota_usage(window_s=60):
+    """Reads / writes / drive calls / 429s in the last window_s seconds, against the per-minute quota."""
+    df = _frame()
+    recent = df[df["at"] >= time.time() - window_s]
+    reads = int((recent["kind"] == "read").sum())
+    writes = int((recent["kind"] == "write").sum())
+    with _lock:
+        totals = dict(_totals)
+    return {
+        "reads": reads,
+        "writes": writes,
+        "drive": int((recent["kind"] == "drive").sum()),
+        "throttled": int((recent["status"] == 429).sum()),
+        "read_quota_pct": 100 * reads / READ_QUOTA_PER_MIN * 60 / window_s,
+        "write_quota_pct": 100 * writes / WRITE_QUOTA_PER_MIN * 60 / window_s,
+        "total_calls": totals.get("calls", 0),
+        "total_throttled": totals.get("throttled", 0),
+    }
+
+
+def calls_per_minute():
+    """Reads / writes / 429s per clock minute over the kept calls, busiest read minute first. Peaks show the headroom."""
+    df = _frame()
+    columns = ["minute", "reads", "writes", "throttled", "read_quota_pct", "write_quota_pct"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df["minute"] = (df["at"] // 60) * 60
+    minutes = df.groupby("minute").agg(
+        reads=("kind", lambda k: (k == "read").sum()),
+        writes=("kind", lambda k: (k == "write").sum()),
+        throttled=("status", lambda s: (s == 429).sum()),
+    ).reset_index()
+    minutes["read_quota_pct"] = 100 * minutes["reads"] / READ_QUOTA_PER_MIN
+    minutes["write_quota_pct"] = 100 * minutes["writes"] / WRITE_QUOTA_PER_MIN
+    minutes["minute"] = [datetime.fromtimestamp(t).strftime("%d %b %H:%M") for t in minutes["minute"]]
+    return minutes.sort_values("reads", ascending=False, ignore_index=True)[columns]
+
+
+def report(by=("operation", "spreadsheet")):
+    """Plain-text summary for the CLI scripts / server log."""
+    usage = quota_usage()
+    stats = call_stats(by)
+    peak = calls_per_minute().head(1)
+    lines = [
+        f"📡 Google Sheets API: {usage['total_calls']} calls, {usage['total_throttled']} throttled (429)",
+        f"   last minute: {usage['reads']} reads ({usage['read_quota_pct']:.0f}% of {READ_QUOTA_PER_MIN}/min), "
+        f"{usage['writes']} writes ({usage['write_quota_pct']:.0f}% of {WRITE_QUOTA_PER_MIN}/min), {usage['drive']} drive",
+    ]
+    if not peak.empty:
+        lines.append(f"   busiest minute: {peak['minute'][0]} with {peak['reads'][0]} reads / {peak['writes'][0]} writes")
+    if not stats.empty:
+        lines.append(stats.round(1).to_string(index=False))
+    return "\n".join(lines)
@@ -29,6 +29,49 @@ def load_override_from_gsheet(sheet, selected_name, selected_year):
         return pd.DataFrame(columns=["short_name", "Adjustment", "Analyst Comment"])
 
 
+# Purpose of this function: same as load_override_from_gsheet, but for many countries at once (the rating book)
+# load_override_from_gsheet costs 2 API calls per country (find the tab, read it), so ~270 calls for the coverage list
+# Here we list the tabs once, then pull every country tab in a handful of values_batch_get calls
+# Returns a dict of country -> override df (same columns as load_override_from_gsheet, empty if no tab / no rows for the year)
+
+def load_overrides_batch(sheet, selected_names, selected_year, chunk_size=50):
+    import pandas as pd
+    from gspread.utils import absolute_range_name, numericise_all, to_records
+
+    """Loads analyst overrides for one Year across many country tabs with batched reads."""
+    columns = ["short_name", "Adjustment", "Analyst Comment"]
+    overrides = {name: pd.DataFrame(columns=columns) for name in selected_names}
+
+    tabs = {ws.title for ws in sheet.worksheets()}  # one metadata call for every tab name
+    present = [name for name in selected_names if name in tabs]
+    for name in selected_names:
+        if name not in tabs:
+            print(f"⚠️ Worksheet for {name} not found.")
+
+    # chunked so the request URL stays a sensible length
+    for i in range(0, len(present), chunk_size):
+        chunk = present[i:i + chunk_size]
+        response = sheet.values_batch_get([absolute_range_name(name) for name in chunk])
+
+        # valueRanges come back in the same order as the ranges we asked for
+        for name, value_range in zip(chunk, response.get("valueRanges", [])):
+            values = value_range.get("values", [])
+            if len(values) < 2:  # empty tab or headers only
+                continue
+
+            # mimic get_all_records: pad short rows out to the header width and turn numeric strings into numbers
+            keys = values[0]
+            rows = [numericise_all(row + [""] * (len(keys) - len(row))) for row in values[1:]]
+            df = pd.DataFrame(to_records(keys, rows))
+
+            if df.empty or selected_year not in df["year"].values:
+                continue
+            filtered = df[df["year"] == selected_year]
+            overrides[name] = filtered[columns].reset_index(drop=True)
+
+    return overrides
+
+
 # Purpose of this function: Open the google sheet and push over analyst edits into the relevant country tab
 # First drops rows for the relevant year so we get a blank slate
 # takes updated_df which is just "short_name", "Adjustment", "Analyst Comment" post manual input by our analysts
@@ -77,3 +120,68 @@ def save_override_to_gsheet(sheet, updated_df, selected_name, selected_year):
     # Push back to the sheet
     data_to_push = [df_final.columns.tolist()] + df_final.values.tolist()
     worksheet.update("A1", data_to_push)
+
+
+# Purpose of this function: push only the cells an analyst actually edited, instead of rewriting the whole country tab
+# save_override_to_gsheet reads the tab and writes every year of it back (the biggest payload, and a save on one year
+# can undo another analyst's save on a different year of the same country if both land at once).
+# Here: read the tab once to find the rows, then
+#   rows already there for this year  -> just the edited cells, in one batch_update
+#   short_names with no row this year -> a full row appended (the unedited columns come from updated_df)
+# Works for any override sheet: columns are matched by the tab's header row ("Adjustment", "Custom Value", ...).
+# Rows the page derives (model / final rating, factor roll-ups) are recomputed on load, so they are not written here.
+
+def save_override_deltas(sheet, updated_df, edited_cells, selected_name, selected_year):
+    import pandas as pd
+    import gspread
+    from gspread.utils import rowcol_to_a1
+
+    """
+    Writes the edited cells [(short_name, column), ...] of one Country-Year, with their values from updated_df.
+    updated_df holds "short_name" plus the override columns (the same frame save_override_to_gsheet takes).
+    """
+    if not edited_cells:
+        return
+
+    try:
+        worksheet = sheet.worksheet(selected_name)
+    except gspread.exceptions.WorksheetNotFound:
+        print(f"❌ Worksheet for {selected_name} not found. Cannot save.")
+        return
+
+    def cell(v):
+        # Sheets can't take NaN or numpy scalars: blanks for missing values, plain python otherwise
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            return ""
+        return v.item() if hasattr(v, "item") else v
+
+    values = worksheet.get_all_values()
+    header = values[0] if values else ["year"] + list(updated_df.columns)
+    year_col, name_col = header.index("year"), header.index("short_name")
+    year = str(int(selected_year))
+
+    # sheet row number(s) of each short_name for this year (values come back as strings)
+    sheet_rows = {}
+    for i, row in enumerate(values[1:], start=2):
+        if len(row) > max(year_col, name_col) and row[year_col] == year:
+            sheet_rows.setdefault(row[name_col], []).append(i)
+
+    table = updated_df.set_index("short_name")
+    updates, new_rows = [], {}
+    for short_name, column in dict.fromkeys(edited_cells):  # de-duplicated, in edit order
+        if short_name not in table.index or column not in header:
+            continue
+        if short_name in sheet_rows:
+            for i in sheet_rows[short_name]:
+                updates.append({"range": rowcol_to_a1(i, header.index(column) + 1), "values": [[cell(table.at[short_name, column])]]})
+        elif short_name not in new_rows:
+            new_rows[short_name] = [int(selected_year) if col == "year" else short_name if col == "short_name"
+                                    else cell(table.at[short_name, col]) if col in table.columns else "" for col in header]
+
+    if updates:
+        worksheet.batch_update(updates)
+    if new_rows:
+        if values:
+            worksheet.append_rows(list(new_rows.values()))
+        else:
+            worksheet.update("A1", [header] + list(new_rows.values()))  # blank tab: header row first
@@ -0,0 +1,70 @@
+# Excel style colour scales for the peer heat maps, worked out for the whole table in one numpy pass.
+# Styler.background_gradient(axis=1) runs matplotlib row by row and builds one CSS string per cell.
+# That was fine for 5 peers but it scales with rows x peers. Here the colormap is sampled once into
+# a lookup table of CSS strings, and every cell just indexes into it.
+# The colours are the same as background_gradient's: same colormap bins, same dark / light text switch.
+
+import warnings
+
+import numpy as np
+import matplotlib.colors as mcolors
+
+TEXT_COLOR_THRESHOLD = 0.408  # background_gradient's default: darker backgrounds get light text
+
+
+def _relative_luminance(rgba):
+    # W3C relative luminance of an (n x 4) rgba array, as pandas uses to pick the text colour
+    rgb = rgba[:, :3]
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def gradient_css_lookup(cmap):
+    """One 'background-color: ...;color: ...;' string per colormap bin (cmap.N of them)."""
+    rgba = cmap(np.arange(cmap.N))
+    backgrounds = [mcolors.rgb2hex(c) for c in rgba]
+    texts = np.where(_relative_luminance(rgba) < TEXT_COLOR_THRESHOLD, "#f1f1f1", "#000000")
+    return np.array([f"background-color: {bg};color: {text};" for bg, text in zip(backgrounds, texts)], dtype=object)
+
+
+def row_gradient_css(values, css_lookup):
+    """
+    CSS strings for a (rows x columns) block, each row scaled from its own min to its own max
+    (like Styler.background_gradient(axis=1)). Rows with one distinct value get the low end of the scale.
+    Missing values are left unstyled.
+    """
+    v = np.asarray(values, dtype=float)
+    out = np.full(v.shape, "", dtype=object)
+    if v.size == 0:
+        return out
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows
+        low = np.nanmin(v, axis=1, keepdims=True)
+        span = np.nanmax(v, axis=1, keepdims=True) - low
+        norm = np.where(span > 0, (v - low) / np.where(span > 0, span, 1), 0.0)
+
+    # same binning as calling the colormap on the normalised value
+    n = len(css_lookup)
+    valid = ~np.isnan(v)
+    bins = np.clip((norm[valid] * n).astype(int), 0, n - 1)
+    out[valid] = css_lookup[bins]
+    return out
+
+
+def diverging_css(values, css_lookup):
+    """
+    CSS strings for a whole table on one scale centred on 0 (for gaps, where the sign is the point):
+    -max|value| maps to the low end of the colormap, 0 to the middle and +max|value| to the top.
+    """
+    v = np.asarray(values, dtype=float)
+    out = np.full(v.shape, "", dtype=object)
+    valid = ~np.isnan(v)
+    if not valid.any():
+        return out
+
+    reach = np.abs(v[valid]).max()
+    norm = 0.5 + v[valid] / (2 * reach) if reach > 0 else np.full(valid.sum(), 0.5)
+    n = len(css_lookup)
+    out[valid] = css_lookup[np.clip((norm * n).astype(int), 0, n - 1)]
+    return out
@@ -0,0 +1,349 @@
+# Memory accounting for what the app keeps alive between reruns, so cache sizes (max_entries / ttl) can be tuned
+# and leaks caught before the container runs out of memory:
+#   st.cache_data      every cached function's stored entries (kept pickled, so the stored bytes are exact)
+#   st.cache_resource  every cached object (shared DataFrames, cubes, figures, the gspread client), deep-sized
+#   st.session_state   every session's keys, including widget values (the AgGrid responses), deep-sized
+# plus the process RSS for comparison.
+#
+# Growth: a background sampler takes a snapshot every SNAPSHOT_INTERVAL_S and keeps the last SNAPSHOT_WINDOW.
+# memory_growth() compares them per cache / session state and flags what keeps growing:
+#   "growing"    it went up in each of the last GROWTH_RUN snapshots, by GROWTH_MIN_MB or more in total
+#   "unbounded"  a cache with no max_entries and no ttl that keeps gaining entries (it never gives memory back)
+#
+# The sampler deep-sizes every cache and every session, so it only runs when asked for: a write-role user turns on
+# "Track memory growth" in the diagnostics panel, or the server is started with MEMORY_SAMPLER=1 in its environment.
+#
+# usage: start_sampler() / stop_sampler()                       -> the diagnostics panel toggle (perf_utils.py)
+#        cache_memory() / session_memory() / memory_growth()      -> the diagnostics panel
+#        print(memory_report())                                   -> the server log
+#
+# Reads Streamlit's cache and session registries directly (private attributes), so a Streamlit upgrade can
+# move them; everything here then reports empty tables rather than failing the page.
+
+import os
+import sys
+import threading
+import time
+import types
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_INTERVAL_S = 60
+SNAPSHOT_WINDOW = 360  # 6 hours at one snapshot a minute
+GROWTH_RUN = 5  # snapshots in a row that must each be higher
+GROWTH_MIN_MB = 5.0
+
+MAX_OBJECTS = 200_000  # deep_sizeof stops walking after this many objects (the gspread client alone is a big graph)
+
+MB = 1024 * 1024
+
+SAMPLER_ENV = "MEMORY_SAMPLER"  # MEMORY_SAMPLER=1 starts the sampler with the server instead of from the panel
+
+_snapshots = deque(maxlen=SNAPSHOT_WINDOW)
+_lock = threading.Lock()
+_sampler = None
+_sampler_stop = None  # threading.Event the running sampler waits on between snapshots
+
+
+## Deep size
+
+# shared by everything and not owned by any cache entry / session
+_SKIP_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType,
+    type(threading.Lock()), type(threading.RLock()),
+)
+
+
+def deep_sizeof(obj, limit=MAX_OBJECTS):
+    """
+    Bytes held by obj and everything it references, each object counted once.
+    DataFrames / Series / Index use pandas' own deep memory usage, numpy arrays their buffer size,
+    plotly figures their data + layout (not the validators every figure shares).
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SKIP_TYPES):
+            continue
+        seen.add(id(o))
+
+        if isinstance(o, (pd.DataFrame, pd.Series, pd.Index)):
+            size = o.memory_usage(deep=True)
+            total += int(size.sum()) if isinstance(size, pd.Series) else int(size)
+        elif isinstance(o, np.ndarray):
+            if o.base is not None:
+                total += sys.getsizeof(o)  # a view: the buffer belongs to its base
+                stack.append(o.base)
+            else:
+                total += o.nbytes
+                if o.dtype == object:
+                    stack.extend(o.ravel().tolist())
+        elif isinstance(o, (str, bytes, bytearray, int, float, bool, complex)) or o is None:
+            total += sys.getsizeof(o)
+        elif isinstance(o, dict):
+            total += sys.getsizeof(o)
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            total += sys.getsizeof(o)
+            stack.extend(o)
+        elif hasattr(o, "to_plotly_json") and hasattr(o, "_layout"):
+            total += sys.getsizeof(o)
+            stack.extend([o._data, o._layout])
+        else:
+            total += sys.getsizeof(o)
+            stack.extend(getattr(o, "__dict__", {}).values())
+            for slot in getattr(type(o), "__slots__", ()):
+                if isinstance(slot, str) and hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+## What is held
+
+def _cache_name(display_name, taken):
+    # "__main__.load_all_excels": every page script runs as __main__, so the second load_all_excels is "#2", ...
+    name = display_name.removeprefix("__main__.")
+    n = sum(1 for t in taken if t == name or t.startswith(name + " #"))
+    return name if n == 0 else f"{name} #{n + 1}"
+
+
+def cache_memory():
+    """One row per cached function: kind, function, entries, max_entries, ttl_s, mb (total), largest_mb."""
+    columns = ["kind", "function", "entries", "max_entries", "ttl_s", "mb", "largest_mb"]
+    rows, taken = [], set()
+    try:
+        from streamlit.runtime.caching.cache_data_api import _data_caches
+        from streamlit.runtime.caching.cache_resource_api import _resource_caches
+
+        with _data_caches._caches_lock:
+            data_caches = [c for caches in _data_caches._function_caches.values() for c in caches.values()]
+        with _resource_caches._caches_lock:
+            resource_caches = [c for caches in _resource_caches._function_caches.values() for c in caches.values()]
+    except (ImportError, AttributeError):
+        return pd.DataFrame(columns=columns)
+
+    for cache in data_caches:
+        storage = cache.storage
+        with storage._mem_cache_lock:
+            sizes = [len(entry) for entry in storage._mem_cache.values()]
+        name = _cache_name(cache.display_name, taken)
+        taken.add(name)
+        rows.append(("cache_data", name, len(sizes), storage.max_entries, storage.ttl_seconds,
+                     sum(sizes) / MB, max(sizes, default=0) / MB))
+
+    for cache in resource_caches:
+        with cache._mem_cache_lock:
+            values = [result.value for result in cache._mem_cache.values()]
+        sizes = [deep_sizeof(value) for value in values]
+        name = _cache_name(cache.display_name, taken)
+        taken.add(name)
+        rows.append(("cache_resource", name, len(sizes), cache.max_entries, cache.ttl_seconds,
+                     sum(sizes) / MB, max(sizes, default=0) / MB))
+
+    df = pd.DataFrame(rows, columns=columns)
+    # streamlit stores "no limit" as infinity
+    df[["max_entries", "ttl_s"]] = df[["max_entries", "ttl_s"]].replace(np.inf, np.nan)
+    return df.sort_values("mb", ascending=False, ignore_index=True)
+
+
+def _sessions():
+    try:
+        from streamlit.runtime import Runtime
+
+        if not Runtime.exists():
+            return []
+        return Runtime.instance()._session_mgr.list_sessions()
+    except (ImportError, AttributeError, RuntimeError):
+        return []
+
+
+def session_memory():
+    """One row per session / key: session (id prefix), role, active, key, mb. Largest first."""
+    columns = ["session", "role", "active", "key", "mb"]
+    rows = []
+    for info in _sessions():
+        try:
+            session_id, active = info.session.id[:8], info.client is not None
+            state = info.session.session_state
+            names = state._key_id_mapper.id_key_mapping  # widget id -> the key the page gave it
+            keys = list(state._keys())
+        except (AttributeError, KeyError):
+            return pd.DataFrame(columns=columns)
+        except RuntimeError:
+            continue  # the session's script is changing its state right now; it is picked up next time
+        try:
+            role = state["role"] if "role" in keys else None
+        except (RuntimeError, KeyError):
+            continue
+        for key in keys:
+            try:
+                value = state[key]
+            except (KeyError, RuntimeError):
+                continue
+            rows.append((session_id, role, active, names.get(key, key), deep_sizeof(value) / MB))
+    df = pd.DataFrame(rows, columns=columns)
+    return df.sort_values("mb", ascending=False, ignore_index=True)
+
+
+def rss_mb():
+    # resident memory of this process (Linux); None elsewhere
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+## Snapshots and growth
+
+def take_snapshot():
+    """Records the size of every cache, the session state total and the RSS now. Returns the snapshot."""
+    caches = cache_memory()
+    sessions = session_memory()
+    components = {f"{kind} · {name}": mb for kind, name, mb in caches[["kind", "function", "mb"]].itertuples(index=False)}
+    components["session_state"] = float(sessions["mb"].sum())
+    snapshot = {
+        "at": time.time(),
+        "rss_mb": rss_mb(),
+        "sessions": int(sessions["session"].nunique()),
+        "components": components,
+        "entries": {f"{kind} · {name}": n for kind, name, n in caches[["kind", "function", "entries"]].itertuples(index=False)},
+        "unbounded": {
+            f"{kind} · {name}"
+            for kind, name, max_entries, ttl in caches[["kind", "function", "max_entries", "ttl_s"]].itertuples(index=False)
+            if pd.isna(max_entries) and pd.isna(ttl)
+        },
+    }
+    with _lock:
+        _snapshots.append(snapshot)
+    return snapshot
+
+
+def start_sampler(interval_s=SNAPSHOT_INTERVAL_S):
+    """Starts the background snapshot thread (one per process; does nothing while it runs)."""
+    global _sampler, _sampler_stop
+    with _lock:
+        if _sampler is not None:
+            return
+        _sampler_stop = threading.Event()
+        _sampler = threading.Thread(target=_sample, args=(interval_s, _sampler_stop), name="memory-sampler", daemon=True)
+        _sampler.start()
+
+
+def stop_sampler():
+    """Stops the background snapshot thread after its current snapshot. The kept snapshots stay."""
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            return
+        _sampler_stop.set()
+        _sampler = None
+
+
+def sampler_running():
+    with _lock:
+        return _sampler is not None
+
+
+def sampler_enabled_by_env():
+    return os.environ.get(SAMPLER_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+def _sample(interval_s, stop):
+    while not stop.is_set():
+        try:
+            take_snapshot()
+        except Exception as err:  # a sampler that dies quietly is worse than a line in the log
+            print(f"⚠️ memory snapshot failed: {err!r}", flush=True)
+        stop.wait(interval_s)
+
+
+def latest_totals():
+    """MB per kind in the latest snapshot (for status lines / the load test), {} before the first one."""
+    with _lock:
+        if not _snapshots:
+            return {}
+        snapshot = _snapshots[-1]
+    totals = {"rss": snapshot["rss_mb"], "cache_data": 0.0, "cache_resource": 0.0, "session_state": 0.0}
+    for name, mb in snapshot["components"].items():
+        totals[name.split(" · ")[0]] += mb
+    totals["sessions"] = snapshot["sessions"]
+    return totals
+
+
+def memory_growth():
+    """
+    One row per cache / session state / RSS over the kept snapshots: first_mb, last_mb, change_mb, mb_per_hour,
+    entries and a flag ("growing", "unbounded" or ""). Flagged rows first, then biggest change.
+    """
+    columns = ["component", "first_mb", "last_mb", "change_mb", "mb_per_hour", "entries", "flag"]
+    with _lock:
+        snapshots = list(_snapshots)
+    if not snapshots:
+        return pd.DataFrame(columns=columns)
+
+    rows = []
+    names = {"process RSS"} | {name for s in snapshots for name in s["components"]}
+    for name in names:
+        points = [
+            (s["at"], s["rss_mb"] if name == "process RSS" else s["components"][name], s["entries"].get(name))
+            for s in snapshots
+            if (name == "process RSS" and s["rss_mb"] is not None) or name in s["components"]
+        ]
+        if not points:
+            continue
+        at, mb, entries = (np.array(column, dtype=float) for column in zip(*points))
+        per_hour = np.polyfit(at - at[0], mb, 1)[0] * 3600 if len(points) > 1 and at[-1] > at[0] else 0.0
+
+        recent = mb[-(GROWTH_RUN + 1):]
+        flag = ""
+        if len(recent) > GROWTH_RUN and (np.diff(recent) > 0).all() and recent[-1] - recent[0] >= GROWTH_MIN_MB:
+            flag = "growing"
+        recent_entries = entries[-(GROWTH_RUN + 1):]
+        if (name in snapshots[-1]["unbounded"] and len(recent_entries) > GROWTH_RUN
+                and (np.diff(recent_entries) > 0).all()):
+            flag = "unbounded"
+        rows.append((name, mb[0], mb[-1], mb[-1] - mb[0], per_hour, None if np.isnan(entries[-1]) else int(entries[-1]), flag))
+
+    df = pd.DataFrame(rows, columns=columns)
+    df["flagged"] = df["flag"] != ""
+    df = df.sort_values(["flagged", "change_mb"], ascending=False, ignore_index=True)
+    return df[columns]
+
+
+def reset_snapshots():
+    with _lock:
+        _snapshots.clear()
+
+
+def memory_report():
+    """Plain-text summary for the server log: totals, the biggest caches and session keys, anything flagged."""
+    snapshot = take_snapshot()
+    totals = latest_totals()
+    growth = memory_growth()
+    with _lock:
+        since = datetime.fromtimestamp(_snapshots[0]["at"]).strftime("%H:%M")
+    rss = f"{totals['rss']:.0f} MB" if totals["rss"] is not None else "n/a"
+    lines = [
+        f"🧠 Memory ({datetime.now():%Y-%m-%d %H:%M:%S}): RSS {rss}, cache_data {totals['cache_data']:.1f} MB, "
+        f"cache_resource {totals['cache_resource']:.1f} MB, session_state {totals['session_state']:.1f} MB "
+        f"across {snapshot['sessions']} sessions",
+        cache_memory().head(10).round(2).to_string(index=False),
+    ]
+    keys = session_memory()
+    if not keys.empty:
+        lines.append(keys.head(10).round(3).to_string(index=False))
+    flagged = growth[growth["flag"] != ""]
+    if not flagged.empty:
+        lines.append(f"⚠️ growing since {since}:")
+        lines.append(flagged.round(2).to_string(index=False))
+    return "\n".join(lines)
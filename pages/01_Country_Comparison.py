@@ -3,6 +3,9 @@ import pandas as pd
 from pathlib import Path
 import plotly.graph_objects as go
 import numpy as np
+from peer_stats import build_stats_cube, in_bucket, peer_view
+from rating_tables import FACTORS
+from perf_utils import reset_timings, timed, get_timings, StageClock, stage, diagnostics_panel
 
 ## Page content. how it shows up on the side bar. how the page is laid out. wide in this case.
 st.set_page_config(
@@ -13,6 +16,17 @@ st.set_page_config(
 ## Page title
 st.title("Country Comparison")
 
+## Per chart timings for this rerun (build + render), shown from the sidebar toggle at the bottom of the page
+reset_timings()
+
+# stage timings for the diagnostics panel: each stages.lap(...) books the time since the previous lap (see perf_utils.py)
+stages = StageClock("country_comparison")
+
+def plot_chart(container, fig, label):
+    # st.plotly_chart with its render (validation + serialization) time recorded under label
+    with timed(label, "render"):
+        container.plotly_chart(fig, use_container_width=True)
+
 ## Load the data. Cache so user only loads once upon use.
 
 BASE_DIR = Path(__file__).resolve().parent.parent #file --> refers to where current py lives. parent parent goes up two levels
@@ -30,16 +44,9 @@ def load_all_excels():
         pd.read_excel(BASE_DIR/"index_bbg_rating_live.xlsx", sheet_name="hard_code"),
     )
 df_transform, df_raw, coeff_index, rating_index, variable_index, country_index, public_rating_index = load_all_excels()
+stages.lap("excel_load")
 #.. to go up one level in the folder
 
-## Make copies of df_transform and df_raw. Add rounded rating col to help with fitering.
-
-rounded_transform = df_transform['rating'].round()
-df_transform.insert(3,'round_rating',rounded_transform)
-
-rounded_raw = df_raw['rating'].round()
-df_raw.insert(3,'round_rating',rounded_raw)
-
 ## Make country and year selection boxes
 
 st.markdown("""
@@ -78,50 +85,43 @@ rating_ranges = {
 
 #user selects key from rating_ranges dictionary
 selected_bucket = st.selectbox("Peer Group (based on Avg Public Rating)", list(rating_ranges.keys())) 
-#Lookup up lower and upper bound based on rating category selected (tuple unpacking)
-low, high = rating_ranges[selected_bucket] 
-
-## Now that selections are in place. Let us begin the filtering process to cut down our df to size
 
-#filter both raw and transform dfs based on year
-
-df_transform_filter = df_transform[df_transform["year"] == selected_year]
-df_raw_filter = df_raw[df_raw["year"] == selected_year]
-
-#and then filter further (note new df names w _filter) by narrowing down the rating range
-df_transform_filter = df_transform_filter[df_transform_filter['round_rating'].between(low, high)]
-df_raw_filter = df_raw_filter[df_raw_filter['round_rating'].between(low, high)]
+## Now that selections are in place, look up the peer statistics instead of filtering + recomputing them.
+## The cube (see peer_stats.py) holds sorted values, percentiles and bin edges for every year x bucket x variable.
+## It is built once for the whole server, so changing the country recomputes nothing.
 
 #select Row based on year and country
 selected_row_transform = df_transform[(df_transform['name'] == selected_name) & (df_transform['year'] == selected_year)]
 selected_row_raw = df_raw[(df_raw['name'] == selected_name) & (df_raw['year'] == selected_year)]
 
-#check to see if selected row is in the filtered dfs, if not apppend it in
-#we do this because sometimes we want to compare a country against a group that higher / lower rated than it
+## Peer statistics cubes: every year x peer bucket x factor (transform data) / variable (raw data).
+## Built once and shared by every session (cache_resource hands back the same object instead of a copy;
+## the page only ever reads from it)
 
-mask_transform = (
-    (df_transform_filter['name'] == selected_name) &
-    (df_transform_filter['year'] == selected_year)
-)
-if not mask_transform.any():
-    df_transform_filter = pd.concat([df_transform_filter, selected_row_transform], ignore_index=True)
+@st.cache_resource
+def load_stats_cubes():
+    raw_vars = [c for c in df_raw.select_dtypes("number").columns if c not in ("year", "rating")]
+    return (
+        build_stats_cube(df_transform, rating_ranges, FACTORS),
+        build_stats_cube(df_raw, rating_ranges, raw_vars),
+    )
 
-mask_raw = (
-    (df_raw_filter['name'] == selected_name) &
-    (df_raw_filter['year'] == selected_year)
-)
-if not mask_raw.any():
-    df_raw_filter = pd.concat([df_raw_filter, selected_row_raw], ignore_index=True)
+factor_cube, variable_cube = load_stats_cubes()
+stages.lap("stats_cubes")
 
+#sometimes we want to compare a country against a group that higher / lower rated than it.
+#in that case the country gets added to the peers (peer_view handles this)
+country_in_bucket = in_bucket(selected_row_raw.iloc[0]['rating'], rating_ranges, selected_bucket)
 
-df_transform_filter = df_transform_filter.reset_index(drop=True)
-df_raw_filter = df_raw_filter.reset_index(drop=True)
+def peers_for(short_var, cube=variable_cube, selected_row=selected_row_raw):
+    # peer statistics for one chart + the selected country's percentile rank
+    return peer_view(cube, selected_year, selected_bucket, short_var,
+                     selected_row.iloc[0][short_var], country_in_bucket)
 
 #writes out how many countriss are in the selected bucket
-st.write(f"{len(df_raw_filter)} countries in bucket {selected_bucket}")
+n_in_bucket = variable_cube[(selected_year, selected_bucket, "ngdp_pc")]["n_rows"] + (0 if country_in_bucket else 1)
+st.write(f"{n_in_bucket} countries in bucket {selected_bucket}")
 
-#st.dataframe(df_transform_filter) #unlock the if you wanna test to see the df rendering properly
-#st.dataframe(df_raw_filter)
 
 ## Sub Header --> 11 rating factors
 st.subheader("Percentile Ranking Across 11 Standardized Rating Factors")
@@ -220,8 +220,7 @@ fig_factor = go.Figure()
 for factor in factors:
     # look up the long label once
     long_label = factors_dict[factor]
-    vals = df_transform_filter[factor]
-    p5, p25, p50, p75, p95 = np.percentile(vals, [5,25,50,75,95])
+    p5, p25, p50, p75, p95 = peers_for(factor, factor_cube, selected_row_transform)["percentiles"]
 
     fig_factor.add_trace(go.Box(
         x=[long_label], # ← assign the box to the factor category
@@ -280,43 +279,47 @@ fig_factor.update_yaxes(
 )
 
 #5) In Streamlit, render full-width
-st.plotly_chart(fig_factor, use_container_width=True)
+plot_chart(st, fig_factor, "factor_box")
+stages.lap("factor_chart")
 
 ####----Define histogram function for rapid chart building---####
 
-def build_variable_histogram(
-    short_var: str,
-    df_peers: pd.DataFrame,
-    selected_row: pd.Series,
-    selected_name: str,
-    selected_bucket: str,
-    variable_dict: dict,
-    bins_rule: str = "fd", #or "sturges"
-    format_map = dict #custom formatting dict
-):
+## The peer part of each histogram (bars, percentile lines, axes) only depends on year x bucket x variable,
+## so it is built once and cached as a plain figure dict (st.plotly_chart takes dicts as is).
+## Per rerun we only drop in the selected country's red line and the title.
+## Each chart's build + render time is recorded with perf_utils.timed (see the sidebar toggle at the bottom).
+
+def overlay_country(base, my_val, selected_name, title_text):
     """
-    Plots a histogram of `short_var` for peers (df_peers),
-    with FD‐optimal bins, dotted percentile lines, a red line for the selected country,
-    and a two‐line HTML title including the country’s value & percentile.
+    Copy of a cached base figure with the country line (always the last shape / annotation) moved to my_val.
+    Only the layout pieces we change are copied; the cached peer traces are shared and never modified.
     """
-    import numpy as np
-    import pandas as pd
-    import plotly.graph_objects as go
-    import streamlit as st
+    layout = dict(base["layout"])
+    shapes = list(layout["shapes"])
+    annotations = list(layout["annotations"])
+    shapes[-1] = {**shapes[-1], "x0": my_val, "x1": my_val}
+    annotations[-1] = {**annotations[-1], "x": my_val, "text": selected_name}
+    layout.update(shapes=shapes, annotations=annotations, title={"text": title_text})
+    return {**base, "layout": layout}
 
-    # 1) Data & label lookup
-    vals = df_peers[short_var].dropna()
-    long_var = variable_dict.get(short_var, short_var)
 
-    # 2) Compute bin edges via the chosen rule (e.g. "fd" or "sturges")
-    edges   = np.histogram_bin_edges(vals, bins=bins_rule)
+@st.cache_resource(max_entries=512)
+def base_variable_histogram(short_var, selected_year, selected_bucket, bins_rule, extra_val, _peers, _variable_dict):
+    """
+    Peer part of build_variable_histogram, keyed by (variable, year, bucket, bins rule, extra_val).
+    extra_val is the country added to the peers when it sits outside the bucket (None otherwise).
+    The _ arguments are not part of the cache key.
+    """
+    vals = _peers["sorted"]
+    long_var = _variable_dict.get(short_var, short_var)
+
+    # Bin edges (precomputed with the FD rule in the stats cube)
+    edges   = _peers["edges"] if bins_rule == "fd" else np.histogram_bin_edges(vals, bins=bins_rule)
     bin_size = edges[1] - edges[0]
     start, end = edges[0], edges[-1]
 
-    # 3) Percentiles
-    p5, p25, p50, p75, p95 = np.percentile(vals, [5,25,50,75,95])
+    p5, p25, p50, p75, p95 = _peers["percentiles"]
 
-    # 4) Build the figure
     fig = go.Figure()
     fig.add_trace(go.Histogram(
         x=vals,
@@ -326,7 +329,7 @@ def build_variable_histogram(
         name="Peers"
     ))
 
-    # 5) Dotted percentile lines
+    # Dotted percentile lines
     for x_val, label in [(p5,"5th"), (p25,"25th"), (p50,"Median"),
                          (p75,"75th"), (p95,"95th")]:
         fig.add_vline(
@@ -336,17 +339,16 @@ def build_variable_histogram(
             annotation_position="top left"
         )
 
-    # 6) Red country line
-    my_val = selected_row[short_var]
+    # Red country line. placeholder position, overlay_country moves it to the selected country
     fig.add_vline(
-        x=my_val,
+        x=0,
         line=dict(color="red", width=3),
-        annotation_text=selected_name,
+        annotation_text="",
         annotation_position = "bottom right",
         annotation_font_color = "red"
     )
 
-    # 7) Axis styling
+    # Axis styling
     fig.update_xaxes(
         title_text=long_var,
         title_font_color="black",
@@ -362,62 +364,56 @@ def build_variable_histogram(
         linecolor="black"
     )
 
-    # 8) Compute country percentile
-    percentile = np.mean(vals <= my_val) * 100
-
-    # 9) Title with inline red line
-
-    # then, given your short_var & my_val:
-    fmt = format_map.get(short_var, "{value}")
-    formatted_val = fmt.format(value=my_val)
-    
-    # and in your title line:
-    title_text = (
-    f"{selected_name} vs {selected_bucket} peers<br>"
-    f"<span style='color:red'>{selected_name}: "
-    f"{formatted_val} ({percentile:.0f}th percentile)</span>")
-
     fig.update_layout(
-        title=title_text,
         template="simple_white",
         margin=dict(t=80, b=40, l=40, r=20),
         showlegend=False)
-    
-    # 10) return a fig object, which we then input into st.plotly to plot where we want it!
-    return fig
 
-def build_dummy_histogram(
+    return fig.to_dict()
+
+
+def build_variable_histogram(
     short_var: str,
-    df_peers,
-    selected_row,
+    peers: dict,
+    selected_row: pd.Series,
     selected_name: str,
+    selected_year: int,
     selected_bucket: str,
     variable_dict: dict,
-    bins_rule: str = "fd",
-    format_map: dict = None
-) -> go.Figure:
+    bins_rule: str = "fd", #or "sturges"
+    format_map = dict #custom formatting dict
+):
     """
-    Builds a Plotly histogram figure for a given variable.
-    
-    Parameters:
-    - short_var: column name to plot (short code)
-    - df_peers: peers DataFrame, already filtered
-    - selected_row: pd.Series for the selected country (one row)
-    - selected_name: displayed country name
-    - selected_bucket: bucket label (e.g. "BBB", "ALL")
-    - variable_dict: mapping short_var -> long display name
-    - bins_rule: "fd" (Freedman–Diaconis), "sturges", or "dummy"
-    - format_map: mapping short_var -> Python format string
-    
-    Returns:
-    - Plotly Figure
+    Plots a histogram of `short_var` for peers (peer_view statistics),
+    with FD‐optimal bins, dotted percentile lines, a red line for the selected country,
+    and a two‐line HTML title including the country’s value & percentile.
+    Returns a figure dict: the cached peer figure with the country overlaid.
     """
-   
-    # Extract peers values and display name
-    vals = df_peers[short_var].dropna()
-    long_var = variable_dict.get(short_var, short_var)
+    with timed(short_var, "build"):
+        base = base_variable_histogram(short_var, selected_year, selected_bucket, bins_rule, peers["extra"], peers, variable_dict)
+
+        my_val = selected_row[short_var]
+
+        # Country percentile (searchsorted rank from peer_view)
+        percentile = peers["rank"]
+
+        # Title with inline red line
+        fmt = format_map.get(short_var, "{value}")
+        formatted_val = fmt.format(value=my_val)
+        title_text = (
+        f"{selected_name} vs {selected_bucket} peers<br>"
+        f"<span style='color:red'>{selected_name}: "
+        f"{formatted_val} ({percentile:.0f}th percentile)</span>")
+
+        return overlay_country(base, my_val, selected_name, title_text)
+
+
+@st.cache_resource(max_entries=256)
+def base_dummy_histogram(short_var, selected_year, selected_bucket, bins_rule, extra_val, _peers, _variable_dict):
+    """Peer part of build_dummy_histogram. Same cache key as base_variable_histogram."""
+    vals = _peers["sorted"]
+    long_var = _variable_dict.get(short_var, short_var)
 
-    # Start a new figure
     fig = go.Figure()
 
     if bins_rule.lower() == "dummy":
@@ -440,7 +436,7 @@ def build_dummy_histogram(
         ))
     else:
         # Continuous histogram with FD or Sturges rule
-        edges = np.histogram_bin_edges(vals, bins=bins_rule)
+        edges = _peers["edges"] if bins_rule == "fd" else np.histogram_bin_edges(vals, bins=bins_rule)
         bin_size = edges[1] - edges[0]
         start, end = edges[0], edges[-1]
         fig.add_trace(go.Histogram(
@@ -450,13 +446,12 @@ def build_dummy_histogram(
             opacity=0.75,
             name="Peers"
         ))
-        
-    # Reference line for the selected country
-    my_val = selected_row[short_var]
+
+    # Reference line for the selected country. placeholder position, moved by overlay_country
     fig.add_vline(
-        x=my_val,
+        x=0,
         line=dict(color="red", width=3),
-        annotation_text=selected_name,
+        annotation_text="",
         annotation_position="bottom right",
         annotation_font_color="red"
     )
@@ -478,297 +473,386 @@ def build_dummy_histogram(
         showline=True,
         linecolor="black"
     )
-
-    # Compute and format the selected country’s value & percentile
-    percentile = np.mean(vals <= my_val) * 100
-    fmt_str = format_map.get(short_var, "{value}")
-    formatted_val = fmt_str.format(value=my_val)
-
-    # Build two-line HTML title
-    title_text = (
-        f"{selected_name} vs {selected_bucket} peers<br>"
-        f"<span style='color:red'>{selected_name}: {formatted_val} "
-        f"({percentile:.0f}th percentile)</span>"
-    )
     fig.update_layout(
-        title=title_text,
         template="simple_white",
         margin=dict(t=80, b=40, l=40, r=20),
         showlegend=False
     )
 
-    return fig
-
-####----Wealth----####
-st.subheader("Wealth Factor")
-
-fig_ngdp_pc = build_variable_histogram(
-    short_var="ngdp_pc",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_ngdp_pc,use_container_width=True)
-
-####----Size----####
-st.subheader("Size Factor")
-
-fig_ngdp = build_variable_histogram(
-    short_var="ngdp",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_ngdp,use_container_width=True)
-
-####----Growth----####
-st.subheader("Growth Factor")
-
-fig_growth_avg = build_variable_histogram(
-    short_var="growth_avg",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_growth_avg,use_container_width=True)
-
-####----Inflation----####
-st.subheader("Inflation Factor")
-
-fig_inf_avg = build_variable_histogram(
-    short_var="inf_avg",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_inf_avg,use_container_width=True)
-
-####----Default----####
-st.subheader("Default History Factor")
-
-fig_default = build_dummy_histogram(
-    short_var="default_hist",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "dummy",
-    format_map = format_map)
-
-fig_decay = build_dummy_histogram(
-    short_var="default_decay",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "ten",
-    format_map = format_map)
-
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_default, use_container_width=True)
-col2.plotly_chart(fig_decay, use_container_width=True)
-
-####----Governance----####
-st.subheader("Governance Factor")
-
-fig_voice = build_variable_histogram(
-    short_var="voice_acct",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_pol = build_variable_histogram(
-    short_var="pol_stab",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_gov = build_variable_histogram(
-    short_var="gov_eff",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_reg = build_variable_histogram(
-    short_var="reg_qual",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_law = build_variable_histogram(
-    short_var="rule_law",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_corrupt = build_variable_histogram(
-    short_var="cont_corrupt",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_voice, use_container_width=True)
-col2.plotly_chart(fig_pol, use_container_width=True)
-
-col3, col4 = st.columns(2)
-col3.plotly_chart(fig_gov, use_container_width=True)
-col4.plotly_chart(fig_reg, use_container_width=True)
-
-col5, col6 = st.columns(2)
-col5.plotly_chart(fig_law, use_container_width=True)
-col6.plotly_chart(fig_corrupt, use_container_width=True)
-
-####----Fiscal Performance----####
-st.subheader("Fiscal Performance Factor")
-
-fig_fb = build_variable_histogram(
-    short_var="fb_avg",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_rev = build_variable_histogram(
-    short_var="gov_rev_gdp",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_ir = build_variable_histogram(
-    short_var="ir_rev",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_fb,use_container_width=True)
-
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_rev, use_container_width=True)
-col2.plotly_chart(fig_ir, use_container_width=True)
-
-###----Government Debt----####
-st.subheader("Government Debt Factor")
-
-fig_debt = build_variable_histogram(
-    short_var="gov_debt_gdp",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_debt,use_container_width=True)
-
-####----External Performance----####
-st.subheader("External Performance Factor")
-
-fig_cab = build_variable_histogram(
-    short_var="cab_avg",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-st.plotly_chart(fig_cab,use_container_width=True)
-
-####----FX Reserves----####
-st.subheader("FX Reserves Factor")
-
-fig_reserve = build_variable_histogram(
-    short_var="reserve_gdp",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-fig_import = build_variable_histogram(
-    short_var="import_cover",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "fd",
-    format_map = format_map)
-
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_reserve, use_container_width=True)
-col2.plotly_chart(fig_import, use_container_width=True)
-
-####----Reserve Currency Status----####
-st.subheader("Reserve Currency Factor")
-
-fig_status = build_dummy_histogram(
-    short_var="reserve_fx",
-    df_peers = df_raw_filter,
-    selected_row = selected_row_raw.iloc[0],
-    selected_name = selected_name,
-    selected_bucket = selected_bucket,
-    variable_dict = variable_dict,
-    bins_rule = "dummy",
-    format_map = format_map)
-
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_status, use_container_width=True)
+    return fig.to_dict()
+
+
+def build_dummy_histogram(
+    short_var: str,
+    peers: dict,
+    selected_row,
+    selected_name: str,
+    selected_year: int,
+    selected_bucket: str,
+    variable_dict: dict,
+    bins_rule: str = "fd",
+    format_map: dict = None
+) -> dict:
+    """
+    Builds a Plotly histogram figure for a given variable.
+    
+    Parameters:
+    - short_var: column name to plot (short code)
+    - peers: peer statistics from peer_view (sorted values, bin edges, percentile rank)
+    - selected_row: pd.Series for the selected country (one row)
+    - selected_name: displayed country name
+    - selected_year: year (part of the figure cache key)
+    - selected_bucket: bucket label (e.g. "BBB", "ALL")
+    - variable_dict: mapping short_var -> long display name
+    - bins_rule: "fd" (Freedman–Diaconis), "sturges", or "dummy"
+    - format_map: mapping short_var -> Python format string
+    
+    Returns:
+    - Plotly figure dict (cached peer figure with the country overlaid)
+    """
+    with timed(short_var, "build"):
+        base = base_dummy_histogram(short_var, selected_year, selected_bucket, bins_rule, peers["extra"], peers, variable_dict)
+
+        my_val = selected_row[short_var]
+
+        # Format the selected country’s value & percentile (searchsorted rank from peer_view)
+        percentile = peers["rank"]
+        fmt_str = format_map.get(short_var, "{value}")
+        formatted_val = fmt_str.format(value=my_val)
+
+        # Build two-line HTML title
+        title_text = (
+            f"{selected_name} vs {selected_bucket} peers<br>"
+            f"<span style='color:red'>{selected_name}: {formatted_val} "
+            f"({percentile:.0f}th percentile)</span>"
+        )
+
+        return overlay_country(base, my_val, selected_name, title_text)
+
+####----Pillar sections----####
+## Each rating pillar's charts sit in their own expander and are only built when the expander is open.
+## The expander lives inside a fragment, so opening / closing one reruns just that section instead of the whole page,
+## and closed sections cost nothing (no figures built, nothing sent to the browser).
+
+@st.fragment
+def pillar_section(label, key, render_charts, expanded=False):
+    section = st.expander(label, expanded=expanded, key=f"pillar_{key}", on_change="rerun")
+    if section.open:
+        with section, stage("country_comparison", f"charts_{key}"):
+            render_charts()
+
+
+def real_economy_charts():
+    ####----Wealth----####
+    st.subheader("Wealth Factor")
+
+    fig_ngdp_pc = build_variable_histogram(
+        short_var="ngdp_pc",
+        peers = peers_for("ngdp_pc"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_ngdp_pc, "ngdp_pc")
+
+    ####----Size----####
+    st.subheader("Size Factor")
+
+    fig_ngdp = build_variable_histogram(
+        short_var="ngdp",
+        peers = peers_for("ngdp"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_ngdp, "ngdp")
+
+    ####----Growth----####
+    st.subheader("Growth Factor")
+
+    fig_growth_avg = build_variable_histogram(
+        short_var="growth_avg",
+        peers = peers_for("growth_avg"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_growth_avg, "growth_avg")
+
+    ####----Inflation----####
+    st.subheader("Inflation Factor")
+
+    fig_inf_avg = build_variable_histogram(
+        short_var="inf_avg",
+        peers = peers_for("inf_avg"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_inf_avg, "inf_avg")
+
+def institutions_charts():
+    ####----Default----####
+    st.subheader("Default History Factor")
+
+    fig_default = build_dummy_histogram(
+        short_var="default_hist",
+        peers = peers_for("default_hist"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "dummy",
+        format_map = format_map)
+
+    fig_decay = build_dummy_histogram(
+        short_var="default_decay",
+        peers = peers_for("default_decay"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "ten",
+        format_map = format_map)
+
+    col1, col2 = st.columns(2)
+    plot_chart(col1, fig_default, "default_hist")
+    plot_chart(col2, fig_decay, "default_decay")
+
+    ####----Governance----####
+    st.subheader("Governance Factor")
+
+    fig_voice = build_variable_histogram(
+        short_var="voice_acct",
+        peers = peers_for("voice_acct"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_pol = build_variable_histogram(
+        short_var="pol_stab",
+        peers = peers_for("pol_stab"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_gov = build_variable_histogram(
+        short_var="gov_eff",
+        peers = peers_for("gov_eff"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_reg = build_variable_histogram(
+        short_var="reg_qual",
+        peers = peers_for("reg_qual"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_law = build_variable_histogram(
+        short_var="rule_law",
+        peers = peers_for("rule_law"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_corrupt = build_variable_histogram(
+        short_var="cont_corrupt",
+        peers = peers_for("cont_corrupt"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    col1, col2 = st.columns(2)
+    plot_chart(col1, fig_voice, "voice_acct")
+    plot_chart(col2, fig_pol, "pol_stab")
+
+    col3, col4 = st.columns(2)
+    plot_chart(col3, fig_gov, "gov_eff")
+    plot_chart(col4, fig_reg, "reg_qual")
+
+    col5, col6 = st.columns(2)
+    plot_chart(col5, fig_law, "rule_law")
+    plot_chart(col6, fig_corrupt, "cont_corrupt")
+
+def fiscal_charts():
+    ####----Fiscal Performance----####
+    st.subheader("Fiscal Performance Factor")
+
+    fig_fb = build_variable_histogram(
+        short_var="fb_avg",
+        peers = peers_for("fb_avg"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_rev = build_variable_histogram(
+        short_var="gov_rev_gdp",
+        peers = peers_for("gov_rev_gdp"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_ir = build_variable_histogram(
+        short_var="ir_rev",
+        peers = peers_for("ir_rev"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_fb, "fb_avg")
+
+    col1, col2 = st.columns(2)
+    plot_chart(col1, fig_rev, "gov_rev_gdp")
+    plot_chart(col2, fig_ir, "ir_rev")
+
+    ###----Government Debt----####
+    st.subheader("Government Debt Factor")
+
+    fig_debt = build_variable_histogram(
+        short_var="gov_debt_gdp",
+        peers = peers_for("gov_debt_gdp"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_debt, "gov_debt_gdp")
+
+def external_charts():
+    ####----External Performance----####
+    st.subheader("External Performance Factor")
+
+    fig_cab = build_variable_histogram(
+        short_var="cab_avg",
+        peers = peers_for("cab_avg"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    plot_chart(st, fig_cab, "cab_avg")
+
+    ####----FX Reserves----####
+    st.subheader("FX Reserves Factor")
+
+    fig_reserve = build_variable_histogram(
+        short_var="reserve_gdp",
+        peers = peers_for("reserve_gdp"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    fig_import = build_variable_histogram(
+        short_var="import_cover",
+        peers = peers_for("import_cover"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "fd",
+        format_map = format_map)
+
+    col1, col2 = st.columns(2)
+    plot_chart(col1, fig_reserve, "reserve_gdp")
+    plot_chart(col2, fig_import, "import_cover")
+
+    ####----Reserve Currency Status----####
+    st.subheader("Reserve Currency Factor")
+
+    fig_status = build_dummy_histogram(
+        short_var="reserve_fx",
+        peers = peers_for("reserve_fx"),
+        selected_row = selected_row_raw.iloc[0],
+        selected_name = selected_name,
+        selected_year = selected_year,
+        selected_bucket = selected_bucket,
+        variable_dict = variable_dict,
+        bins_rule = "dummy",
+        format_map = format_map)
+
+    col1, col2 = st.columns(2)
+    plot_chart(col1, fig_status, "reserve_fx")
+
+## Pillar sections. Only the open ones build and send their charts
+
+pillar_section("REAL ECONOMY PILLAR (25%)", "real_economy", real_economy_charts, expanded=True)
+pillar_section("MONETARY & INSTITUTIONS PILLAR (44%)", "institutions", institutions_charts, expanded=False)
+pillar_section("FISCAL PILLAR (17%)", "fiscal", fiscal_charts, expanded=False)
+pillar_section("EXTERNAL PILLAR (14%)", "external", external_charts, expanded=False)
+
+####----Chart timings----####
+## build = peer figure lookup + country overlay, render = st.plotly_chart (validation + serialization)
+if st.sidebar.toggle("⏱️ Show chart timings", key="show_chart_timings"):
+    timings_df = pd.DataFrame(get_timings()).T.reindex(columns=["build", "render"])
+    timings_df["total"] = timings_df.sum(axis=1)
+    st.sidebar.dataframe(timings_df.round(1), use_container_width=True)
+    st.sidebar.caption(f"All charts: {timings_df['total'].sum():.0f} ms")
+
+diagnostics_panel()
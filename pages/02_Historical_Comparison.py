@@ -5,6 +5,10 @@ import plotly.graph_objects as go
 import numpy as np
 import re
 
+from series_store import build_series_store, get_series
+from peer_search import build_distance_index, coefficient_weights, nearest_peers
+from perf_utils import StageClock, stage, diagnostics_panel
+
 ## Page content. how it shows up on the side bar. how the page is laid out. wide in this case.
 st.set_page_config(
     page_title="Historical Comparison",
@@ -14,6 +18,9 @@ st.set_page_config(
 ## Page title
 st.title("Historical Comparison")
 
+# stage timings for the diagnostics panel: each stages.lap(...) books the time since the previous lap (see perf_utils.py)
+stages = StageClock("historical_comparison")
+
 ## Load the data. Cache so user only loads once upon use.
 
 BASE_DIR = Path(__file__).resolve().parent.parent #file --> refers to where current py lives. parent parent goes up two levels
@@ -30,6 +37,7 @@ def load_all_excels():
         pd.read_excel(BASE_DIR/"index_bbg_rating_live.xlsx", sheet_name="hard_code"),
     )
 df_transform, df_raw, coeff_index, rating_index, variable_index, country_index, public_rating_index = load_all_excels()
+stages.lap("excel_load")
 
 factors = ["wealth_factor",
            "size_factor",
@@ -127,15 +135,68 @@ div[data-baseweb="select"] {
 </style>
 """, unsafe_allow_html=True)
 
+## Per-country time series for every chart, laid out once as (countries x years) arrays (see series_store.py).
+## Picking a country (or overlaying ten) is then a row lookup instead of filtering df_transform / df_raw on every rerun.
+
+@st.cache_resource
+def load_series_stores():
+    transform_store = build_series_store(df_transform, ["rating", "predicted_rating", "gap"])
+    raw_store = build_series_store(df_raw, list(variable_dict))
+    return transform_store, raw_store
+transform_store, raw_store = load_series_stores()
+stages.lap("series_stores")
+
 ## Dropdown to select Country
 
 country_name = df_transform['name'].unique()
 selected_name = st.selectbox("Select Country", sorted(country_name))
 
-## Filter both df_transform and df_raw to include only the selected country
+## Optional overlay: up to MAX_OVERLAY countries on every chart, the selected country first
+
+MAX_OVERLAY = 12
 
-df_transform_filter = df_transform[df_transform["name"] == selected_name]
-df_raw_filter = df_raw[df_raw["name"] == selected_name]
+compare_names = st.multiselect(
+    "Overlay other countries (optional)",
+    sorted(country_name),
+    max_selections=MAX_OVERLAY - 1,
+    key="compare_names",
+    placeholder="Compare histories with…",
+)
+overlay_names = [selected_name] + [name for name in compare_names if name != selected_name]
+
+## Peer finder: overlay the countries closest to the selected one in factor / variable Z-score space for a year
+## (see peer_search.py). The distance matrix is built once per year / space / weighting and cached.
+
+@st.cache_resource(max_entries=64)
+def load_peer_index(year, space, weighted):
+    df_year = df_transform[df_transform["year"] == year]
+    weights = coefficient_weights(coeff_index, space) if weighted else None
+    return build_distance_index(df_year, space, weights)
+
+peer_spaces = {"11 factors": "factor", "20 constituent variables": "variable"}
+
+def overlay_found_peers(names):
+    # button callback. runs before the multiselect above is drawn on the rerun, so it can fill it in
+    st.session_state.compare_names = names
+
+with st.expander(f"🔎 Overlay the countries most similar to {selected_name}"):
+    finder_col_1, finder_col_2, finder_col_3 = st.columns([2, 3, 2])
+    peer_years = sorted(df_transform.loc[df_transform["name"] == selected_name, "year"].unique(), reverse=True)
+    peer_year = finder_col_1.selectbox("As of", peer_years, key="peer_year")
+    space_label = finder_col_2.radio("Compare on", list(peer_spaces), horizontal=True, key="peer_space")
+    n_similar = finder_col_3.number_input("How many", min_value=1, max_value=MAX_OVERLAY - 1, value=4, key="peer_k")
+    weighted = st.toggle("Weight by model coefficients (distance in rating notches)", value=True, key="peer_weighted")
+
+    stages.skip()
+    found = nearest_peers(load_peer_index(peer_year, peer_spaces[space_label], weighted), [selected_name], n_similar)
+    stages.lap("peer_finder")
+    st.caption(", ".join(f"{name} ({distance:.2f})" for name, distance in zip(found["name"], found["distance"])))
+    st.button(
+        "Overlay these countries",
+        key="overlay_found_peers",
+        on_click=overlay_found_peers,
+        args=(found["name"].tolist(),),
+    )
 
 ## Define Loomis Colors for use later
 
@@ -146,105 +207,161 @@ LS_darkgrey = "#91929B"
 LS_lightgrey = "#E9E9EB"
 LS_orange = "#EF7622"
 
-#st.dataframe(df_transform_filter)  ---> unlock if you want to check if your df is filtering properly
-#st.dataframe(df_raw_filter)  ---> unlock if you want to check if your df is filtering properly
+## Line colours for the overlaid countries. The selected country keeps LS dark blue on every chart,
+## the others take these in the order they were picked.
+OVERLAY_COLORS = [
+    LS_orange, LS_darkgrey, "#2CA02C", "#D62728", "#9467BD",
+    "#8C564B", "#E377C2", "#17BECF", "#BCBD22", "#7F7F7F", LS_lightblue,
+]
+
+def overlay_color(i, base_color):
+    return base_color if i == 0 else OVERLAY_COLORS[(i - 1) % len(OVERLAY_COLORS)]
 
 ####----Historical Credit Rating----####
 st.subheader("Sovereign Credit Rating Over The Years")
 
-# Initialize the Figure
-fig_rating = go.Figure()
-
-# Define x and y values
-x = df_transform_filter["year"]
-gaps = df_transform_filter["gap"]
-rating = df_transform_filter["rating"]
-model_rating = df_transform_filter["predicted_rating"]
-
-# 1) Predicted rating as line + markers
-fig_rating.add_trace(go.Scatter(
-    x=x,
-    y=model_rating,
-    mode="lines+markers",
-    name="Model Rating",
-    marker=dict(symbol="diamond", size=8, color = LS_darkblue),
-    line=dict(width=2, color = LS_darkblue),
-    hovertemplate="Predicted Rating: %{y:.2f}<extra></extra>"
-))
-
-# 2) Actual rating as line + markers
-fig_rating.add_trace(go.Scatter(
-    x=x,
-    y=rating,
-    mode="lines+markers",
-    name="Public Rating",
-    marker=dict(symbol="circle", size=8, color = LS_darkgrey),
-    line=dict(width=2, color = LS_darkgrey, dash = "dash")
-))
-
-# 3) Gap as bars
-
-# build a color per bar
-bar_colors = ['green' if g >= 0 else 'red' for g in gaps]
-
-fig_rating.add_trace(go.Bar(
-    x=x,
-    y=gaps,
-    name="Gap (Model Rating - Actual Rating)",
-    marker=dict(color=bar_colors),
-    opacity=0.6,
-    hovertemplate='Gap: %{y:.2f}<extra></extra>'
-))
-
-# A) annotation for Upgrade Pressure in that right margin above the x‐axis
-fig_rating.add_annotation(
-    xref="paper", x=1.15,    # 5% into right margin
-    yref="y", y=0,    # just above top of plot
-    text="⬆ Upgrade Pressure",
-    showarrow=False,
-    font=dict(color="green", size=14),
-    align="left",
-    yshift=10
-)
+def plot_rating_overlay(countries):
+    """
+    Model rating (solid) and public rating (dashed) for several countries on one WebGL chart.
+    The gap bars only make sense for one country, so the overlay leaves them out.
+    """
+    fig = go.Figure()
+    for i, country in enumerate(countries):
+        color = overlay_color(i, LS_darkblue)
+        years, model = get_series(transform_store, country, "predicted_rating")
+        _, public = get_series(transform_store, country, "rating")
+        fig.add_trace(go.Scattergl(
+            x=years,
+            y=model,
+            mode="lines+markers",
+            name=f"{country} Model Rating",
+            legendgroup=country,
+            marker=dict(symbol="diamond", size=7, color=color),
+            line=dict(width=3 if i == 0 else 2, color=color),
+            hovertemplate=f"{country}<br>Model Rating: %{{y:.2f}}<extra></extra>"
+        ))
+        fig.add_trace(go.Scattergl(
+            x=years,
+            y=public,
+            mode="lines+markers",
+            name=f"{country} Public Rating",
+            legendgroup=country,
+            marker=dict(symbol="circle", size=6, color=color),
+            line=dict(width=2, color=color, dash="dash"),
+            hovertemplate=f"{country}<br>Public Rating: %{{y:.2f}}<extra></extra>"
+        ))
 
-# B) annotation for Downgrade Pressure in that right margin below the x‐axis
-fig_rating.add_annotation(
-    xref="paper", x=1.173,    # 5% into right margin
-    yref="y", y=-0,    # just above top of plot
-    text="⬇ Downgrade Pressure",
-    showarrow=False,
-    font=dict(color="red", size=14),
-    align="left",
-    yshift=-10
-)
+    fig.update_layout(
+        title="How do model ratings compare with public ratings?",
+        template="plotly_white",
+        legend=dict(groupclick="togglegroup"),
+    )
+    fig.update_xaxes(title=dict(text="Year", font=dict(color="black")), tickfont=dict(color="black"))
+    fig.update_yaxes(
+        title_text="Rating (1 = D, 22 = AAA)",
+        title_font=dict(color="black"),
+        tickfont=dict(color="black"),
+        showline=True,
+        linecolor="black",
+    )
+    return fig
 
-# Layout tweaks
-fig_rating.update_layout(
-    title=f"How does {selected_name}'s model rating differ from its public rating?",
-    barmode="overlay",             # bars behind lines
-    template="plotly_white"
-)
+if len(overlay_names) > 1:
+    fig_rating = plot_rating_overlay(overlay_names)
+else:
+    # Initialize the Figure
+    fig_rating = go.Figure()
+
+    # Define x and y values
+    x, gaps = get_series(transform_store, selected_name, "gap")
+    _, rating = get_series(transform_store, selected_name, "rating")
+    _, model_rating = get_series(transform_store, selected_name, "predicted_rating")
+
+    # 1) Predicted rating as line + markers
+    fig_rating.add_trace(go.Scatter(
+        x=x,
+        y=model_rating,
+        mode="lines+markers",
+        name="Model Rating",
+        marker=dict(symbol="diamond", size=8, color = LS_darkblue),
+        line=dict(width=2, color = LS_darkblue),
+        hovertemplate="Predicted Rating: %{y:.2f}<extra></extra>"
+    ))
+
+    # 2) Actual rating as line + markers
+    fig_rating.add_trace(go.Scatter(
+        x=x,
+        y=rating,
+        mode="lines+markers",
+        name="Public Rating",
+        marker=dict(symbol="circle", size=8, color = LS_darkgrey),
+        line=dict(width=2, color = LS_darkgrey, dash = "dash")
+    ))
+
+    # 3) Gap as bars
+
+    # build a color per bar
+    bar_colors = ['green' if g >= 0 else 'red' for g in gaps]
+
+    fig_rating.add_trace(go.Bar(
+        x=x,
+        y=gaps,
+        name="Gap (Model Rating - Actual Rating)",
+        marker=dict(color=bar_colors),
+        opacity=0.6,
+        hovertemplate='Gap: %{y:.2f}<extra></extra>'
+    ))
+
+    # A) annotation for Upgrade Pressure in that right margin above the x‐axis
+    fig_rating.add_annotation(
+        xref="paper", x=1.15,    # 5% into right margin
+        yref="y", y=0,    # just above top of plot
+        text="⬆ Upgrade Pressure",
+        showarrow=False,
+        font=dict(color="green", size=14),
+        align="left",
+        yshift=10
+    )
 
-fig_rating.update_xaxes(
-    # keep your ticks & label styling
-    title_text="Year",
-    tickfont=dict(color="black"),
-    title=dict(text="Year", font=dict(color="black")),
-    showline=False,
-    mirror=False
-)
+    # B) annotation for Downgrade Pressure in that right margin below the x‐axis
+    fig_rating.add_annotation(
+        xref="paper", x=1.173,    # 5% into right margin
+        yref="y", y=-0,    # just above top of plot
+        text="⬇ Downgrade Pressure",
+        showarrow=False,
+        font=dict(color="red", size=14),
+        align="left",
+        yshift=-10
+    )
 
-fig_rating.update_yaxes(
-    title_text="Rating (1 = D, 22 = AAA)",
-    title_font=dict(color="black"),
-    tickfont=dict(color="black"),
-    showline=True,
-    linecolor="black",
-    mirror=False
-)
+    # Layout tweaks
+    fig_rating.update_layout(
+        title=f"How does {selected_name}'s model rating differ from its public rating?",
+        barmode="overlay",             # bars behind lines
+        template="plotly_white"
+    )
+
+    fig_rating.update_xaxes(
+        # keep your ticks & label styling
+        title_text="Year",
+        tickfont=dict(color="black"),
+        title=dict(text="Year", font=dict(color="black")),
+        showline=False,
+        mirror=False
+    )
+
+    fig_rating.update_yaxes(
+        title_text="Rating (1 = D, 22 = AAA)",
+        title_font=dict(color="black"),
+        tickfont=dict(color="black"),
+        showline=True,
+        linecolor="black",
+        mirror=False
+    )
 
 # Plot the chart finally!
 st.plotly_chart(fig_rating, use_container_width=True)
+stages.lap("rating_chart")
 
 ####----Historical Macro Fundamentals ----####
 st.subheader("How Have Macro Fundamentals Evolved Over The Years?")
@@ -252,8 +369,8 @@ st.subheader("How Have Macro Fundamentals Evolved Over The Years?")
 ####----Define line chart function for rapid chart building---####
 
 def plot_line_series(
-    data: pd.DataFrame,
-    country: str,
+    store: dict,
+    countries: list,
     column: str,
     name_map: dict,
     hover_format_map: dict,
@@ -262,31 +379,32 @@ def plot_line_series(
     """
     Plot a time series line+markers for one macro variable with custom styling,
     using hover_format_map for numeric formatting and labeling the last point.
+    With more than one country every country gets its own WebGL line and a legend entry instead.
 
     Parameters
     ----------
-    data : pd.DataFrame
-        DataFrame with a 'year' column and the target series column.
+    store : dict
+        Series store from series_store.build_series_store holding `column`.
+    countries : list
+        Countries to plot. The first one is the selected country and is drawn in `base_color`.
     column : str
-        Name of the column in `data` to plot.
+        Name of the series to plot.
     name_map : Dict[str, str]
         Maps column names to descriptive titles for chart headings.
     hover_format_map : Dict[str, str]
         Maps column names to Python-format strings for hover text, e.g. "${value:,.1f}".
     base_color : str
-        Hex code for the series color, e.g. '#0A2342'.
+        Hex code for the selected country's series color, e.g. '#0A2342'.
 
     Returns
     -------
     fig : plotly.graph_objects.Figure
         A Plotly figure object ready for display.
     """
-    # Derive the chart title
-    title = f"{country} {name_map.get(column, column)}"
+    overlay = len(countries) > 1
 
-    # Extract x/y
-    x_vals = data['year']
-    y_vals = data[column]
+    # Derive the chart title
+    title = name_map.get(column, column) if overlay else f"{countries[0]} {name_map.get(column, column)}"
 
     # Build hover template from map
     fmt = hover_format_map.get(column, '{value:.2f}')
@@ -294,33 +412,54 @@ def plot_line_series(
 
     # Create figure
     fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=x_vals,
-            y=y_vals,
-            mode='lines+markers',
-            name=title,
-            line=dict(color=base_color, width=2),
-            marker=dict(symbol='circle', size=6, color=base_color),
-            hovertemplate=hover_template
+
+    if overlay:
+        # one WebGL line per country, so 10+ lines stay responsive
+        for i, country in enumerate(countries):
+            color = overlay_color(i, base_color)
+            x_vals, y_vals = get_series(store, country, column)
+            fig.add_trace(
+                go.Scattergl(
+                    x=x_vals,
+                    y=y_vals,
+                    mode='lines+markers',
+                    name=country,
+                    line=dict(color=color, width=3 if i == 0 else 2),
+                    marker=dict(symbol='circle', size=6, color=color),
+                    hovertemplate=f'{country}<br>' + hover_template
+                )
+            )
+    else:
+        # Extract x/y
+        x_vals, y_vals = get_series(store, countries[0], column)
+
+        fig.add_trace(
+            go.Scatter(
+                x=x_vals,
+                y=y_vals,
+                mode='lines+markers',
+                name=title,
+                line=dict(color=base_color, width=2),
+                marker=dict(symbol='circle', size=6, color=base_color),
+                hovertemplate=hover_template
+            )
         )
-    )
 
-    # Annotate last data point
-    last_x = x_vals.iloc[-1]
-    last_y = y_vals.iloc[-1]
-    label = fmt.format(value=last_y)
-    fig.add_trace(
-        go.Scatter(
-            x=[last_x],
-            y=[last_y],
-            mode='text',
-            text=[label],
-            textposition='top right',
-            showlegend=False,
-            textfont=dict(color=base_color, size=12)
+        # Annotate last data point
+        last_x = x_vals[-1]
+        last_y = y_vals[-1]
+        label = fmt.format(value=last_y)
+        fig.add_trace(
+            go.Scatter(
+                x=[last_x],
+                y=[last_y],
+                mode='text',
+                text=[label],
+                textposition='top right',
+                showlegend=False,
+                textfont=dict(color=base_color, size=12)
+            )
         )
-    )
 
     # Layout styling
     fig.update_layout(
@@ -338,261 +477,287 @@ def plot_line_series(
             tickfont=dict(color='black')
         ),
         margin=dict(l=60, r=40, t=80, b=60),
-        showlegend=False
+        showlegend=overlay
     )
 
     return fig
 
-####----Wealth----####
-st.subheader("Wealth Factor")
-
-fig_ngdp_pc = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "ngdp_pc",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
-
-st.plotly_chart(fig_ngdp_pc,use_container_width=True)
+####----Pillar sections----####
+## Each rating pillar's charts sit in their own expander and are only built when the expander is open.
+## The expander lives inside a fragment, so opening / closing one reruns just that section instead of the whole page,
+## and closed sections cost nothing (no figures built, nothing sent to the browser).
+
+@st.fragment
+def pillar_section(label, key, render_charts, expanded=False):
+    section = st.expander(label, expanded=expanded, key=f"pillar_{key}", on_change="rerun")
+    if section.open:
+        with section, stage("historical_comparison", f"charts_{key}"):
+            render_charts()
+
+
+def real_economy_charts():
+    ####----Wealth----####
+    st.subheader("Wealth Factor")
+
+    fig_ngdp_pc = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "ngdp_pc",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Size----####
-st.subheader("Size Factor")
+    st.plotly_chart(fig_ngdp_pc,use_container_width=True)
 
-fig_ngdp = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "ngdp",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ####----Size----####
+    st.subheader("Size Factor")
 
-st.plotly_chart(fig_ngdp,use_container_width=True)
+    fig_ngdp = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "ngdp",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Growth----####
-st.subheader("Growth Factor")
+    st.plotly_chart(fig_ngdp,use_container_width=True)
 
-fig_growth = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "growth_avg",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ####----Growth----####
+    st.subheader("Growth Factor")
 
-st.plotly_chart(fig_growth,use_container_width=True)
+    fig_growth = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "growth_avg",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Inflation----####
-st.subheader("Inflation Factor")
+    st.plotly_chart(fig_growth,use_container_width=True)
 
-fig_inf = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "inf_avg",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ####----Inflation----####
+    st.subheader("Inflation Factor")
 
-st.plotly_chart(fig_inf,use_container_width=True)
+    fig_inf = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "inf_avg",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Default----####
-st.subheader("Default History Factor")
+    st.plotly_chart(fig_inf,use_container_width=True)
 
-fig_default = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "default_hist",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+def institutions_charts():
+    ####----Default----####
+    st.subheader("Default History Factor")
 
-fig_decay = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "default_decay",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_default = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "default_hist",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_default, use_container_width=True)
-col2.plotly_chart(fig_decay, use_container_width=True)
+    fig_decay = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "default_decay",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Governance----####
-st.subheader("Governance Factor")
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(fig_default, use_container_width=True)
+    col2.plotly_chart(fig_decay, use_container_width=True)
 
-fig_voice = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "voice_acct",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ####----Governance----####
+    st.subheader("Governance Factor")
 
-fig_pol = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "pol_stab",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_voice = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "voice_acct",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-fig_gov = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "gov_eff",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_pol = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "pol_stab",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-fig_reg = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "reg_qual",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_gov = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "gov_eff",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-fig_law = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "rule_law",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_reg = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "reg_qual",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-fig_corrupt = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "cont_corrupt",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_law = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "rule_law",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_voice, use_container_width=True)
-col2.plotly_chart(fig_pol, use_container_width=True)
+    fig_corrupt = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "cont_corrupt",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col3, col4 = st.columns(2)
-col3.plotly_chart(fig_gov, use_container_width=True)
-col4.plotly_chart(fig_reg, use_container_width=True)
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(fig_voice, use_container_width=True)
+    col2.plotly_chart(fig_pol, use_container_width=True)
+
+    col3, col4 = st.columns(2)
+    col3.plotly_chart(fig_gov, use_container_width=True)
+    col4.plotly_chart(fig_reg, use_container_width=True)
+
+    col5, col6 = st.columns(2)
+    col5.plotly_chart(fig_law, use_container_width=True)
+    col6.plotly_chart(fig_corrupt, use_container_width=True)
+
+def fiscal_charts():
+    ####----Fiscal Performance----####
+    st.subheader("Fiscal Performance Factor")
+
+    fig_fb = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "fb_avg",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col5, col6 = st.columns(2)
-col5.plotly_chart(fig_law, use_container_width=True)
-col6.plotly_chart(fig_corrupt, use_container_width=True)
+    fig_rev = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "gov_rev_gdp",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----Fiscal Performance----####
-st.subheader("Fiscal Performance Factor")
+    fig_ir = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "ir_rev",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-fig_fb = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "fb_avg",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    st.plotly_chart(fig_fb,use_container_width=True)
 
-fig_rev = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "gov_rev_gdp",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(fig_rev, use_container_width=True)
+    col2.plotly_chart(fig_ir, use_container_width=True)
 
-fig_ir = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "ir_rev",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ###----Government Debt----####
+    st.subheader("Government Debt Factor")
 
-st.plotly_chart(fig_fb,use_container_width=True)
+    fig_debt = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "gov_debt_gdp",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_rev, use_container_width=True)
-col2.plotly_chart(fig_ir, use_container_width=True)
+    st.plotly_chart(fig_debt,use_container_width=True)
 
-###----Government Debt----####
-st.subheader("Government Debt Factor")
+def external_charts():
+    ####----External Performance----####
+    st.subheader("External Performance Factor")
 
-fig_debt = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "gov_debt_gdp",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_cab = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "cab_avg",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-st.plotly_chart(fig_debt,use_container_width=True)
+    st.plotly_chart(fig_cab,use_container_width=True)
 
-####----External Performance----####
-st.subheader("External Performance Factor")
+    ####----FX Reserves----####
+    st.subheader("FX Reserves Factor")
 
-fig_cab = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "cab_avg",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_reserve = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "reserve_gdp",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-st.plotly_chart(fig_cab,use_container_width=True)
+    fig_import = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "import_cover",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-####----FX Reserves----####
-st.subheader("FX Reserves Factor")
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(fig_reserve, use_container_width=True)
+    col2.plotly_chart(fig_import, use_container_width=True)
 
-fig_reserve = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "reserve_gdp",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    ####----Reserve Currency Status----####
+    st.subheader("Reserve Currency Factor")
 
-fig_import = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "import_cover",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+    fig_status = plot_line_series(
+        store = raw_store,
+        countries = overlay_names,
+        column = "reserve_fx",
+        name_map = variable_dict,
+        hover_format_map = format_map,
+        base_color = LS_darkblue
+    )
 
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_reserve, use_container_width=True)
-col2.plotly_chart(fig_import, use_container_width=True)
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(fig_status, use_container_width=True)
 
-####----Reserve Currency Status----####
-st.subheader("Reserve Currency Factor")
+## Pillar sections. Only the open ones build and send their charts
 
-fig_status = plot_line_series(
-    data = df_raw_filter,
-    country = selected_name,
-    column = "reserve_fx",
-    name_map = variable_dict,
-    hover_format_map = format_map,
-    base_color = LS_darkblue
-)
+pillar_section("REAL ECONOMY PILLAR (25%)", "real_economy", real_economy_charts, expanded=True)
+pillar_section("MONETARY & INSTITUTIONS PILLAR (44%)", "institutions", institutions_charts, expanded=False)
+pillar_section("FISCAL PILLAR (17%)", "fiscal", fiscal_charts, expanded=False)
+pillar_section("EXTERNAL PILLAR (14%)", "external", external_charts, expanded=False)
 
-col1, col2 = st.columns(2)
-col1.plotly_chart(fig_status, use_container_width=True)
+diagnostics_panel()
@@ -11,6 +11,12 @@ from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from openpyxl.formatting.rule import ColorScaleRule
+from rating_format import letter_lookup, rating_letter, ratings_to_letters
+from heatmap_style import gradient_css_lookup, row_gradient_css, diverging_css
+from peer_search import build_distance_index, coefficient_weights, nearest_peers
+from rating_gaps import build_gap_cube, gap_matrix, pair_attribution, factor_notches
+from export_utils import generate_gap_matrix_export
+from perf_utils import StageClock, stage, diagnostics_panel
 
 ## Page content. how it shows up on the side bar. how the page is laid out. wide in this case.
 st.set_page_config(
@@ -22,6 +28,9 @@ st.set_page_config(
 
 st.title("Peer Comparison")
 
+# stage timings for the diagnostics panel: each stages.lap(...) books the time since the previous lap (see perf_utils.py)
+stages = StageClock("peer_comparison")
+
 ## Load the data. Cache so user only loads once upon use.
 
 BASE_DIR = Path(__file__).resolve().parent.parent #file --> refers to where current py lives. parent parent goes up two levels
@@ -38,6 +47,7 @@ def load_all_excels():
         pd.read_excel(BASE_DIR/"index_bbg_rating_live.xlsx", sheet_name="hard_code"),
     )
 df_transform, df_raw, coeff_index, rating_index, variable_index, country_index, public_rating_index = load_all_excels()
+stages.lap("excel_load")
 
 ## Define Loomis Colors for use later
 
@@ -155,6 +165,9 @@ rating_ranges = {
 #zip pairs the two columns row by row to help make into a dict
 rating_dict = dict(zip(rating_index['Numeric'], rating_index['Credit Rating'])) 
 
+#same scale as a lookup array (index = numeric rating) for the letter rows of the heatmaps. see rating_format.py
+rating_letters = letter_lookup(rating_index, missing="")
+
 ## Set up select boxes and fitlered dfs
 
 # Limit the width of the select boxes
@@ -204,7 +217,10 @@ else:
 # Print it out in streamlit
 st.write(line)
 
-# Multiselct to allow user to select up to five countries to compare
+# Multiselct to allow user to select up to MAX_PEERS countries to compare
+# (the heat maps are pivots + vectorized colours, so dozens of peers stay quick)
+
+MAX_PEERS = 30
 
 # set it such that this select box gets to be wider
 
@@ -221,54 +237,74 @@ div[data-testid="stMultiSelect-country_compare"]
 
 peer_list = sorted(df_transform_filter["name"].unique().tolist())
 
+## Peer finder: the countries closest to a chosen one in factor / variable Z-score space (see peer_search.py).
+## The distance matrix is built once per year / space / weighting and cached; a search is a row lookup.
+
+@st.cache_resource(max_entries=64)
+def load_peer_index(year, space, weighted):
+    df_year = df_transform[df_transform["year"] == year]
+    weights = coefficient_weights(coeff_index, space) if weighted else None
+    return build_distance_index(df_year, space, weights)
+
+peer_spaces = {"11 factors": "factor", "20 constituent variables": "variable"}
+
+def use_found_peers(names):
+    # button callback. runs before the multiselect below is drawn, so it can fill it in
+    st.session_state.country_compare = names
+
+with st.expander("🔎 Find similar countries"):
+    finder_col_1, finder_col_2, finder_col_3 = st.columns([3, 3, 2])
+    anchor = finder_col_1.selectbox("Countries most similar to", peer_list, key="peer_anchor")
+    space_label = finder_col_2.radio("Compare on", list(peer_spaces), horizontal=True, key="peer_space")
+    n_similar = finder_col_3.number_input("How many", min_value=1, max_value=MAX_PEERS - 1, value=4, key="peer_k")
+    weighted = st.toggle("Weight by model coefficients (distance in rating notches)", value=True, key="peer_weighted")
+
+    stages.skip()
+    found = nearest_peers(load_peer_index(selected_year, peer_spaces[space_label], weighted), [anchor], n_similar)
+    found_ratings = df_transform_filter.set_index("name").loc[found["name"], ["rating", "predicted_rating"]]
+    found["Public Rating"] = ratings_to_letters(found_ratings["rating"], rating_letters, missing="")
+    found["Model Rating"] = ratings_to_letters(found_ratings["predicted_rating"], rating_letters, missing="")
+    stages.lap("peer_finder")
+
+    st.dataframe(
+        found.rename(columns={"name": "Country", "distance": "Distance"}),
+        hide_index=True,
+        column_config={"Distance": st.column_config.NumberColumn(format="%.2f")},
+    )
+    st.button(
+        "Compare these countries",
+        key="use_found_peers",
+        on_click=use_found_peers,
+        args=([anchor] + found["name"].tolist(),),
+    )
+
 peers = st.multiselect(
-    "Choose up to FIVE countries to compare",
+    f"Choose up to {MAX_PEERS} countries to compare",
     options = peer_list,
     #default = peer_list[:5],
-    max_selections = 5,
+    max_selections = MAX_PEERS,
     key = "country_compare"
 )
 
 ####----Start Building the Factor Level Table here now that the pre-requisites are set----####
 
-# 2) Assume `peers` is your list of five country names from the multiselect
-#    and df_transform_filter is already filtered to the right year.
+# 2) Index the year's panel by country once, so every peer's values come out in a single lookup
 #    e.g. peers = st.session_state.country_compare
-#          df = df_transform_filter[df_transform_filter["name"].isin(peers)]
-
-# 3) Build a row for each factor
-
-rows = []
-for short_var, display_name in factors_dict.items():
-    row = {"Variable": display_name}
-    for country in peers:
-        # Pull the raw value
-        raw = (
-            df_transform_filter
-            .loc[df_transform_filter["name"] == country, short_var]
-            .iloc[0]
-        )
-
-        if short_var in ["rating", "predicted_rating"]:
-            # Round to nearest integer and map to letter (fallback to blank)
-            #letter = rating_dict.get(round(raw), "") --> revive later if need letter rating
-            row[country] = raw
-        else:
-            # Round everything else to 2 decimal places
-            row[country] = raw
-
-    rows.append(row)
 
-# 4) Assemble into a DataFrame
-heatmap_df = pd.DataFrame(rows)
+panel_transform = df_transform_filter.set_index("name")
+panel_raw = df_raw_filter.set_index("name")
 
-#— Remove the “Variable” header by making it the index —
-heatmap_df = heatmap_df.set_index("Variable")
-#heatmap_df.index.name = None   # ← removes the “Variable” label in the corner
+# 3) Pivot: one row per factor, one column per peer (values stay numeric, the styler formats them)
 
-# “Reset” the index so “Variable” becomes a real column again,
-# and the DataFrame’s index is the default integers (0, 1, 2, …).
-heatmap_df = heatmap_df.reset_index()
+heatmap_df = (
+    panel_transform.loc[peers, list(factors_dict)]
+    .astype(float)
+    .T
+    .rename(index=factors_dict)
+    .rename_axis("Variable")
+    .rename_axis(None, axis=1)
+    .reset_index()
+)
 
 # 5) Now we use the .style property to decorate our df and then use st.write to render it so it looks the way we want
 
@@ -290,56 +326,35 @@ excel_cmap = mcolors.LinearSegmentedColormap.from_list(
     [low_color, mid_color, high_color]
 )
 
+#sample the colormap once into CSS strings. each heat map cell then just indexes into it (see heatmap_style.py)
+excel_css = gradient_css_lookup(excel_cmap)
 
-#create Helper function to colour cells in the “Variable” column
-
-def style_variable_cell(row: pd.Series) -> pd.Series:
-    """
-    row.name is the integer index (0, 1, 2, …).
-    We return a Series of CSS strings, one per column, for this single row:
-      • If the column is "Variable" and row.name < 2 → LS_orange bg, black text, bold.
-      • If the column is "Variable" and row.name >= 2 → LS_lightblue bg, black text, bold.
-      • For all other columns, return "" (no styling).
-    """
-    out = pd.Series("", index=row.index)
-    idx = row.name
-
-    if idx < 2:
-        out["Variable"] = (
-            f"background-color: {LS_orange}; "
-            "color: black; "
-            "font-weight: bold;"
-        )
-    else:
-        out["Variable"] = (
-            f"background-color: {LS_faintblue}; "
-            "color: black; "
-            "font-weight: bold;"
-        )
-    return out
+# CSS for every cell in one go: red → green across each numeric row, and the “Variable” column shaded
+# LS_orange for the two rating rows and LS_faintblue for the factors
 
+country_cols = heatmap_df.columns.difference(["Variable"])
+numeric_mask = heatmap_df["Variable"].isin(numeric_rows).to_numpy()
 
-#def color_label_cell(val):
-#    return "background-color: #1A3B73; color: white;"
+heatmap_css = pd.DataFrame("", index=heatmap_df.index, columns=heatmap_df.columns)
+heatmap_css.loc[numeric_mask, country_cols] = row_gradient_css(heatmap_df.loc[numeric_mask, country_cols], excel_css)
+heatmap_css["Variable"] = np.where(
+    heatmap_df.index < 2,
+    f"background-color: {LS_orange}; color: black; font-weight: bold;",
+    f"background-color: {LS_faintblue}; color: black; font-weight: bold;",
+)
 
 # Create style object that adds various style elements to the df
 
 styler = (
     heatmap_df.style
-        # (a) Put a gradient on numeric rows only:
-        .background_gradient(
-            cmap=excel_cmap,
-            subset=pd.IndexSlice[
-                heatmap_df["Variable"].isin(numeric_rows),  # select rows by boolean mask
-                heatmap_df.columns.difference(["Variable"]) # all columns except “Variable”
-            ],axis=1 #apply condtional format across rows
-        )
+        # (a) all the colours, precomputed above
+        .apply(lambda _: heatmap_css, axis=None)
         # (b) For letter_rows, convert the float into the letter:
         .format(
-            lambda v: rating_dict.get(int(round(v)), ""),
+            lambda v: rating_letter(v, rating_letters),
             subset=pd.IndexSlice[
                 heatmap_df["Variable"].isin(letter_rows),  # only letter rows
-                heatmap_df.columns.difference(["Variable"])
+                country_cols
             ]
         )
         # (c) For numeric_rows, display exactly 2 decimals:
@@ -347,11 +362,9 @@ styler = (
             "{:.2f}",
             subset=pd.IndexSlice[
                 heatmap_df["Variable"].isin(numeric_rows),
-                heatmap_df.columns.difference(["Variable"])
+                country_cols
             ]
         )
-        # apply style_variable_cell to our whole df. this function mainly defines how i want the variable column to look
-        .apply(style_variable_cell, axis=1)
         # (e) Hide Streamlit’s default integer index (pandas ≥ 1.4.0)
         #.hide_index()
 )
@@ -361,6 +374,7 @@ styler = (
 #st.table(styler) if you want the simple versionw without the interactivity
 st.subheader("Rating Factor Heat Map (Z-scores)")
 st.write(styler)
+stages.lap("factor_heatmap")
 
 # Create excel export button below
 
@@ -381,6 +395,10 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
     max_row = ws.max_row
     max_col = ws.max_column
 
+    # last country column. the table is framed out to F at least (5 peers), wider when there are more peers
+    last_col = max(6, len(df.columns))
+    last = get_column_letter(last_col)
+
     # — 3) Auto-fit column A width —
     colA = get_column_letter(1)
     max_w = max(
@@ -404,19 +422,19 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
         else:
             cell.fill = light_tint
 
-    # — 6) Header row B1–F1 styling if populated —
+    # — 6) Header row B1–F1 (or further) styling if populated —
     header_fill = PatternFill("solid", fgColor="FF1A3B73")
     white_font = Font(color="FFFFFFFF", bold=True)
-    for col_idx in range(2, 7):
+    for col_idx in range(2, last_col + 1):
         cell = ws.cell(row=1, column=col_idx)
         if cell.value not in (None, ""):
             cell.alignment = Alignment(wrapText=True)
             cell.font      = white_font
             cell.fill      = header_fill
     
-    # — 6b) just force col B1 to F1 to be width 10.0
-    for col in ["B", "C", "D", "E", "F"]:
-        ws.column_dimensions[col].width = 12.0
+    # — 6b) just force the country columns (B to F, or further) to be width 12.0
+    for col_idx in range(2, last_col + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 12.0
 
     # — 7) Numeric formatting B4–F14 & per-row 3-color scale —
     color_rule = ColorScaleRule(
@@ -427,17 +445,17 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
 
     for r in range(4, 15):
         # 1) format numbers
-        for col_idx in range(2, 7):
+        for col_idx in range(2, last_col + 1):
             cell = ws.cell(row=r, column=col_idx)
             if isinstance(cell.value, (int, float)):
                 cell.number_format = "0.00"
-        # 2) apply a single color-scale rule to the entire row range B…F
-        rng = f"B{r}:F{r}" #That line is a Python f-string that builds the Excel range address for columns B through F on row r.
+        # 2) apply a single color-scale rule to the entire row range B…last country
+        rng = f"B{r}:{last}{r}" #That line is a Python f-string that builds the Excel range address for columns B through F on row r.
         ws.conditional_formatting.add(rng, color_rule) 
                
     # — 8) Map B2–F3 from numeric → letter rating via rating_dict —
     for r in (2, 3):
-        for col_idx in range(2, 7):
+        for col_idx in range(2, last_col + 1):
             cell = ws.cell(row=r, column=col_idx)
             if isinstance(cell.value, (int, float)):
                 num = round(cell.value)
@@ -445,7 +463,7 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
                 cell.value = letter
                 cell.alignment = Alignment(horizontal="center")
 
-    # — 9) Draw a full border around A1:F14 —
+    # — 9) Draw a full border around A1:F14 (or the last country column) —
     thin = Side(style="thin")
     def mk_border(top=False, bottom=False, left=False, right=False):
         return Border(
@@ -455,13 +473,13 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
             right  = thin if right  else Side(style=None),
         )
     for r in range(1, 15):
-        for c in range(1, 7):
-            if r in (1, 14) or c in (1, 6):
+        for c in range(1, last_col + 1):
+            if r in (1, 14) or c in (1, last_col):
                 ws.cell(row=r, column=c).border = mk_border(
                     top    = (r == 1),
                     bottom = (r == 14),
                     left   = (c == 1),
-                    right  = (c == 6)
+                    right  = (c == last_col)
                 )
 
     # — 10) Save to in-memory buffer —
@@ -471,6 +489,7 @@ def generate_export_short(df: pd.DataFrame) -> BytesIO:
     return output
 
 excel_data_short = generate_export_short(heatmap_df)
+stages.lap("export_short")
 
 export_col_short, blank_col_1, blank_col_2 = st.columns([2, 2, 6])
 
@@ -485,150 +504,47 @@ with export_col_short:
 
 ####----Start Building the Constituent Level HeatMap here now that the pre-requisites are set----####
 
-## First we form the df we want, using the same method as above
-
-rows_long = []
-
-# Get "rating" and "predicted_rating" from transform_df_filter
-
-desired_vars = ["rating", "predicted_rating"]
-
-for short_var in desired_vars:
-    # Look up the display name from factors_dict
-    display_name = factors_dict[short_var]
-    row_short = {"Variable": display_name}
-    
-    for country in peers:
-        # Pull the raw value for this country & variable
-        raw = (
-            df_transform_filter
-            .loc[df_transform_filter["name"] == country, short_var]
-            .iloc[0]
-        )
-
-        # If it’s one of the two letter‐rating fields, leave as is; otherwise you could format.
-        # (Here we just assign raw for both since they are both “rating” fields.)
-        row_short[country] = raw
-
-    rows_long.append(row_short)
-
-# Get the other raw variables from df_raw_filter
-
-for short_var, display_name in variable_dict.items():
-    row_long = {"Variable": display_name}
-    for country in peers:
-        # Pull the raw value
-        raw = (
-            df_raw_filter
-            .loc[df_raw_filter["name"] == country, short_var]
-            .iloc[0]
-        )
-
-        row_long[country] = raw
-
-    rows_long.append(row_long)
+## First we form the df we want, using the same pivot as above
+
+# Each factor gets a blank header row followed by its constituent variables (in the order of the table)
+
+factor_variables = {
+    "wealth_factor":        ["ngdp_pc"],
+    "size_factor":          ["ngdp"],
+    "growth_factor":        ["growth_avg"],
+    "inflation_factor":     ["inf_avg"],
+    "default_factor":       ["default_hist", "default_decay"],
+    "governance_factor":    ["voice_acct", "pol_stab", "gov_eff", "reg_qual", "rule_law", "cont_corrupt"],
+    "fiscalperf_factor":    ["fb_avg", "gov_rev_gdp", "ir_rev"],
+    "govdebt_factor":       ["gov_debt_gdp"],
+    "extperf_factor":       ["cab_avg"],
+    "reservebuffer_factor": ["reserve_gdp", "import_cover"],
+    "reservestatus_factor": ["reserve_fx"],
+}
 
-#Assemble into a DataFrame
-heatmap_df_long = pd.DataFrame(rows_long)
+long_row_order = ["rating", "predicted_rating"] + [
+    row for factor, variables in factor_variables.items() for row in [factor, *variables]
+]
+
+# ratings from df_transform, everything else raw from df_raw. one column per peer.
+# the factor header rows are not in the panel, so reindex adds them filled with 0.0 (the styler hides the zeros)
+heatmap_df_long = (
+    pd.concat([
+        panel_transform.loc[peers, ["rating", "predicted_rating"]],
+        panel_raw.loc[peers, list(variable_dict)],
+    ], axis=1)
+    .astype(float)
+    .T
+    .reindex(long_row_order, fill_value=0.0)
+    .rename(index={**factors_dict, **variable_dict})
+    .rename_axis("Variable")
+    .rename_axis(None, axis=1)
+    .reset_index()
+)
 
 #Render the output to check if we made our df properly
 st.subheader("Constituent Variable Heat Map (raw numerical values)")
 
-#now we do the difficult step of slicing and recombining our df so that we can get row headers!
-
-#first we slice up our df into where we want to slot
-df1 = heatmap_df_long.iloc[:2]
-df2 = heatmap_df_long.iloc[2:3]
-df3 = heatmap_df_long.iloc[3:4]
-df4 = heatmap_df_long.iloc[4:5]
-df5 = heatmap_df_long.iloc[5:6]
-df6 = heatmap_df_long.iloc[6:8]
-df7 = heatmap_df_long.iloc[8:14]
-df8 = heatmap_df_long.iloc[14:17]
-df9 = heatmap_df_long.iloc[17:18]
-df10 = heatmap_df_long.iloc[18:19]
-df11 = heatmap_df_long.iloc[19:21]
-df12 = heatmap_df_long.iloc[21:22]
-
-#next we create blank rows for the headers we want
-
-# Get a list of all columns except "Variable"
-country_cols = [col for col in heatmap_df_long.columns if col != "Variable"]
-#We know we always have exactly one column named "Variable", and all the others (1 or more) are the country names chosen by the user.
-
-wealth_dict = {"Variable": "Wealth (5%)"}
-for c in country_cols:
-    wealth_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-wealth_row = pd.DataFrame([wealth_dict]) #turn dict into a df
-
-size_dict = {"Variable": "Size (18%)"}
-for c in country_cols:
-    size_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-size_row = pd.DataFrame([size_dict]) #turn dict into a df
-
-growth_dict = {"Variable": "Growth (2%)"}
-for c in country_cols:
-    growth_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-growth_row = pd.DataFrame([growth_dict]) #turn dict into a df
-
-inf_dict = {"Variable": "Inflation (3%)"}
-for c in country_cols:
-    inf_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-inf_row = pd.DataFrame([inf_dict]) #turn dict into a df
-
-default_dict = {"Variable": "Default History (9%)"}
-for c in country_cols:
-    default_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-default_row = pd.DataFrame([default_dict]) #turn dict into a df
-
-gov_dict = {"Variable": "Governance (32%)"}
-for c in country_cols:
-    gov_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-gov_row = pd.DataFrame([gov_dict]) #turn dict into a df
-
-fiscal_dict = {"Variable": "Fiscal Performance (7%)"}
-for c in country_cols:
-    fiscal_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-fiscal_row = pd.DataFrame([fiscal_dict]) #turn dict into a df
-
-debt_dict = {"Variable": "Government Debt (10%)"}
-for c in country_cols:
-    debt_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-debt_row = pd.DataFrame([debt_dict]) #turn dict into a df
-
-ext_dict = {"Variable": "External Performance (5%)"}
-for c in country_cols:
-    ext_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-ext_row = pd.DataFrame([ext_dict]) #turn dict into a df
-
-fx_dict = {"Variable": "FX Reserves (4%)"}
-for c in country_cols:
-    fx_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-fx_row = pd.DataFrame([fx_dict]) #turn dict into a df
-
-reserve_dict = {"Variable": "Reserve Currency Status (5%)"}
-for c in country_cols:
-    reserve_dict[c] = 0.0    # ← or use "" if you dislike 0.0. looping over dynamic list of countries
-reserve_row = pd.DataFrame([reserve_dict]) #turn dict into a df
-
-heatmap_df_long = pd.concat(
-    [
-      df1, wealth_row,
-      df2, size_row,
-      df3, growth_row,
-      df4, inf_row,
-      df5, default_row,
-      df6, gov_row,
-      df7, fiscal_row,
-      df8, debt_row,
-      df9, ext_row,
-      df10, fx_row,
-      df11, reserve_row,
-      df12
-    ],
-    ignore_index=True
-)
-
 # now time to get the styler in place so we can make the table look the way we want!
 
 # Identify which row labels need letter formatting
@@ -699,62 +615,34 @@ two_dp = [
 dummy_dp = ["Default History Dummy (1=Yes, 0=No)",
             "Reserve Currency Status (1 = Yes, 0 = No)"]
 
-def style_variable_cell_long(row: pd.Series) -> pd.Series:
-    """
-    row.name is the integer index (0, 1, 2, …).
-    row["Variable"] is the label, e.g. "Avg Public Rating", "Wealth (5%)", etc.
-
-    We return a Series of CSS strings—one per column in this row—according to:
-      • If row["Variable"] is "Avg Public Rating" or "Model Rating": 
-            shade every cell in this row LS_orange, black bold text.
-      • If row["Variable"] is one of the other specified variables (Wealth, Size, etc.):
-            shade every cell in this row LS_faintblue, black bold text.
-      • Else: leave all cells in this row unstyled ("").
-    """
-    out = pd.Series("", index=row.index)
-    var = row["Variable"]
-
-    orange_set = {"Avg Public Rating", "Model Rating"}
-    blue_set = {
-        "Wealth (5%)",
-        "Size (18%)",
-        "Growth (2%)",
-        "Inflation (3%)",
-        "Default History (9%)",
-        "Governance (32%)",
-        "Fiscal Performance (7%)",
-        "Government Debt (10%)",
-        "External Performance (5%)",
-        "FX Reserves (4%)",
-        "Reserve Currency Status (5%)"
-    }
-
-    if var in orange_set:
-        css = f"background-color: {LS_orange}; color: black; font-weight: bold;"
-        out["Variable"] = css
-    elif var in blue_set:
-        css = f"background-color: {LS_faintblue}; color: black; font-weight: bold;"
-        out[:] = css
-    # else: leave out[:] as "" so no styling
+# CSS for every cell in one go (same rules as the factor heat map above):
+#   • red → green across each numeric row (excel_css is defined above already when making the short table)
+#   • "Avg Public Rating" / "Model Rating": the label cell in LS_orange, black bold text
+#   • factor header rows (Wealth, Size, etc.): the whole row in LS_faintblue, black bold text
 
-    return out
+country_cols_long = heatmap_df_long.columns.difference(["Variable"])
+numeric_mask_long = heatmap_df_long["Variable"].isin(numeric_rows_long).to_numpy()
+header_mask_long = heatmap_df_long["Variable"].isin(header_rows_long).to_numpy()
+
+heatmap_css_long = pd.DataFrame("", index=heatmap_df_long.index, columns=heatmap_df_long.columns)
+heatmap_css_long.loc[numeric_mask_long, country_cols_long] = row_gradient_css(
+    heatmap_df_long.loc[numeric_mask_long, country_cols_long], excel_css
+)
+heatmap_css_long.loc[heatmap_df_long["Variable"].isin(letter_rows), "Variable"] = (
+    f"background-color: {LS_orange}; color: black; font-weight: bold;"
+)
+heatmap_css_long.loc[header_mask_long, :] = f"background-color: {LS_faintblue}; color: black; font-weight: bold;"
 
 styler_long = (
     heatmap_df_long.style
-        # (a) Put a gradient on numeric rows only:
-        .background_gradient(
-            cmap=excel_cmap, #note that excel_cmap is defined above already when making the short table
-            subset=pd.IndexSlice[
-                heatmap_df_long["Variable"].isin(numeric_rows_long),  # which rows to style
-                heatmap_df_long.columns.difference(["Variable"]) # which columns to style
-            ],axis=1
-        )
+        # (a) all the colours, precomputed above
+        .apply(lambda _: heatmap_css_long, axis=None)
         # (b) For letter_rows, convert the float into the letter:
         .format(
-            lambda v: rating_dict.get(int(round(v)), ""),
+            lambda v: rating_letter(v, rating_letters),
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(["Avg Public Rating", "Model Rating"]),  # which rows to style
-                heatmap_df_long.columns.difference(["Variable"]) # which columns to style
+                country_cols_long # which columns to style
             ]
         )
         # hide the zeros in the header columns
@@ -762,7 +650,7 @@ styler_long = (
             hide_zeros,
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(header_rows_long),
-                heatmap_df_long.columns.difference(["Variable"])
+                country_cols_long
             ]
         )
 
@@ -771,7 +659,7 @@ styler_long = (
             "{:,.1f}",
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(one_dp_comma),
-                heatmap_df_long.columns.difference(["Variable"])
+                country_cols_long
             ]
         )
 
@@ -780,7 +668,7 @@ styler_long = (
             "{:.1f}",
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(one_dp),
-                heatmap_df_long.columns.difference(["Variable"])
+                country_cols_long
             ]
         )
 
@@ -789,7 +677,7 @@ styler_long = (
             "{:.2f}",
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(two_dp),
-                heatmap_df_long.columns.difference(["Variable"])
+                country_cols_long
             ]
         )
 
@@ -798,12 +686,10 @@ styler_long = (
             "{:.0f}",
             subset=pd.IndexSlice[
                 heatmap_df_long["Variable"].isin(dummy_dp),
-                heatmap_df_long.columns.difference(["Variable"])
+                country_cols_long
             ]
         )
 
-        # apply style_variable_cell to our whole df. this function mainly defines how i want the variable column to look
-        .apply(style_variable_cell_long, axis=1)
         # (e) Hide Streamlit’s default integer index (pandas ≥ 1.4.0)
         #.hide_index()
 )
@@ -811,6 +697,7 @@ styler_long = (
 # LEts render the table nicely
 
 st.write(styler_long)
+stages.lap("variable_heatmap")
 
 # Create excel export button below
 
@@ -831,6 +718,10 @@ def generate_export_long(df: pd.DataFrame) -> BytesIO:
     max_row = ws.max_row
     max_col = ws.max_column
 
+    # last country column. the table is framed out to F at least (5 peers), wider when there are more peers
+    last_col = max(6, len(df.columns))
+    last = get_column_letter(last_col)
+
     # 3) Auto-fit column A
     colA = get_column_letter(1)
     max_w = max(len(str(ws[f"{colA}{r}"].value or "")) for r in range(1, ws.max_row+1))
@@ -864,51 +755,51 @@ def generate_export_long(df: pd.DataFrame) -> BytesIO:
     for r in (2,3):
         ws.cell(row=r, column=1).fill = orange_fill
 
-    # 7) For each of these rows, clear B–F and shade A–F light tint
+    # 7) For each of these rows, clear the country cells and shade the whole row light tint
     for r in (4,6,8,10,12,15,22,26,28,30,33):
-        for c in range(2,7):
+        for c in range(2, last_col + 1):
             ws.cell(row=r, column=c).value = None
-        for c in range(1,7):
+        for c in range(1, last_col + 1):
             ws.cell(row=r, column=c).fill = tint_fill
 
-    # 8) Header row B1–F1: wrap, bold white font, dark-blue fill
-    for c in range(2,7):
+    # 8) Header row B1–F1 (or further): wrap, bold white font, dark-blue fill
+    for c in range(2, last_col + 1):
         cell = ws.cell(row=1, column=c)
         if cell.value not in (None, ""):
             cell.alignment = wrap
             cell.font      = white_bold
             cell.fill      = header_fill
 
-    # 9) Force columns B–F to width 12
-    for c in range(2,7):
+    # 9) Force the country columns to width 12
+    for c in range(2, last_col + 1):
         ws.column_dimensions[get_column_letter(c)].width = 12.0
 
     # 10) Number‐format each specific row range
     # B5–F5: whole w/ comma
-    for c in range(2,7):
+    for c in range(2, last_col + 1):
         cell = ws.cell(row=5, column=c)
         if isinstance(cell.value, (int,float)):
             cell.number_format = "#,##0"
     # B7–F7: 1 dp w/ comma
-    for c in range(2,7):
+    for c in range(2, last_col + 1):
         cell = ws.cell(row=7, column=c)
         if isinstance(cell.value, (int,float)):
             cell.number_format = "#,##0.0"
     # One‐decimal rows:
     one_dp = [9,11,16,17,18,19,20,21,23,24,25,27,29,31,32]
     for r in one_dp:
-        for c in range(2,7):
+        for c in range(2, last_col + 1):
             cell = ws.cell(row=r, column=c)
             if isinstance(cell.value, (int,float)):
                 cell.number_format = "0.0"
     # B13–F13 & B34–F34: whole
     for r in (13,34):
-        for c in range(2,7):
+        for c in range(2, last_col + 1):
             cell = ws.cell(row=r, column=c)
             if isinstance(cell.value, (int,float)):
                 cell.number_format = "#,##0"
     # B14–F14: 2 dp but show "0" if zero
-    for c in range(2,7):
+    for c in range(2, last_col + 1):
         cell = ws.cell(row=14, column=c)
         if isinstance(cell.value, (int,float)):
             if cell.value == 0:
@@ -930,15 +821,15 @@ def generate_export_long(df: pd.DataFrame) -> BytesIO:
     high_rows = [5,7,9,16,17,18,19,20,21,23,24,29,31,32,34]
     low_rows  = [11,13,14,25,27]
     for r in high_rows:
-        rng = f"B{r}:F{r}"
+        rng = f"B{r}:{last}{r}"
         ws.conditional_formatting.add(rng, high_good)
     for r in low_rows:
-        rng = f"B{r}:F{r}"
+        rng = f"B{r}:{last}{r}"
         ws.conditional_formatting.add(rng, low_good)
 
     # 12) Map numeric B2–F3 → letter via rating_dict
     for r in (2,3):
-        for c in range(2,7):
+        for c in range(2, last_col + 1):
             cell = ws.cell(row=r, column=c)
             v = cell.value
             if isinstance(v, (int,float)):
@@ -946,15 +837,15 @@ def generate_export_long(df: pd.DataFrame) -> BytesIO:
                 cell.value     = letter
                 cell.alignment = center
 
-    # 13) Draw a thin border around A1:F34
+    # 13) Draw a thin border around A1:F34 (or the last country column)
     for r in range(1, 35):
-        for c in range(1, 7):
-            if r in (1,34) or c in (1,6):
+        for c in range(1, last_col + 1):
+            if r in (1,34) or c in (1, last_col):
                 ws.cell(row=r, column=c).border = mk_border(
                     top    = (r == 1),
                     bottom = (r == 34),
                     left   = (c == 1),
-                    right  = (c == 6)
+                    right  = (c == last_col)
                 )
 
     # 14) Save to BytesIO
@@ -964,6 +855,7 @@ def generate_export_long(df: pd.DataFrame) -> BytesIO:
     return out
 
 excel_data_long = generate_export_long(heatmap_df_long)
+stages.lap("export_long")
 
 export_col_long, blank_col_1, blank_col_2 = st.columns([2, 2, 6])
 
@@ -974,4 +866,100 @@ with export_col_long:
     data=excel_data_long,
     file_name="variable_heatmap.xlsx",
     mime="application/vnd.openxmlformats-officedocument-spreadsheetml.sheet"
-)
\ No newline at end of file
+)
+####----Rating Gap Matrix: pairwise model rating differences, broken down by factor----####
+
+# The model is linear, so the gap between any two countries' model ratings splits exactly into
+# per-factor notch differences (see rating_gaps.py). The year's gap matrices and factor notches are
+# built once and cached; a group is a slice and a pair's breakdown is one row minus another.
+
+st.subheader("Rating Gap Matrix (model rating, notches)")
+
+@st.cache_resource(max_entries=32)
+def load_gap_cube(year):
+    return build_gap_cube(df_transform[df_transform["year"] == year], coeff_index)
+
+gap_cube = load_gap_cube(selected_year)
+
+# radio label -> (countries, how the export describes them)
+gap_groups = {
+    f"Countries rated {selected_bucket} ({len(countries)})": (countries, f"rated {selected_bucket}"),
+    f"Countries selected above ({len(peers)})": (peers, "selected countries"),
+}
+gap_group = st.radio("Countries in the matrix", list(gap_groups), horizontal=True, key="gap_group")
+gap_names, gap_export_label = gap_groups[gap_group]
+
+if len(gap_names) < 2:
+    st.info("Pick a rating bucket or at least two countries above to see their rating gaps.")
+else:
+    gap_df = gap_matrix(gap_cube, gap_names)
+
+    # green: row country's model rating is above the column country's. red: below
+    gap_cmap = mcolors.LinearSegmentedColormap.from_list("gap_r_w_g", [low_color, "#FFFFFF", high_color])
+    gap_css = pd.DataFrame(diverging_css(gap_df, gradient_css_lookup(gap_cmap)), index=gap_df.index, columns=gap_df.columns)
+
+    st.caption("Row country's model rating minus column country's, in notches")
+    st.dataframe(gap_df.style.apply(lambda _: gap_css, axis=None).format("{:+.2f}"))
+
+    # Pair breakdown: why is A rated N notches above B?
+
+    pair_col_1, pair_col_2, pair_col_3 = st.columns([3, 3, 4])
+    pair_a = pair_col_1.selectbox("Why is", gap_names, index=0, key="gap_pair_a")
+    pair_b = pair_col_2.selectbox("rated differently from", gap_names, index=1, key="gap_pair_b")
+
+    if pair_a != pair_b:
+        attribution = pair_attribution(gap_cube, pair_a, pair_b, factors_dict)
+        gap = attribution["Difference (notches)"].iloc[-1]
+        st.markdown(
+            f"**{pair_a}**'s model rating is **{abs(gap):.2f} notches {'above' if gap >= 0 else 'below'}** **{pair_b}**'s "
+            f"({rating_letter(attribution[pair_a].iloc[-1], rating_letters)} vs {rating_letter(attribution[pair_b].iloc[-1], rating_letters)})."
+        )
+
+        contributions = attribution.iloc[:-1]
+        fig_gap = go.Figure(go.Bar(
+            x=contributions["Difference (notches)"],
+            y=contributions["Factor"],
+            orientation="h",
+            marker=dict(color=np.where(contributions["Difference (notches)"] >= 0, high_color, low_color)),
+            hovertemplate="%{y}: %{x:+.2f} notches<extra></extra>",
+        ))
+        fig_gap.update_layout(
+            title=f"Factor contributions to the gap ({pair_a} minus {pair_b})",
+            template="plotly_white",
+            yaxis=dict(autorange="reversed"),
+            xaxis=dict(title="Notches", zeroline=True, zerolinecolor="black"),
+            margin=dict(l=60, r=40, t=80, b=60),
+        )
+
+        breakdown_col, chart_col = st.columns([4, 5])
+        breakdown_col.dataframe(
+            attribution.style.format("{:+.2f}", subset=[pair_a, pair_b, "Difference (notches)"]),
+            hide_index=True,
+        )
+        chart_col.plotly_chart(fig_gap, use_container_width=True)
+
+    # Export the whole group's matrix + factor notches. only built when someone clicks
+
+    @st.cache_data(max_entries=8)
+    def build_gap_export(year, names, group_label):
+        cube = load_gap_cube(year)
+        names = list(names)
+        with stage("peer_comparison", "export_gap_matrix"):
+            return generate_gap_matrix_export(
+                gap_matrix(cube, names), factor_notches(cube, names, factors_dict), year, group_label
+            )
+
+    export_col_gap, blank_col_1, blank_col_2 = st.columns([2, 2, 6])
+
+    with export_col_gap:
+        st.download_button(
+            label="📥 Export Gap Matrix to Excel",
+            key="gap_excel",
+            data=lambda: build_gap_export(selected_year, tuple(gap_names), gap_export_label), # only runs on click
+            on_click="ignore",
+            file_name=f"rating_gap_matrix_{selected_year}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument-spreadsheetml.sheet"
+        )
+
+stages.lap("gap_matrix")
+diagnostics_panel()
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode, ColumnsAutoSizeMode
+from st_aggrid import AgGrid, GridUpdateMode, ColumnsAutoSizeMode
 import os #--> helps to save user edits on to pc
 from io import BytesIO
 from openpyxl import Workbook
@@ -10,7 +10,12 @@ from openpyxl.utils import get_column_letter
 import json
 import gspread
 from google.oauth2.service_account import Credentials
-from gsheets_utils_sim import load_override_from_gsheet, save_override_to_gsheet
+from gsheets_utils_sim import load_override_from_gsheet
+from gsheets_utils import save_override_deltas
+from gsheets_metrics import instrument_client
+from perf_utils import StageClock, stage, diagnostics_panel
+from grid_js import HEADER_CSS, EDITED_CELLS, grid_edits, grid_layout, sim_grid_options
+from rating_tables import apply_grid_edits
 from pathlib import Path
 
 ## Page content. how it shows up on the side bar. how the page is laid out. wide in this case.
@@ -22,6 +27,9 @@ st.set_page_config(
 ## Page title
 st.title("Country Simulation")
 
+# stage timings for the diagnostics panel: each stages.lap(...) books the time since the previous lap (see perf_utils.py)
+stages = StageClock("simulation")
+
 ## Instructions
 st.markdown(
     """
@@ -52,6 +60,7 @@ def load_all_excels():
         pd.read_excel(BASE_DIR/"scaler_stats_2024_v3.xlsx")
     )
 df_transform, df_raw, coeff_index, rating_index, variable_index, country_index, public_rating_index, scalar_stats = load_all_excels()
+stages.lap("excel_load")
 #.. to go up one level in the folder
 
 ## Make copies of df_transform and df_raw. Add rounded rating col to help with fitering.
@@ -179,6 +188,7 @@ long_table_df = long_table_df.rename(columns={'long_name':'Factor','description'
 # Force Z-score cols and raw value cols to numeric to avoid annoying mixed type error
 long_table_df["Raw Value"] = pd.to_numeric(long_table_df["Raw Value"],errors="coerce")
 long_table_df["Z-score Value"] = pd.to_numeric(long_table_df["Z-score Value"],errors="coerce")
+stages.lap("table_assembly")
 
 # Connect to google sheets
 
@@ -188,10 +198,16 @@ def init_gsheets_client():
     creds_info = dict(st.secrets["gcp_service_account"])
     creds_info["private_key"] = creds_info["private_key"].replace("\\n", "\n")
     creds = Credentials.from_service_account_info(creds_info, scopes=scope)
-    return gspread.authorize(creds)
+    return instrument_client(gspread.authorize(creds))  # counts every Sheets API call (gsheets_metrics.py)
 
 client = init_gsheets_client()
 
+# Opened once per process and shared (client.open costs 2 API calls, on the quota every analyst shares).
+# The handle only holds the id; reads / writes through it still go to the live sheet
+@st.cache_resource(ttl=3600)
+def open_spreadsheet(name: str):
+    return client.open(name)
+
 ## (the below segment is the old code along with explainers...)
 
 ## scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
@@ -232,18 +248,20 @@ client = init_gsheets_client()
 # load saved simulations from the g sheet as a dataframe
 
 #already ran the authorization block of code to google sheets above. now we just use client object to open a new sheet
-sheet_sim = client.open("analyst_overrides_sim")
+sheet_sim = open_spreadsheet("analyst_overrides_sim")
 
 ## With the connection established. Let us load the analyst overrides into our long_table_df
 
 # Do similar caching to short_table above. only load unique country year combination once unless there is edit.
-@st.cache_data
+# One entry per country-year, least recently used dropped past 256, none older than 10 minutes.
+# A save evicts only its own country-year, so other analysts' warm entries survive
+@st.cache_data(ttl=600, max_entries=256)
 def fetch_overrides_sim(country: str, year: int):
-    sheet_sim = client.open("analyst_overrides_sim")
-    return load_override_from_gsheet(sheet_sim, country, year)
+    return load_override_from_gsheet(open_spreadsheet("analyst_overrides_sim"), country, year)
 #note i edit at the load_override_from_gsheet that lives in gsheets_util_sim.py to convert "" to nan at the pull step..
 
 override_df_sim = fetch_overrides_sim(selected_name, selected_year)
+stages.lap("override_fetch")
 
 ## override_df_long = load_override_from_gsheet(sheet_long, selected_name, selected_year)
 #what this function does is looks at the google sheet object (sheet_long in this case)
@@ -830,459 +848,36 @@ long_table_df = long_table_df.merge(
     on="short_name",
     how="left"
 )
+stages.lap("rating_impact")
 
-# Initialize AgGrid to create interactive table in 
-
-## Basic column options
-gb_long = GridOptionsBuilder.from_dataframe(long_table_df)
-
-## Apply to all columns
-gb_long.configure_default_column(
-    editable=False, #cannot edit
-    sortable=False, #cannot sort
-    filter=False, #cannot filter
-    resizable=False, #cannot resize
-    suppressHeaderMenuButton=True #hide the 3 dots button for me. FINALLY!
-)
-
-## Define formatters which basically controls how values display in the column
-## Define styles which basically shows how values look in a column (bold etc etc)
-## editable call_back (restrictions) that i can pass into the editable arg to control which cells can or cannot be edited
-
-combined_formatter_long = JsCode("""
-function(params) {
-  const v = params.value;
-  // 1) Blank out null/undefined/empty
-  if (v === undefined || v === null || v === '') {
-    return '';
-  }
-  // 2) If numeric, show one decimal
-  if (!isNaN(v)) {
-    return parseFloat(v).toFixed(2);
-  }
-  // 3) Otherwise (e.g. letter ratings), just display as string
-  return v.toString();
-}
-""")
-
-rawvalue_formatter_long = JsCode("""
-function(params) {
-  const v  = params.value;
-  const id = params.data.short_name;
-
-  // 1) Handle null/undefined/empty
-  if (v === undefined || v === null || v === '') {
-    // show “–” for these specific headers
-    const dashRows = [
-      'default_factor',
-      'governance_factor',
-      'fiscalperf_factor',
-      'reservebuffer_factor'
-    ];
-    return dashRows.includes(id) ? '–' : '';
-  }
-
-  // 2) Parse number
-  const num = parseFloat(v);
-  if (isNaN(num)) {
-    // if it wasn’t numeric, just show it as text
-    return v.toString();
-  }
-
-  // 3) Formatting by row key
-  switch (id) {
-    case 'wealth_factor':
-      // comma thousands, no decimals
-      return num.toLocaleString(undefined, {
-        minimumFractionDigits: 0,
-        maximumFractionDigits: 0
-      });
-
-    case 'default_hist':
-    case 'reservestatus_factor':
-      // integer (0 or 1)
-      return num.toFixed(0);
-
-    default:
-      // everything else: one decimal place
-      return num.toFixed(1);
-  }
-}
-""")
-
-hide_na_formatter_long = JsCode("""
-function(params) {
-    return params.value === undefined || params.value === null ? '' : params.value.toString();
-}
-""") ### “If the value is missing, show blank. If it’s a letter like 'A', just display it as-is — don't try to force into a numeric”
-
-hide_zero_formatter_long = JsCode("""
-function(params) {
-  const v = params.value;
-  // 1) blank out null/undefined and zero
-  if (v === undefined || v === null || v === 0) {
-    return '';
-  }
-  // 2) if it’s numeric, show two decimals
-  if (!isNaN(v)) {
-    return parseFloat(v).toFixed(2);
-  }
-  // 3) otherwise (e.g. letter), just render as string
-  return v.toString();
-}
-""")
-
-customvalue_formatter_long = JsCode("""
-function(params) {
-  const v  = params.value;
-  const id = params.data.short_name;
-
-  // -----------------------------
-  // 1) Handle null / undefined / empty
-  // -----------------------------
-  if (v === undefined || v === null || v === '') {
-    const dashRows = [
-      'default_factor',
-      'governance_factor',
-      'fiscalperf_factor',
-      'reservebuffer_factor'
-    ];
-    return dashRows.includes(id) ? '–' : '';
-  }
-
-  // -----------------------------
-  // 2) Try numeric parsing
-  // -----------------------------
-  const num = parseFloat(v);
-  if (isNaN(num)) {
-    // non-numeric text → show as-is
-    return v.toString();
-  }
-
-  // -----------------------------
-  // 3) Formatting by row key
-  // -----------------------------
-  switch (id) {
-
-    case 'wealth_factor':
-      // comma thousands, no decimals
-      return num.toLocaleString(undefined, {
-        minimumFractionDigits: 0,
-        maximumFractionDigits: 0
-      });
-
-    case 'default_hist':
-    case 'reservestatus_factor':
-      // integer flags (0 / 1)
-      return num.toFixed(0);
-
-    default:
-      // everything else: one decimal
-      return num.toFixed(1);
-  }
-}
-""")
-
-
-purple_values_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  const purpleIds = [
-    'default_hist',
-    'default_decay',
-    'voice_acct',
-    'pol_stab',
-    'gov_eff',
-    'reg_qual',
-    'rule_law',
-    'cont_corrupt',
-    'fb_avg',
-    'gov_rev_gdp',
-    'ir_rev',
-    'reserve_gdp',
-    'import_cover'
-  ];
-  if (purpleIds.includes(id)) {
-    return { color: '#B21740' };
-  }
-  return null;
-}
-""")
-
-purple_description_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  const purpleIds = [
-    'default_hist',
-    'default_decay',
-    'voice_acct',
-    'pol_stab',
-    'gov_eff',
-    'reg_qual',
-    'rule_law',
-    'cont_corrupt',
-    'fb_avg',
-    'gov_rev_gdp',
-    'ir_rev',
-    'reserve_gdp',
-    'import_cover'
-  ];
-  if (purpleIds.includes(id)) {
-    // purple, normal weight
-    return { color: '#B21740', 'font-weight': 'normal' };
-  }
-  // all other rows: black, bold
-  return { color: 'black', 'font-weight': 'bold' };
-}
-""")
-
-adjustment_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  // list of rows to render in blue + bold
-  const blueIds = [
-    'wealth_factor',
-    'size_factor',
-    'growth_factor',
-    'inflation_factor',
-    'default_factor',
-    'governance_factor',
-    'fiscalperf_factor',
-    'govdebt_factor',
-    'extperf_factor',
-    'reservebuffer_factor',
-    'reservestatus_factor'
-  ];
-  if (blueIds.includes(id)) {
-    return {
-      color: '#0000FF',
-      'font-weight': 'bold'
-    };
-  }
-  // everything else: maroon-ish, normal weight
-  return {
-    color: '#B21740',
-    'font-weight': 'normal'
-  };
-}
-""")
-
-customvalue_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  // list of rows to render in blue + bold
-  const blueIds = [
-    'wealth_factor',
-    'size_factor',
-    'growth_factor',
-    'inflation_factor',
-    'default_factor',
-    'governance_factor',
-    'fiscalperf_factor',
-    'govdebt_factor',
-    'extperf_factor',
-    'reservebuffer_factor',
-    'reservestatus_factor'
-  ];
-  if (blueIds.includes(id)) {
-    return {
-      color: '#0000FF',
-      'font-weight': 'bold'
-    };
-  }
-  // everything else: blue, normal weight
-  return {
-    color: '#0000FF',
-    'font-weight': 'normal'
-  };
-}
-""")
-
-ratingimpact_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  // list of rows to render in red + bold
-  const blueIds = [
-    'wealth_factor',
-    'size_factor',
-    'growth_factor',
-    'inflation_factor',
-    'default_factor',
-    'governance_factor',
-    'fiscalperf_factor',
-    'govdebt_factor',
-    'extperf_factor',
-    'reservebuffer_factor',
-    'reservestatus_factor'
-  ];
-  if (blueIds.includes(id)) {
-    return {
-      color: '#FF0000',
-      'font-weight': 'bold'
-    };
-  }
-  // everything else: red, normal weight
-  return {
-    color: '#FF0000',
-    'font-weight': 'normal'
-  };
-}
-""")
-
-analyst_style = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  const blueIds = [
-    'wealth_factor',
-    'size_factor',
-    'growth_factor',
-    'inflation_factor',
-    'default_factor',
-    'governance_factor',
-    'fiscalperf_factor',
-    'govdebt_factor',
-    'extperf_factor',
-    'reservebuffer_factor',
-    'reservestatus_factor'
-  ];
-  if (blueIds.includes(id)) {
-    return { color: '#0000FF' };      // blue, no bold
-  }
-  return { color: '#B21740' };        // maroon-ish, no bold
-}
-""")
-
-factor_style_long = JsCode("""
-function(params) {
-  const style = {};
-  // header sentinels to skip
-  const headers = [
-    "eco_header",
-    "insti_header",
-    "fiscal_header",
-    "ext_header",
-    "final_header"
-  ];
-  // Shade every non-header row
-  if (!headers.includes(params.data.short_name)) {
-    style['background-color'] = '#DAEEF3';
-  }
-  // Bold all text
-  style['font-weight'] = 'bold';
-  return style;
-}
-""")
-
-editable_criteria_adjustment = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  // list of short_name values that should NOT be editable
-  const locked = [
-    '',                  // blank header rows
-    'const',
-    'default_factor',
-    'governance_factor',
-    'fiscalperf_factor',
-    'reservebuffer_factor',
-    'eco_header',
-    'insti_header',
-    'fiscal_header',
-    'ext_header'                                                                   
-  ];
-  // return false (lock) when id is in our locked list; true otherwise
-  return !locked.includes(id);
-}
-""")
-
-editable_criteria_analyst = JsCode("""
-function(params) {
-  const id = params.data.short_name;
-  // lock only blank header rows and the 'const' row
-  if (id === '' || id === 'const') {
-    return false;
-  }
-  return true;
-}
-""")
-
-## Apply column by column configuration in df...
-
-gb_long.configure_column("short_name", hide=True)
-gb_long.configure_column("Factor", valueFormatter=combined_formatter_long, cellStyle=factor_style_long,maxWidth=320,minWidth=320)
-gb_long.configure_column("Constituent Variables", valueFormatter=combined_formatter_long, cellStyle=purple_description_style,
-                         maxWidth=420,minWidth=420)
-gb_long.configure_column("Raw Value", valueFormatter=rawvalue_formatter_long, filter=False, cellStyle = purple_values_style,maxWidth=120,minWidth=120)
-gb_long.configure_column("Z-score Value", valueFormatter=combined_formatter_long, filter=False, cellStyle = purple_values_style,maxWidth=140,minWidth=140)
-
-## Make Custom Value columns editable
-
-gb_long.configure_column("Custom Value",valueFormatter=customvalue_formatter_long, cellStyle = customvalue_style,
-                         editable = editable_criteria_adjustment, filter=False, headerClass="ag-header-cell-label-left",
-                         cellClass="ag-left-aligned-cell",maxWidth=120,minWidth=120)
-
-## Make Configuration for Rating Impact column
-gb_long.configure_column("Rating Impact",valueFormatter=combined_formatter_long, cellStyle = ratingimpact_style,
-                         filter=False, headerClass="ag-header-cell-label-left",
-                         cellClass="ag-left-aligned-cell",maxWidth=140,minWidth=140)
-
-## Now we apply the color schemes to the grid
-
-custom_css_override_long = {
-    # header cell label (the text container)
-    ".ag-header-cell-label": {
-        "background-color": "#1A3B73 !important",
-        "color":            "white !important",
-        "font-weight":      "bold !important",
-        #"font-size":        "16px !important"
-    },
-    # the very header row wrapper (fills behind the labels)
-    ".ag-header": {
-        "background-color": "#1A3B73 !important"
-    },
-}
-
-LS_gridOptions_long = gb_long.build()
-LS_gridOptions_long["getRowStyle"] = JsCode("""
-  function(params) {
-    // list of the exact Factor values you want to style
-    const headers = [
-      "REAL ECONOMY PILLAR (25%)",
-      "MONETARY & INSTITUTIONS PILLAR (44%)",
-      "FISCAL PILLAR (17%)",
-      "EXTERNAL PILLAR (14%)",
-      "SOVEREIGN CREDIT RATING"
-    ];
-    // if this row’s Factor is one of the headers, return a style object
-    if (headers.includes(params.data.Factor)) {
-      return {
-        "font-weight":      "bold",
-        "background-color": "#B6CEE4"   // light tint—change as you like
-      };
-    }
-    return null;  // otherwise use default styling
-  }
-""")
+# Grid options: formatters, cell styles and which cells are editable.
+# Built once per table layout and shared by every rerun / session (see grid_js.py)
+LS_gridOptions_long = sim_grid_options(grid_layout(long_table_df))
+stages.lap("grid_options")
 
 ## Finally we initialize the grid
 
 grid_response_long = AgGrid(
     long_table_df,
     gridOptions=LS_gridOptions_long,
-    custom_css = custom_css_override_long,
+    custom_css = HEADER_CSS,
     allow_unsafe_jscode=True,
-    update_mode='VALUE_CHANGED',  #necessary to capture edits
+    update_on=["cellValueChanged"],  #necessary to capture edits
+    data_return_mode="CUSTOM", custom_jscode_for_grid_return=EDITED_CELLS, # only the edited cells come back (grid_js.py)
     fit_columns_on_grid_load=False,# we’re sizing to contents instead
     columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS, #columns size to fit contents
     suppressColumnVirtualisation=True,    # measure off-screen columns too
     theme='alpine',
     height=500,  # manually control table height without scrolling
     )
+stages.lap("grid_build")
 
 
-## Captures edits made by user in grid
-updated_df_long = grid_response_long["data"] #extracts the updated DataFrame after user edits from AgGrid (Custom Value col)
-updated_df_long["Custom Value"] = pd.to_numeric(updated_df_long["Custom Value"], errors="coerce") #safety layer to ensure only numeric captured
-#errors = coerce means you dont crash the app if non numeric. just input nan value. which we then turn to zero!
+## Captures edits made by user in grid: [(short_name, column, new value), ...] for the cells edited since the grid loaded
+## and applies them to our copy of the table
+edits = grid_edits(grid_response_long)
+updated_df_long = apply_grid_edits(long_table_df, edits, numeric={"Custom Value": np.nan}) #safety layer to ensure only numeric captured
+#anything non numeric becomes a nan value, i.e. no custom value
 
 # Put the Save + Export buttons side by side
 # carve the page into 3 chunks: 
@@ -1295,24 +890,25 @@ save_col_long, blank_col_1, blank_col_2= st.columns([2, 2, 6])
 with save_col_long:
     if st.button("💾 Save Analyst Input",key="sim_save"):
 
-      # Save only the override columns (factor-level edits) to a file
+      # Save only the edited cells of the override column
+      # (google sheets does not recognize nan values: save_override_deltas writes them as blank "")
       columns_to_save_long = ["short_name", "Custom Value"]
-      updated_subset_long = updated_df_long[columns_to_save_long]
-
-      # this is a fail safe as google sheets does not recognize nan values, so we convert it to blank ""
-      to_save = updated_subset_long.copy()
-      to_save["Custom Value"] = pd.to_numeric(to_save["Custom Value"], errors="coerce")
-      to_save["Custom Value"] = to_save["Custom Value"].where(to_save["Custom Value"].notna(), "")
+      edited_cells = [(name, column) for name, column, _ in edits if column in columns_to_save_long]
 
-      # Use the full Google Sheet, then pass selected_name to target the right tab
-      save_override_to_gsheet(sheet_sim, to_save, selected_name, selected_year)
+      if not edited_cells:
+        st.info("ℹ️ No edits to save.")
+      else:
+        # Use the full Google Sheet, then pass selected_name to target the right tab
+        with stage("simulation", "override_save"):
+          save_override_deltas(sheet_sim, updated_df_long[columns_to_save_long], edited_cells, selected_name, selected_year)
 
-      # clear only the cache for fetch_overrides
-      fetch_overrides_sim.clear()
+        # evict only this country-year
+        fetch_overrides_sim.clear(selected_name, selected_year)
 
-      st.success("✅ Overrides saved and rating updated.")
-      st.rerun() #rerun entire script from top to bottom so analyst can see update immediately
+        st.success("✅ Overrides saved and rating updated.")
+        st.rerun() #rerun entire script from top to bottom so analyst can see update immediately
 
+diagnostics_panel()
 
 #### STOP HERE FOR NOW ###
 
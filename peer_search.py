@@ -0,0 +1,84 @@
+# Nearest-neighbour peer search: the sovereigns that look most like a country (or a group of countries)
+# in the model's own terms, rather than only "same rating bucket".
+# Two spaces, both straight from transform_data.xlsx (every column there is already a cross-section z-score):
+#   - "factor":   the 11 factor z-scores the model scores on
+#   - "variable": the 20 constituent variables behind those factors
+# With coefficient weights each dimension is scaled by the notches it moves the model rating,
+# so the distance reads as "how differently would the model score these two countries".
+# One year is ~140 countries, so the whole (countries x countries) distance matrix is tiny
+# and is worked out in one go with numpy; a search is then a row lookup plus a sort.
+
+import numpy as np
+import pandas as pd
+
+from rating_tables import FACTORS, SUBFACTORS
+
+# constituent variables in the order of the supplementary table, with the factor each one feeds
+VARIABLE_FACTOR = {
+    "ngdp_pc": "wealth_factor",
+    "ngdp": "size_factor",
+    "growth_avg": "growth_factor",
+    "inf_avg": "inflation_factor",
+    **{var: "default_factor" for var in SUBFACTORS["default_factor"]},
+    **{var: "governance_factor" for var in SUBFACTORS["governance_factor"]},
+    **{var: "fiscalperf_factor" for var in SUBFACTORS["fiscalperf_factor"]},
+    "gov_debt_gdp": "govdebt_factor",
+    "cab_avg": "extperf_factor",
+    **{var: "reservebuffer_factor" for var in SUBFACTORS["reservebuffer_factor"]},
+    "reserve_fx": "reservestatus_factor",
+}
+
+SPACES = {
+    "factor": FACTORS,
+    "variable": list(VARIABLE_FACTOR),
+}
+
+
+def coefficient_weights(coeff_index, space):
+    """
+    Per-dimension weights: |coefficient| for a factor. A constituent variable gets its factor's
+    |coefficient| split evenly across the factor's constituents (the factors are averages of them).
+    """
+    coef = coeff_index.set_index("Unnamed: 0")["coefficient"].abs()
+    if space == "factor":
+        return coef[FACTORS].to_numpy(dtype=float)
+    counts = pd.Series(VARIABLE_FACTOR).value_counts()
+    return np.array([coef[f] / counts[f] for f in VARIABLE_FACTOR.values()], dtype=float)
+
+
+def build_distance_index(df_year, space="factor", weights=None):
+    """
+    {"names": country names, "rows": {name: row}, "distances": (n x n) euclidean distances}
+    for one year of transform_data in the chosen space. A missing z-score counts as 0 (the cross-section mean).
+    """
+    X = df_year[SPACES[space]].to_numpy(dtype=float)
+    X = np.nan_to_num(X, nan=0.0)
+    if weights is not None:
+        X = X * weights
+
+    # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b for every pair at once
+    sq = (X ** 2).sum(axis=1)
+    d2 = sq[:, None] + sq[None, :] - 2 * X @ X.T
+    distances = np.sqrt(np.clip(d2, 0, None))
+    np.fill_diagonal(distances, 0.0)
+    distances.flags.writeable = False
+
+    names = df_year["name"].to_numpy()
+    return {"names": names, "rows": {name: i for i, name in enumerate(names)}, "distances": distances}
+
+
+def nearest_peers(index, selection, k=5):
+    """
+    The k countries closest to the selection (mean distance to the selected countries), nearest first,
+    selection itself left out. Returns a DataFrame with name and distance.
+    """
+    rows = [index["rows"][name] for name in selection if name in index["rows"]]
+    if not rows:
+        return pd.DataFrame({"name": [], "distance": []})
+
+    distance = index["distances"][rows].mean(axis=0)
+    candidates = np.setdiff1d(np.arange(len(distance)), rows)
+    k = min(k, len(candidates))
+    nearest = candidates[np.argpartition(distance[candidates], k - 1)[:k]] if k else candidates[:0]
+    nearest = nearest[np.argsort(distance[nearest], kind="stable")]
+    return pd.DataFrame({"name": index["names"][nearest], "distance": distance[nearest]})
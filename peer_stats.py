@@ -0,0 +1,71 @@
+# Peer statistics for the Country Comparison page, precomputed once for every year x peer bucket x variable.
+# The page used to filter the peer set and run np.percentile / np.histogram_bin_edges / np.mean(vals <= x)
+# for ~30 charts on every rerun, even when only the country changed.
+# Now the cube holds each peer set's sorted values, percentiles and FD bin edges, and the selected country's
+# percentile rank is a searchsorted lookup into the sorted values.
+
+import numpy as np
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def _entry(values, bins_rule="fd"):
+    # sorted non-missing values + the statistics the charts need
+    vals = np.sort(values[~np.isnan(values)])
+    if len(vals) == 0:
+        return {"sorted": vals, "percentiles": np.full(len(PERCENTILES), np.nan), "edges": None}
+    return {
+        "sorted": vals,
+        "percentiles": np.percentile(vals, PERCENTILES),
+        "edges": np.histogram_bin_edges(vals, bins=bins_rule),
+    }
+
+
+def build_stats_cube(df, rating_ranges, variables):
+    """
+    {(year, bucket, variable): {"sorted", "percentiles", "edges", "n_rows"}} for every year in df,
+    every bucket in rating_ranges (bounds on the rounded public rating) and every variable.
+    n_rows is the number of countries in the bucket, missing values included.
+    """
+    cube = {}
+    rounded = df["rating"].round()
+    for year in df["year"].unique():
+        in_year = (df["year"] == year).to_numpy()
+        for bucket, (low, high) in rating_ranges.items():
+            rows = in_year & rounded.between(low, high).to_numpy()
+            for var in variables:
+                entry = _entry(df.loc[rows, var].to_numpy(dtype=float))
+                entry["n_rows"] = int(rows.sum())
+                cube[(year, bucket, var)] = entry
+    return cube
+
+
+def in_bucket(rating, rating_ranges, bucket):
+    # same test the cube used: rounded public rating within the bucket's bounds (a missing rating is never in)
+    low, high = rating_ranges[bucket]
+    return bool(low <= round(rating) <= high) if rating == rating else False
+
+
+def peer_view(cube, year, bucket, var, my_val, country_in_bucket=True):
+    """
+    Statistics of the peer set for one chart plus the selected country's percentile rank.
+    The page compares a country against buckets it isn't in by adding it to the peers. Only that case
+    recomputes anything, by inserting the one value into the cached sorted values ("extra" is that value,
+    so anything cached on the peer set can key on it).
+    """
+    entry = cube[(year, bucket, var)]
+    vals, percentiles, edges = entry["sorted"], entry["percentiles"], entry["edges"]
+    extra = None  # value added to the peers, if any
+
+    if not country_in_bucket and my_val == my_val:  # NaN values get dropped from the peers anyway
+        extra = my_val
+        vals = np.insert(vals, np.searchsorted(vals, my_val), my_val)
+        percentiles = np.percentile(vals, PERCENTILES)
+        edges = np.histogram_bin_edges(vals, bins="fd")
+
+    # share of peers at or below the country, i.e. np.mean(vals <= my_val)
+    if my_val == my_val and len(vals):
+        rank = np.searchsorted(vals, my_val, side="right") / len(vals) * 100
+    else:
+        rank = 0.0
+    return {"sorted": vals, "percentiles": percentiles, "edges": edges, "rank": rank, "extra": extra}
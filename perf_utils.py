@@ -0,0 +1,248 @@
+# Wall-clock timings for the app pages, so we can see where a rerun spends its time.
+# Two layers:
+# 1) per rerun (timed / get_timings): each rerun starts a fresh set of timings in st.session_state,
+#    e.g. the per-chart timings on Country Comparison.
+# 2) per stage across the whole process (StageClock / stage / stage_stats): every page books its main stages
+#    (excel load, override fetch, table assembly, grid build, charts, exports) into a rolling window shared by
+#    all sessions, reported as p50 / p95. Write-role users see it in the sidebar diagnostics panel,
+#    next to the Google Sheets API call counts and quota usage (gsheets_metrics.py)
+#    and the memory held by caches / session state (memory_utils.py).
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from gsheets_metrics import READ_QUOTA_PER_MIN, WRITE_QUOTA_PER_MIN, call_stats, calls_per_minute, quota_usage, report
+from memory_utils import (
+    SAMPLER_ENV,
+    SNAPSHOT_INTERVAL_S,
+    cache_memory,
+    latest_totals,
+    memory_growth,
+    memory_report,
+    reset_snapshots,
+    sampler_enabled_by_env,
+    sampler_running,
+    session_memory,
+    start_sampler,
+    stop_sampler,
+)
+
+TIMINGS_KEY = "perf_timings"
+
+
+def reset_timings():
+    # call once near the top of a page: timings then only ever describe the current rerun
+    st.session_state[TIMINGS_KEY] = {}
+
+
+@contextmanager
+def timed(label, stage):
+    """Times the with-block and records it (in ms) as timings[label][stage] for this rerun."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        st.session_state.setdefault(TIMINGS_KEY, {}).setdefault(label, {})[stage] = elapsed_ms
+
+
+def get_timings():
+    # {label: {stage: ms}} for the current rerun
+    return st.session_state.get(TIMINGS_KEY, {})
+
+
+## Process-wide stage statistics
+
+STAGE_WINDOW = 500  # samples kept per page / stage; older ones roll off
+
+_stage_samples = {}  # (page, stage) -> deque of (ms, finished at)
+_stage_lock = threading.Lock()  # every session's script thread writes here
+
+
+def record_stage(page, stage, elapsed_ms):
+    with _stage_lock:
+        samples = _stage_samples.get((page, stage))
+        if samples is None:
+            samples = _stage_samples[(page, stage)] = deque(maxlen=STAGE_WINDOW)
+        samples.append((elapsed_ms, time.time()))
+
+
+@contextmanager
+def stage(page, name):
+    """Times the with-block into the process-wide stats as page / name (for work inside functions, e.g. exports)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(page, name, (time.perf_counter() - start) * 1000)
+
+
+class StageClock:
+    """
+    Lap timer for a top-to-bottom page script, so stages can be timed without indenting them:
+    lap(stage) books the time since the previous lap (or since the clock started) to that stage.
+    skip() restarts the lap without booking anything (e.g. after waiting on something that isn't a stage).
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        record_stage(self.page, stage, (now - self.last) * 1000)
+        self.last = now
+
+    def skip(self):
+        self.last = time.perf_counter()
+
+
+def stage_stats():
+    """One row per page / stage: calls in the window, p50 / p95 / max / last in ms, slowest p95 first."""
+    with _stage_lock:
+        snapshot = {key: list(samples) for key, samples in _stage_samples.items()}
+
+    rows = []
+    for (page, name), samples in snapshot.items():
+        ms = np.array([sample[0] for sample in samples])
+        rows.append({
+            "page": page,
+            "stage": name,
+            "calls": len(ms),
+            "p50_ms": np.percentile(ms, 50),
+            "p95_ms": np.percentile(ms, 95),
+            "max_ms": ms.max(),
+            "last_ms": ms[-1],
+            "last_at": datetime.fromtimestamp(samples[-1][1]).strftime("%H:%M:%S"),
+        })
+    columns = ["page", "stage", "calls", "p50_ms", "p95_ms", "max_ms", "last_ms", "last_at"]
+    return pd.DataFrame(rows, columns=columns).sort_values("p95_ms", ascending=False, ignore_index=True)
+
+
+def reset_stage_stats():
+    with _stage_lock:
+        _stage_samples.clear()
+
+
+def dump_stage_stats():
+    # prints the table + the Sheets API and memory reports to the server log (stdout, same place as the gsheets warnings)
+    text = stage_stats().round(1).to_string(index=False)
+    text = f"⏱️ Stage timings ({datetime.now():%Y-%m-%d %H:%M:%S}, window {STAGE_WINDOW} per stage)\n{text}\n{report()}\n{memory_report()}"
+    print(text, flush=True)
+    return text
+
+
+def _switch_sampler():
+    # on_change of the "Track memory growth" toggle, before the rerun
+    if st.session_state["diagnostics_memory_sampler"]:
+        start_sampler()
+    else:
+        stop_sampler()
+
+
+def diagnostics_panel():
+    """Sidebar panel with the process-wide stage stats, Sheets API usage and memory. Only shown to write-role users."""
+    if sampler_enabled_by_env():
+        start_sampler()  # the server opted in to memory snapshots from the start (MEMORY_SAMPLER=1)
+    if st.session_state.get("role") != "write":
+        return
+
+    with st.sidebar.expander("🩺 Diagnostics", expanded=False):
+        stats = stage_stats()
+        if stats.empty:
+            st.caption("No stage timings yet.")
+        else:
+            st.dataframe(
+                stats,
+                hide_index=True,
+                column_config={
+                    col: st.column_config.NumberColumn(format="%.0f") for col in ["p50_ms", "p95_ms", "max_ms", "last_ms"]
+                },
+            )
+            st.caption(f"All sessions on this server, last {STAGE_WINDOW} runs per stage.")
+
+        ## Google Sheets API: every analyst shares the service account's per-minute quota
+        st.markdown("**Google Sheets API**")
+        usage = quota_usage()
+        reads_col, writes_col, throttled_col = st.columns(3)
+        reads_col.metric("Reads / min", f"{usage['reads']}/{READ_QUOTA_PER_MIN}")
+        writes_col.metric("Writes / min", f"{usage['writes']}/{WRITE_QUOTA_PER_MIN}")
+        throttled_col.metric("429s", usage["total_throttled"], delta=usage["throttled"] or None, delta_color="inverse")
+
+        by_tab = st.toggle("Per tab", key="diagnostics_gsheets_tabs")
+        st.dataframe(
+            call_stats(("operation", "spreadsheet", "tab") if by_tab else ("operation", "spreadsheet")),
+            hide_index=True,
+            column_config={col: st.column_config.NumberColumn(format="%.0f") for col in ["p50_ms", "p95_ms"]},
+        )
+        st.caption("Busiest minutes (% of the per-minute quota)")
+        st.dataframe(
+            calls_per_minute().head(10),
+            hide_index=True,
+            column_config={
+                col: st.column_config.NumberColumn(format="%.0f%%") for col in ["read_quota_pct", "write_quota_pct"]
+            },
+        )
+
+        ## Memory: what the caches and every session's state hold, and whether any of it keeps growing
+        ## the snapshots deep-size every cache and session, so they only run once someone turns them on here
+        st.markdown("**Memory**")
+        # one switch for the whole server: every write-role user sees whether it is on, and only flipping it acts
+        st.session_state["diagnostics_memory_sampler"] = sampler_running()
+        st.toggle(
+            "Track memory growth",
+            key="diagnostics_memory_sampler",
+            on_change=_switch_sampler,
+            help=f"A background snapshot of every cache and session every {SNAPSHOT_INTERVAL_S}s, for the whole server, "
+                 f"until turned off here or the server restarts. Set {SAMPLER_ENV}=1 to start it with the server.",
+        )
+        track = sampler_running()
+
+        totals = latest_totals()
+        if not totals:
+            st.caption("No memory snapshot yet." if track else "Not tracking memory growth.")
+        else:
+            rss_col, cache_col, state_col = st.columns(3)
+            rss_col.metric("RSS", f"{totals['rss']:.0f} MB" if totals["rss"] is not None else "n/a")
+            cache_col.metric("Caches", f"{totals['cache_data'] + totals['cache_resource']:.0f} MB")
+            state_col.metric("Session state", f"{totals['session_state']:.1f} MB", help=f"{totals['sessions']} sessions")
+
+            growth = memory_growth()
+            flagged = growth[growth["flag"] != ""]
+            if not flagged.empty:
+                st.warning("Still growing: " + ", ".join(flagged["component"]))
+            st.caption(f"Change over the kept snapshots (one every {SNAPSHOT_INTERVAL_S}s)")
+            st.dataframe(
+                growth,
+                hide_index=True,
+                column_config={col: st.column_config.NumberColumn(format="%.1f") for col in ["first_mb", "last_mb", "change_mb", "mb_per_hour"]},
+            )
+
+        if st.toggle("Cache / session detail", key="diagnostics_memory_detail"):
+            # sized on demand: walking every cached object takes a moment
+            st.dataframe(
+                cache_memory(),
+                hide_index=True,
+                column_config={col: st.column_config.NumberColumn(format="%.2f") for col in ["mb", "largest_mb"]},
+            )
+            st.dataframe(
+                session_memory().head(20),
+                hide_index=True,
+                column_config={"mb": st.column_config.NumberColumn(format="%.3f")},
+            )
+
+        log_col, reset_col = st.columns(2)
+        if log_col.button("📝 Write to log", key="diagnostics_dump"):
+            dump_stage_stats()
+            st.toast("Stage timings written to the server log")
+        if reset_col.button("🧹 Reset", key="diagnostics_reset"):
+            reset_stage_stats()
+            reset_snapshots()
+            st.rerun()
@@ -0,0 +1,108 @@
+# Rating book: the formatted main + supplementary rating tables for every country in coverage_list.xlsx, for one year.
+# Used by generate_rating_book.py (command line) and the "Rating book" download on the main page.
+#
+# Why it is fast:
+# 1) every country is scored in one matrix multiply (rating_tables.score_countries)
+# 2) overrides come from gsheets_utils.load_overrides_batch, a handful of API calls instead of ~2 per country per sheet
+# 3) the openpyxl rendering (the slow part) runs in a process pool when writing a zip of per-country workbooks
+
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+
+from export_utils import (
+    generate_custom_export,
+    generate_custom_export_long,
+    write_custom_export,
+    write_custom_export_long,
+    _to_bytes,
+)
+from rating_tables import score_countries, build_short_table, apply_short_overrides, build_long_table, apply_long_overrides
+
+OVERRIDE_COLUMNS = ["short_name", "Adjustment", "Analyst Comment"]
+
+
+def build_book_tables(year, countries, df_transform, df_raw, coeff_index, variable_index, rating_dict,
+                      overrides_short, overrides_long):
+    """
+    Builds the export-ready main and supplementary tables (short_name dropped, same as the page exports)
+    for every country. overrides_short / overrides_long map country -> override df.
+    Returns ([(country, main df, supplementary df), ...], [countries with no data for the year]).
+    """
+    year_transform = df_transform[df_transform["year"] == year]
+    year_raw = df_raw[df_raw["year"] == year]
+    scores = score_countries(year_transform, coeff_index)
+    empty = pd.DataFrame(columns=OVERRIDE_COLUMNS)
+
+    tables, skipped = [], []
+    for name in countries:
+        rows = year_transform.index[year_transform["name"] == name]
+        if len(rows) == 0:
+            skipped.append(name)
+            continue
+        i = rows[0]
+
+        short_df = build_short_table(year_transform.loc[i], scores.loc[i], coeff_index, variable_index)
+        short_df = apply_short_overrides(short_df, overrides_short.get(name, empty), rating_dict)
+
+        long_df = build_long_table(year_raw[year_raw["name"] == name], year_transform.loc[[i]], variable_index)
+        long_df = apply_long_overrides(long_df, overrides_long.get(name, empty))
+
+        tables.append((name, short_df.drop(columns=["short_name"]), long_df.drop(columns=["short_name"])))
+    return tables, skipped
+
+
+def _render_country(args):
+    # runs in a worker process: one country's two formatted workbooks as bytes
+    name, year, short_df, long_df = args
+    return name, generate_custom_export(short_df, name, year), generate_custom_export_long(long_df, name, year)
+
+
+def _sheet_title(name, suffix):
+    # excel caps sheet names at 31 characters
+    return f"{name[:31 - len(suffix) - 1]} {suffix}"
+
+
+def build_rating_book(tables, year, fmt="zip", workers=None):
+    """
+    Renders the tables from build_book_tables into
+    - fmt="zip": one main + one supplementary workbook per country, rendered across a process pool
+    - fmt="xlsx": a single workbook with a main and a supplementary sheet per country
+    and returns the file as bytes.
+    """
+    if fmt == "xlsx":
+        # one workbook can only be written from one process, so this path renders sequentially
+        wb = Workbook()
+        wb.remove(wb.active)
+        for name, short_df, long_df in tables:
+            write_custom_export(wb.create_sheet(_sheet_title(name, "main")), short_df, name, year)
+            write_custom_export_long(wb.create_sheet(_sheet_title(name, "supp")), long_df, name, year)
+        return _to_bytes(wb)
+
+    if fmt != "zip":
+        raise ValueError(f"Unknown rating book format: {fmt!r}")
+
+    jobs = [(name, year, short_df, long_df) for name, short_df, long_df in tables]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        rendered = map(_render_country, jobs)
+    else:
+        # spawn rather than fork: the app calls this from a Streamlit script thread, and forking a threaded process is unsafe
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        rendered = pool.map(_render_country, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+
+    out = BytesIO()
+    try:
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, main_bytes, supp_bytes in rendered:
+                zf.writestr(f"{name}/{name} {year} main.xlsx", main_bytes)
+                zf.writestr(f"{name}/{name} {year} supplementary.xlsx", supp_bytes)
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    return out.getvalue()
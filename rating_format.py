@@ -0,0 +1,63 @@
+# Rating formatting done on whole columns at once: numeric rating (1-22 scale) -> letter rating,
+# and the ERV dot line that shows where a rating sits inside its notch.
+# Used by generate_LS_rating_list.py and the app pages. Everything here works on numpy arrays / pandas Series,
+# so it costs the same whether it runs on one year of 137 countries or every year and vintage.
+
+import numpy as np
+
+DOT_WIDTH = 21  # characters in an ERV dot line
+
+# every possible dot line, built once. DOT_LINES[pos] has the dot pos characters from the left
+DOT_LINES = np.array([" " * pos + "⚫" + " " * (DOT_WIDTH - 1 - pos) for pos in range(DOT_WIDTH)], dtype=object)
+
+
+def letter_lookup(rating_index, missing="Unknown"):
+    """
+    Array where lookup[n] is the letter rating for numeric rating n, built from index_rating_scale.xlsx.
+    Slot 0 is `missing` (the scale starts at 1).
+    """
+    numeric = rating_index["Numeric"].to_numpy(dtype=int)
+    lookup = np.full(numeric.max() + 1, missing, dtype=object)
+    lookup[numeric] = rating_index["Credit Rating"].to_numpy()
+    return lookup
+
+
+def ratings_to_letters(values, lookup, missing="Unknown", clamp=False):
+    """
+    Maps numeric ratings to letters for a whole array / Series in one indexing step.
+    Ratings are rounded half-to-even like round(). Anything off the scale (or NaN) becomes `missing`,
+    unless clamp=True, which forces it onto the 1-22 scale first.
+    """
+    x = np.rint(np.asarray(values, dtype=float))
+    if clamp:
+        x = np.clip(x, 1, len(lookup) - 1)
+    on_scale = np.isfinite(x) & (x >= 1) & (x < len(lookup))
+    out = np.full(x.shape, missing, dtype=object)
+    out[on_scale] = lookup[x[on_scale].astype(int)]
+    return out
+
+
+def rating_letter(value, lookup, missing=""):
+    # single value version, handy for Styler.format callbacks
+    return ratings_to_letters([value], lookup, missing=missing)[0]
+
+
+def erv_distance(ls_rating):
+    """
+    Where the rating sits within its notch: 0 at the bottom (x.5 below) up to 1 at the top (x.5 above).
+    Ratings at the ends of the scale are pinned to 0 (<= 1) and 1 (>= 22).
+    """
+    r = np.asarray(ls_rating, dtype=float)
+    distance = r - (np.round(r) - 0.5)
+    distance = np.where(r <= 1, 0.0, distance)
+    return np.where(r >= 22, 1.0, distance)
+
+
+def erv_dot_lines(distance):
+    """
+    21 character dot lines for an array of erv_distance values: the dot moves from the right (0.0)
+    to the left (1.0). Positions are quantized to 2 decimals of distance, then looked up in DOT_LINES.
+    """
+    d = np.round(np.asarray(distance, dtype=float), 2)
+    pos = np.rint((1 - d) * (DOT_WIDTH - 1)).astype(int)
+    return DOT_LINES[pos]
@@ -0,0 +1,73 @@
+# Pairwise model rating gaps: "why is X rated N notches above Y?"
+# The model is linear (rating = const + sum of coefficient * z-score), so the gap between two countries
+# splits exactly into per-factor notch differences. The constant cancels out.
+# Per year we keep every country's factor notches and the full (countries x countries) gap matrices.
+# A pair's breakdown is then the difference of two rows, and a group's matrix is a slice.
+
+import numpy as np
+import pandas as pd
+
+from rating_tables import FACTORS, score_countries
+
+
+def build_gap_cube(df_year, coeff_index):
+    """
+    {"names", "rows": {name: row}, "notches": (n x 11) factor notches, "model" / "public": (n,) ratings,
+     "model_gap" / "public_gap": (n x n) row country minus column country} for one year of transform_data.
+    The arrays are read-only: the cube is shared between sessions.
+    """
+    notches = score_countries(df_year, coeff_index)
+    model = notches.sum(axis=1).to_numpy()  # const + factor notches = predicted_rating
+    public = df_year["rating"].to_numpy(dtype=float)
+
+    cube = {
+        "names": df_year["name"].to_numpy(),
+        "rows": {name: i for i, name in enumerate(df_year["name"])},
+        "notches": notches[FACTORS].to_numpy(),
+        "model": model,
+        "public": public,
+        "model_gap": model[:, None] - model[None, :],
+        "public_gap": public[:, None] - public[None, :],
+    }
+    for value in cube.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return cube
+
+
+def gap_matrix(cube, names, which="model_gap"):
+    """(names x names) slice of a gap matrix: row country's rating minus column country's."""
+    rows = [cube["rows"][name] for name in names]
+    return pd.DataFrame(cube[which][np.ix_(rows, rows)], index=names, columns=names)
+
+
+def pair_attribution(cube, a, b, factor_names=None):
+    """
+    Per-factor notches for countries a and b and the difference (a - b).
+    The differences add up exactly to the model rating gap, shown in the last row.
+    """
+    i, j = cube["rows"][a], cube["rows"][b]
+    labels = [factor_names.get(f, f) for f in FACTORS] if factor_names else FACTORS
+    df = pd.DataFrame({
+        "Factor": labels,
+        a: cube["notches"][i],
+        b: cube["notches"][j],
+        "Difference (notches)": cube["notches"][i] - cube["notches"][j],
+    })
+    total = pd.DataFrame([{
+        "Factor": "Model Rating Gap",
+        a: cube["model"][i],
+        b: cube["model"][j],
+        "Difference (notches)": cube["model_gap"][i, j],
+    }])
+    return pd.concat([df, total], ignore_index=True)
+
+
+def factor_notches(cube, names, factor_names=None):
+    """Factor notches + model rating for a group, one row per country (any pair's attribution is a row difference)."""
+    rows = [cube["rows"][name] for name in names]
+    labels = [factor_names.get(f, f) for f in FACTORS] if factor_names else FACTORS
+    df = pd.DataFrame(cube["notches"][rows], index=names, columns=labels)
+    df["Model Rating"] = cube["model"][rows]
+    df["Public Rating"] = cube["public"][rows]
+    return df
@@ -0,0 +1,227 @@
+# Builds the main (11 factor) and supplementary (constituent variable) rating tables for a country-year.
+# This used to be written out step by step inside Sovereign_Credit_Rating_Model.py.
+# It lives here now so the page and the bulk rating book (rating_book.py) build exactly the same tables.
+
+import numpy as np
+import pandas as pd
+
+# the 11 factors of the model, in the order they appear in the main table
+FACTORS = [
+    "wealth_factor",
+    "size_factor",
+    "growth_factor",
+    "inflation_factor",
+    "default_factor",
+    "governance_factor",
+    "fiscalperf_factor",
+    "govdebt_factor",
+    "extperf_factor",
+    "reservebuffer_factor",
+    "reservestatus_factor",
+]
+
+# constituent variables that roll up into a factor's adjustment in the supplementary table
+SUBFACTORS = {
+    "default_factor": ["default_hist", "default_decay"],
+    "governance_factor": ["voice_acct", "pol_stab", "gov_eff", "reg_qual", "rule_law", "cont_corrupt"],
+    "fiscalperf_factor": ["fb_avg", "gov_rev_gdp", "ir_rev"],
+    "reservebuffer_factor": ["reserve_gdp", "import_cover"],
+}
+
+# single variable factors are stored under the raw variable's name in raw_data.xlsx
+RAW_TO_FACTOR = {
+    "ngdp_pc": "wealth_factor",
+    "ngdp": "size_factor",
+    "growth_avg": "growth_factor",
+    "inf_avg": "inflation_factor",
+    "gov_debt_gdp": "govdebt_factor",
+    "cab_avg": "extperf_factor",
+    "reserve_fx": "reservestatus_factor",
+}
+
+
+def _header_row(short_name, label, columns):
+    # blank section header row, e.g. REAL ECONOMY PILLAR (25%)
+    row = {col: "" for col in columns}
+    row["short_name"] = short_name
+    row["long_name"] = label
+    return pd.DataFrame([row])
+
+
+def clamp_letter(numeric_rating, rating_dict):
+    # force the numeric rating onto the 1-22 scale before mapping it to a letter
+    return rating_dict.get(min(22, max(1, round(numeric_rating))), "N/A")
+
+
+def score_countries(df_rows, coeff_index):
+    """
+    Rating (notches) = coefficient * z-score for every row of df_rows in one go.
+    Returns a frame on df_rows' index with a 'const' column plus one column per factor;
+    the row sum is the model predicted rating.
+    """
+    coef = coeff_index.set_index("Unnamed: 0")["coefficient"]
+    z = df_rows[FACTORS].to_numpy(dtype=float)
+    notches = z * coef[FACTORS].to_numpy(dtype=float)  # broadcasts the coefficients across every country
+    out = pd.DataFrame(notches, index=df_rows.index, columns=FACTORS)
+    out.insert(0, "const", coef["const"])
+    return out
+
+
+def build_short_table(z_row, notch_row, coeff_index, variable_index):
+    """
+    Main table before analyst overrides: const + 11 factor rows, the model rating row and pillar headers.
+    z_row is one row of transform_data, notch_row the matching row of score_countries().
+    """
+    names = ["const"] + FACTORS
+    coef = coeff_index.set_index("Unnamed: 0")["coefficient"]
+    long_names = variable_index.set_index("short_name")["long_name"]
+
+    body = pd.DataFrame({
+        "short_name": names,
+        "long_name": long_names.reindex(names).to_numpy(),
+        "coefficient": coef.reindex(names).to_numpy(),
+        "Z-score Value": np.array([1.0] + [z_row[f] for f in FACTORS], dtype=float),
+        "Rating (notches)": notch_row[names].to_numpy(dtype=float),
+    })
+
+    # model predicted rating (numeric) row at the bottom
+    total_row = pd.DataFrame([{
+        "short_name": "predicted_rating",
+        "long_name": "Model Rating",
+        "coefficient": "",
+        "Z-score Value": "",
+        "Rating (notches)": body["Rating (notches)"].sum(),
+    }])
+    body = pd.concat([body, total_row], ignore_index=True)
+
+    # slot the pillar headers in between the factor blocks
+    cols = body.columns
+    table = pd.concat([
+        body.iloc[:1],     # const row
+        _header_row("eco_header", "REAL ECONOMY PILLAR (25%)", cols),
+        body.iloc[1:4],    # economy factors
+        _header_row("insti_header", "MONETARY & INSTITUTIONS PILLAR (44%)", cols),
+        body.iloc[4:7],    # institutional factors
+        _header_row("fiscal_header", "FISCAL PILLAR (17%)", cols),
+        body.iloc[7:9],    # fiscal factors
+        _header_row("ext_header", "EXTERNAL PILLAR (14%)", cols),
+        body.iloc[9:12],   # external factors
+        _header_row("final_header", "SOVEREIGN CREDIT RATING", cols),
+        body.iloc[12:14],  # model rating
+    ], ignore_index=True)
+
+    return table.rename(columns={"long_name": "Factor"})
+
+
+def apply_short_overrides(short_table_df, override_df, rating_dict):
+    """
+    Merges the analyst overrides (short_name, Adjustment, Analyst Comment) into the main table,
+    puts the model letter rating and the sum of adjustments on the model rating row,
+    and appends the LS final rating row.
+    """
+    model_rating = short_table_df.loc[short_table_df["short_name"] == "predicted_rating", "Rating (notches)"].iloc[0]
+
+    df = pd.merge(short_table_df, override_df, on="short_name", how="left")
+    df["Adjustment"] = pd.to_numeric(df["Adjustment"], errors="coerce").fillna(0)
+    df["Analyst Comment"] = df["Analyst Comment"].fillna("")
+
+    df.loc[df["short_name"] == "predicted_rating", "Analyst Comment"] = clamp_letter(model_rating, rating_dict)
+
+    # the final rating's notches + letter (and the sum of adjustments) are filled in by refresh_short_totals;
+    # its own Adjustment is 0 like every row without an override, so exports get a number and the grid a blank
+    final_row = pd.DataFrame([{
+        "short_name": "final_rating",
+        "Factor": "LS Final Rating",
+        "coefficient": "",
+        "Z-score Value": "",
+        "Rating (notches)": model_rating,
+        "Adjustment": 0.0,
+    }])
+    df = pd.concat([df, final_row], ignore_index=True)
+    return refresh_short_totals(df, rating_dict)
+
+
+def refresh_short_totals(df, rating_dict):
+    """
+    Recomputes the sum of adjustments on the model rating row and the LS final rating (notches + letter)
+    from the Adjustment column of a table from apply_short_overrides, e.g. after analyst edits in the grid.
+    """
+    ids = df["short_name"]
+    model_rating = df.loc[ids == "predicted_rating", "Rating (notches)"].iloc[0]
+
+    # sum of all adjustments, leaving out the model rating and final rating rows themselves
+    adj_sum = df.loc[~ids.isin(["predicted_rating", "final_rating", ""]), "Adjustment"].sum()
+    adjusted_rating = model_rating + adj_sum
+
+    df.loc[ids == "predicted_rating", "Adjustment"] = adj_sum
+    df.loc[ids == "final_rating", "Rating (notches)"] = adjusted_rating
+    df.loc[ids == "final_rating", "Analyst Comment"] = clamp_letter(adjusted_rating, rating_dict)
+    return df
+
+
+def build_long_table(raw_rows, transform_rows, variable_index):
+    """
+    Supplementary table before analyst overrides: every factor and constituent variable with its
+    raw value and z-score, plus pillar headers. raw_rows / transform_rows are the single
+    country-year row from raw_data and transform_data.
+    """
+    raw = raw_rows.T.reset_index()
+    raw.columns = ["short_name", "Raw Value"]
+    # single variable factors get renamed to the factor so they line up with the LHS
+    raw["short_name"] = raw["short_name"].replace(RAW_TO_FACTOR)
+
+    transform = transform_rows.T.reset_index()
+    transform.columns = ["short_name", "Z-score Value"]
+
+    df = pd.merge(variable_index.copy(), raw, on="short_name", how="left")
+    df = pd.merge(df, transform, on="short_name", how="left")
+
+    cols = ["short_name", "long_name", "description", "Raw Value", "Z-score Value"]
+    df = pd.concat([
+        df.iloc[:1],     # const row
+        _header_row("eco_header", "REAL ECONOMY PILLAR (25%)", cols),
+        df.iloc[1:4],    # economy factors
+        _header_row("insti_header", "MONETARY & INSTITUTIONS PILLAR (44%)", cols),
+        df.iloc[4:15],   # institutional factors
+        _header_row("fiscal_header", "FISCAL PILLAR (17%)", cols),
+        df.iloc[15:20],  # fiscal factors
+        _header_row("ext_header", "EXTERNAL PILLAR (14%)", cols),
+        df.iloc[20:25],  # external factors
+    ], ignore_index=True)
+
+    return df.rename(columns={"long_name": "Factor", "description": "Constituent Variables"})
+
+
+def apply_long_overrides(long_table_df, override_df_long):
+    """Merges the analyst overrides into the supplementary table and rolls sub-factor adjustments up to their factor."""
+    df = pd.merge(long_table_df, override_df_long, on="short_name", how="left")
+    df["Adjustment"] = pd.to_numeric(df["Adjustment"], errors="coerce").fillna(0)
+    df["Analyst Comment"] = df["Analyst Comment"].fillna("")
+    return refresh_long_rollups(df)
+
+
+def refresh_long_rollups(df):
+    """Sets each factor's Adjustment to the sum of its constituent variables' (SUBFACTORS) in the supplementary table."""
+    for factor, subfactors in SUBFACTORS.items():
+        df.loc[df["short_name"] == factor, "Adjustment"] = df.loc[df["short_name"].isin(subfactors), "Adjustment"].sum()
+    return df
+
+
+def apply_grid_edits(table, edits, numeric, text=()):
+    """
+    Applies the cells an analyst edited in the grid, [(short_name, column, value), ...], to a copy of the table.
+    Only the edited cells get cleaned up: numeric columns (numeric = {column: value for anything that isn't a number})
+    take numbers, text columns blank out whitespace-only entries so analysts can delete a comment.
+    Edits to other columns or to rows the table doesn't have are ignored.
+    """
+    df = table.copy()
+    for short_name, column, value in edits:
+        rows = df["short_name"] == short_name
+        if not rows.any():
+            continue
+        if column in numeric:
+            value = pd.to_numeric(value, errors="coerce")
+            df.loc[rows, column] = numeric[column] if pd.isna(value) else float(value)
+        elif column in text:
+            df.loc[rows, column] = "" if value is None or not str(value).strip() else str(value)
+    return df
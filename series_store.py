@@ -0,0 +1,40 @@
+# Per-country time series for the Historical Comparison page, laid out once as contiguous arrays.
+# The page used to filter df_transform / df_raw by name on every rerun (a full scan per country).
+# Here each variable is one (countries x years) float array. A country's history is then a row lookup,
+# so overlaying 10+ countries costs the same as showing one.
+
+import numpy as np
+import pandas as pd
+
+
+def build_series_store(df, columns):
+    """
+    {"years": sorted years, "names": {country: row}, "present": (countries x years) bool,
+     "series": {column: (countries x years) float array}} built from a long name/year frame.
+    Years a country has no row for are NaN in every series and False in "present".
+    The arrays are read-only: the store is shared between sessions.
+    """
+    years = np.sort(df["year"].unique())
+    names = np.sort(df["name"].unique())
+    rows = pd.Index(names).get_indexer(df["name"])
+    cols = np.searchsorted(years, df["year"].to_numpy())
+
+    present = np.zeros((len(names), len(years)), dtype=bool)
+    present[rows, cols] = True
+    present.flags.writeable = False
+
+    series = {}
+    for column in columns:
+        values = np.full((len(names), len(years)), np.nan)
+        values[rows, cols] = df[column].to_numpy(dtype=float)
+        values.flags.writeable = False
+        series[column] = values
+
+    return {"years": years, "names": {name: i for i, name in enumerate(names)}, "present": present, "series": series}
+
+
+def get_series(store, country, column):
+    # (years, values) for the years the country has data for, same as filtering the frame by name
+    i = store["names"][country]
+    keep = store["present"][i]
+    return store["years"][keep], store["series"][column][i, keep]
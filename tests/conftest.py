@@ -0,0 +1,9 @@
+# The app's modules are flat files at the repo root, and they read their workbooks by relative path.
+
+import os
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+os.chdir(REPO_DIR)
@@ -0,0 +1,334 @@
+# github_utils against a local fake of the GitHub API (http.server on 127.0.0.1), no network or token needed.
+# The fake keeps a tiny git repo in memory: refs -> commits -> flat trees {path: blob sha} -> blobs.
+
+import base64
+import hashlib
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+import github_utils
+
+REPO = "owner/repo"
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class FakeGitHub:
+    def __init__(self):
+        self.calls = []          # (method, path) of every request, in order
+        self.fail_status = None  # answer every request with this status (403 rate limit, 500...)
+        self.on_patch = None     # called once before the next PATCH, e.g. to move the branch under us
+        self.fail_put = None     # answer contents PUTs with this status (409 conflict...)
+        self.contents_reads = [] # (path, ref) of every contents GET
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        root = self.make_commit("initial", {"README.md": self.make_blob(b"readme\n")}, [])
+        self.refs = {"main": root}
+
+    def make_blob(self, data):
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def make_commit(self, message, files, parents):
+        tree_sha = hashlib.sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+        self.trees[tree_sha] = dict(files)
+        sha = hashlib.sha1(f"{message}{tree_sha}{parents}".encode()).hexdigest()
+        self.commits[sha] = {"tree": tree_sha, "parents": parents}
+        return sha
+
+    def files_at(self, ref):
+        commit = self.refs.get(ref, ref)
+        return self.trees[self.commits[commit]["tree"]] if commit in self.commits else {}
+
+    def handle(self, method, url, body, accept=None):
+        parts = urlparse(url)
+        path = parts.path
+        self.calls.append((method, path))
+        if self.fail_status:
+            return self.fail_status, {"message": "fake failure"}, {}
+
+        git = f"/repos/{REPO}/git/"
+        contents = f"/repos/{REPO}/contents/"
+        if method == "GET" and path.startswith(contents):
+            return self.get_contents(path[len(contents):], parse_qs(parts.query).get("ref", ["main"])[0], body, accept)
+        if method == "PUT" and path.startswith(contents):
+            return self.put_contents(path[len(contents):], body)
+        if method == "GET" and path.startswith(git + "ref/heads/"):
+            return 200, {"object": {"sha": self.refs[path[len(git + "ref/heads/"):]]}}, {}
+        if method == "GET" and path.startswith(git + "commits/"):
+            return 200, {"tree": {"sha": self.commits[path[len(git + "commits/"):]]["tree"]}}, {}
+        if method == "POST" and path == git + "trees":
+            return self.post_tree(body)
+        if method == "POST" and path == git + "commits":
+            sha = hashlib.sha1(f"{body['message']}{body['tree']}{body['parents']}".encode()).hexdigest()
+            self.commits[sha] = {"tree": body["tree"], "parents": body["parents"]}
+            return 201, {"sha": sha}, {}
+        if method == "PATCH" and path.startswith(git + "refs/heads/"):
+            return self.patch_ref(path[len(git + "refs/heads/"):], body)
+        return 404, {"message": "Not Found"}, {}
+
+    def get_contents(self, path, ref, if_none_match, accept):
+        self.contents_reads.append((path, ref))
+        blob = self.files_at(ref).get(path)
+        if blob is None:
+            return 404, {"message": "Not Found"}, {}
+        if accept and "raw" not in accept:
+            return 200, {"path": path, "sha": blob}, {}  # the JSON wrapper: push_df_to_github wants the blob sha
+        etag = f'"{blob}"'
+        if if_none_match == etag:
+            return 304, None, {"ETag": etag}
+        return 200, self.blobs[blob], {"ETag": etag}
+
+    def put_contents(self, path, body):
+        if self.fail_put:
+            return self.fail_put, {"message": "fake failure"}, {}
+        branch = body.get("branch", "main")
+        files = dict(self.files_at(branch))
+        # overwriting needs the current blob sha, creating must not send one
+        if body.get("sha") != files.get(path):
+            return 409, {"message": "sha does not match"}, {}
+        created = path not in files
+        files[path] = self.make_blob(base64.b64decode(body["content"]))
+        self.refs[branch] = self.make_commit(body["message"], files, [self.refs[branch]])
+        return 201 if created else 200, {"content": {"path": path, "sha": files[path]}, "commit": {"sha": self.refs[branch]}}, {}
+
+    def post_tree(self, body):
+        files = dict(self.trees[body["base_tree"]])
+        for entry in body["tree"]:
+            files[entry["path"]] = self.make_blob(entry["content"].encode())
+        tree_sha = hashlib.sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+        self.trees[tree_sha] = files
+        # like GitHub: the response lists the top level only, nested files show up as their folder's tree
+        top = {}
+        for path, sha in files.items():
+            name = path.split("/")[0]
+            top[name] = {"path": name, "type": "blob", "sha": sha} if "/" not in path else \
+                {"path": name, "type": "tree", "sha": hashlib.sha1(name.encode()).hexdigest()}
+        return 201, {"sha": tree_sha, "tree": list(top.values())}, {}
+
+    def patch_ref(self, branch, body):
+        if self.on_patch:
+            self.on_patch, on_patch = None, self.on_patch
+            on_patch()
+        # force=False: only a fast forward from the current head is allowed
+        if self.refs[branch] not in self.commits[body["sha"]]["parents"]:
+            return 422, {"message": "Update is not a fast forward"}, {}
+        self.refs[branch] = body["sha"]
+        return 200, {"object": {"sha": body["sha"]}}, {}
+
+
+@pytest.fixture
+def github():
+    fake = FakeGitHub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else self.headers.get("If-None-Match")
+            status, payload, headers = fake.handle(method, self.path, body, self.headers.get("Accept"))
+            data = payload if isinstance(payload, bytes) else (json.dumps(payload).encode() if payload is not None else b"")
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.respond("GET")
+
+        def do_POST(self):
+            self.respond("POST")
+
+        def do_PATCH(self):
+            self.respond("PATCH")
+
+        def do_PUT(self):
+            self.respond("PUT")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    github_utils._etag_cache.clear()
+    fake.url = f"http://127.0.0.1:{server.server_port}"
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+## load_df_from_github
+
+def test_load_revalidates_with_etag(github):
+    github.refs["main"] = github.make_commit("add", {"overrides/A.csv": github.make_blob(b"short_name,Adjustment\nwealth_factor,1\n")},
+                                             [github.refs["main"]])
+    first = github_utils.load_df_from_github(REPO, "overrides/A.csv", "token", api_url=github.url)
+    first.loc[0, "Adjustment"] = 5  # callers get a copy, the cached frame stays as read
+    second = github_utils.load_df_from_github(REPO, "overrides/A.csv", "token", api_url=github.url)
+
+    assert second["Adjustment"].tolist() == [1]
+    assert len(github.calls) == 2
+
+
+def test_load_missing_file_is_empty(github):
+    df = github_utils.load_df_from_github(REPO, "overrides/missing.csv", "token", api_url=github.url)
+    assert df.empty
+    assert list(df.columns) == ["short_name", "Adjustment", "Analyst Comment"]
+
+
+@pytest.mark.parametrize("status", [403, 500])
+def test_load_other_errors_raise(github, status):
+    github.fail_status = status
+    with pytest.raises(requests.HTTPError):
+        github_utils.load_df_from_github(REPO, "README.md", "token", api_url=github.url)
+
+
+def test_etag_cache_is_bounded(github, monkeypatch):
+    monkeypatch.setattr(github_utils, "_ETAG_CACHE_SIZE", 3)
+    files = {f"overrides/{i}.csv": github.make_blob(f"short_name,Adjustment\nx,{i}\n".encode()) for i in range(5)}
+    github.refs["main"] = github.make_commit("add", files, [github.refs["main"]])
+    for path in files:
+        github_utils.load_df_from_github(REPO, path, "token", api_url=github.url)
+
+    assert [key[1] for key in github_utils._etag_cache] == list(files)[-3:]
+
+
+def override_df(adjustment):
+    return pd.DataFrame({"short_name": ["wealth_factor"], "Adjustment": [adjustment], "Analyst Comment": ["x"]})
+
+
+## push_df_to_github
+
+def test_push_df_creates_then_updates(github):
+    path = "overrides/USA_2024.csv"
+    created = github_utils.push_df_to_github(override_df(1.0), REPO, path, "create", "token", api_url=github.url)
+
+    contents = f"/repos/{REPO}/contents/{path}"
+    assert github.calls == [("GET", contents), ("PUT", contents)]
+    assert created["commit_sha"] == github.refs["main"]
+    assert created["blob_sha"] == github.files_at("main")[path] == git_blob_sha(override_df(1.0).to_csv(index=False).encode())
+
+    # the second save sends the current blob sha, and lands as a new commit on top of the first
+    updated = github_utils.push_df_to_github(override_df(2.0), REPO, path, "update", "token", api_url=github.url)
+    assert updated["commit_sha"] == github.refs["main"]
+    assert github.commits[updated["commit_sha"]]["parents"] == [created["commit_sha"]]
+    assert updated["blob_sha"] == github.files_at("main")[path] != created["blob_sha"]
+
+
+def test_push_df_failed_put_returns_none(github):
+    head = github.refs["main"]
+    github.fail_put = 409
+    assert github_utils.push_df_to_github(override_df(1.0), REPO, "a.csv", "save", "token", api_url=github.url) is None
+    assert github.refs["main"] == head
+
+
+## wait_* with commit_sha: one read of that commit, no polling
+
+@pytest.fixture
+def pushed(github, monkeypatch):
+    # an analyst's save, then someone else changes the same file on main: reads by sha must still see our save
+    def no_sleep(seconds):
+        raise AssertionError("polled instead of reading the commit once")
+    monkeypatch.setattr("time.sleep", no_sleep)
+
+    path = "overrides/USA_2024.csv"
+    result = github_utils.push_df_to_github(override_df(1.5), REPO, path, "save", "token", api_url=github.url)
+    github_utils.push_df_to_github(override_df(-3.0), REPO, path, "someone else", "token", api_url=github.url)
+    github.contents_reads.clear()
+    return path, result["commit_sha"]
+
+
+@pytest.mark.parametrize("before, changed", [(override_df(0.0), True), (override_df(1.5), False)])
+def test_wait_for_override_to_update_reads_the_commit_once(github, pushed, before, changed):
+    path, commit_sha = pushed
+    assert github_utils.wait_for_override_to_update(REPO, path, "token", before, commit_sha=commit_sha,
+                                                    api_url=github.url) is changed
+    assert github.contents_reads == [(path, commit_sha)]
+
+
+@pytest.mark.parametrize("adjustment, matches", [(1.5, True), (-3.0, False)])
+def test_wait_until_override_row_matches_reads_the_commit_once(github, pushed, adjustment, matches):
+    path, commit_sha = pushed
+    target = {"short_name": "wealth_factor", "Adjustment": adjustment, "Analyst Comment": "x"}
+    assert github_utils.wait_until_override_row_matches(REPO, path, "token", target, commit_sha=commit_sha,
+                                                        api_url=github.url) is matches
+    assert github.contents_reads == [(path, commit_sha)]
+
+
+## push_dfs_to_github
+
+
+def push_sequence(branch="main"):
+    git = f"/repos/{REPO}/git/"
+    return [("GET", git + f"ref/heads/{branch}"), ("GET", None), ("POST", git + "trees"),
+            ("POST", git + "commits"), ("PATCH", git + f"refs/heads/{branch}")]
+
+
+def assert_push_calls(calls, rounds):
+    expected = push_sequence() * rounds
+    assert len(calls) == len(expected)
+    for (method, path), (want_method, want_path) in zip(calls, expected):
+        assert method == want_method
+        assert path == want_path if want_path else path.startswith(f"/repos/{REPO}/git/commits/")
+
+
+def test_push_makes_one_commit(github):
+    files = {"overrides/USA_2024.csv": override_df(1.0), "top.csv": override_df(-0.5)}
+    parent = github.refs["main"]
+    result = github_utils.push_dfs_to_github(files, REPO, "save", "token", api_url=github.url)
+
+    assert_push_calls(github.calls, rounds=1)
+    assert github.refs["main"] == result["commit_sha"]
+    assert github.commits[result["commit_sha"]]["parents"] == [parent]
+    assert set(github.files_at("main")) == {"README.md", "overrides/USA_2024.csv", "top.csv"}
+
+    # blob shas for every file, nested ones included, matching git and what landed on the branch
+    for path, df in files.items():
+        data = df.to_csv(index=False).encode()
+        expected = subprocess.run(["git", "hash-object", "--stdin"], input=data, capture_output=True, check=True).stdout.decode().strip()
+        assert result["blob_shas"][path] == expected == github.files_at("main")[path]
+
+    read_back = github_utils.load_df_from_github(REPO, "overrides/USA_2024.csv", "token", ref=result["commit_sha"], api_url=github.url)
+    assert read_back["Adjustment"].tolist() == [1.0]
+
+
+def test_push_retries_when_branch_moves(github):
+    # someone else pushes other.csv between our commit and our branch update -> 422, start again from their head
+    def other_push():
+        files = dict(github.files_at("main"), **{"other.csv": github.make_blob(b"other\n")})
+        github.refs["main"] = github.make_commit("other", files, [github.refs["main"]])
+    github.on_patch = other_push
+
+    result = github_utils.push_dfs_to_github({"overrides/USA_2024.csv": override_df(2.0)}, REPO, "save", "token",
+                                             api_url=github.url)
+
+    assert_push_calls(github.calls, rounds=2)
+    assert github.refs["main"] == result["commit_sha"]
+    assert set(github.files_at("main")) == {"README.md", "other.csv", "overrides/USA_2024.csv"}
+
+
+def test_push_gives_up_when_branch_keeps_moving(github):
+    def other_push():
+        github.refs["main"] = github.make_commit(f"other {len(github.calls)}", github.files_at("main"), [github.refs["main"]])
+        github.on_patch = other_push
+    github.on_patch = other_push
+
+    result = github_utils.push_dfs_to_github({"a.csv": override_df(1.0)}, REPO, "save", "token",
+                                             api_url=github.url, max_retries=2)
+
+    assert result is None
+    assert_push_calls(github.calls, rounds=2)
+    assert "a.csv" not in github.files_at("main")
@@ -0,0 +1,141 @@
+# gsheets_metrics against the installed gspread: the real Client / Spreadsheet / Worksheet methods the app uses
+# send their requests through a stub http_client.request, so if a gspread upgrade changes its endpoints the
+# (operation, kind, spreadsheet, tab) booked for the quota panel changes here first.
+
+import json
+from types import SimpleNamespace
+
+import gspread
+import pytest
+import requests
+from google.auth.credentials import AnonymousCredentials
+
+import gsheets_metrics
+
+SHEET_ID = "sheet123"
+TITLE = "analyst_overrides_short"
+TAB = "Cote d'Ivoire"  # a quote in the name: gspread escapes it in the A1 range
+
+
+def stub_response(status, payload):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(payload).encode()
+    return response
+
+
+def stub_payload(method, endpoint):
+    # just enough of each Sheets / Drive API answer for gspread to carry on
+    if "/drive/" in endpoint:
+        return {"files": [{"id": SHEET_ID, "name": TITLE, "createdTime": "", "modifiedTime": ""}]}
+    if endpoint.endswith(f"/spreadsheets/{SHEET_ID}"):
+        return {
+            "properties": {"title": TITLE, "locale": "en_US", "timeZone": "UTC"},
+            "sheets": [{"properties": {"title": TAB, "sheetId": 0, "index": 0,
+                                       "gridProperties": {"rowCount": 100, "columnCount": 4}}}],
+        }
+    if endpoint.endswith(":batchUpdate") and "/values" not in endpoint:
+        return {"replies": [{"addSheet": {"properties": {"title": "New tab", "sheetId": 1, "index": 1,
+                                                         "gridProperties": {"rowCount": 100, "columnCount": 4}}}}]}
+    if endpoint.endswith(":batchGet"):
+        return {"valueRanges": []}
+    if method == "get":
+        return {"range": "A1:D2", "majorDimension": "ROWS", "values": [["year", "short_name"], ["2025", "wealth_factor"]]}
+    return {"updates": {}}
+
+
+@pytest.fixture
+def client():
+    gsheets_metrics.reset_metrics()
+    client = gspread.Client(auth=AnonymousCredentials())
+    statuses = {}  # endpoint substring -> status to answer with (429 = over quota)
+
+    def request(method, endpoint, params=None, *args, **kwargs):
+        status = next((s for part, s in statuses.items() if part in endpoint), 200)
+        if status != 200:
+            # like gspread's own HTTPClient.request: any non-2xx raises APIError carrying the response
+            raise gspread.exceptions.APIError(stub_response(status, {"error": {"code": status, "message": "stub", "status": "STUB"}}))
+        return stub_response(200, stub_payload(method.lower(), endpoint))
+
+    client.http_client.request = request
+    client.statuses = statuses
+    return gsheets_metrics.instrument_client(client)
+
+
+def booked():
+    return [tuple(row) for row in gsheets_metrics._frame()[["operation", "kind", "spreadsheet", "tab"]].itertuples(index=False)]
+
+
+def test_every_call_the_app_makes_is_classified(client):
+    sheet = client.open(TITLE)
+    assert booked() == [("drive_get", "drive", TITLE, ""), ("metadata", "read", TITLE, "")]
+
+    steps = [
+        (lambda: sheet.worksheet(TAB), ("metadata", "read", TITLE, "")),
+        (lambda: sheet.worksheet(TAB).get_all_values(), ("values_get", "read", TITLE, TAB)),
+        (lambda: sheet.worksheet(TAB).get_all_records(), ("values_get", "read", TITLE, TAB)),
+        (lambda: sheet.worksheet(TAB).update([["year"]], "A1"), ("values_update", "write", TITLE, TAB)),
+        (lambda: sheet.worksheet(TAB).append_rows([[2025, "wealth_factor", 1]]), ("values_append", "write", TITLE, TAB)),
+        (lambda: sheet.worksheet(TAB).batch_update([{"range": "C2", "values": [[1]]}]), ("values_batch_update", "write", TITLE, "")),
+        (lambda: sheet.values_batch_get([f"'{TAB}'!A:D"]), ("values_batch_get", "read", TITLE, TAB)),
+        (lambda: sheet.values_batch_get([f"'{TAB}'!A:D", "Ghana!A:D", "Kenya!A:D"]), ("values_batch_get", "read", TITLE, "3 tabs")),
+        (lambda: sheet.add_worksheet("New tab", rows=10, cols=4), ("batch_update", "write", TITLE, "")),
+    ]
+    for step, expected in steps:
+        gsheets_metrics.reset_metrics()
+        step()
+        # sheet.worksheet() fetches the metadata first; the call under test is the last one
+        assert booked()[-1] == expected
+
+
+def test_unrecognised_endpoint(client):
+    client.open(TITLE)
+    gsheets_metrics.reset_metrics()
+    client.http_client.request("post", f"https://sheets.googleapis.com/v4/spreadsheets/{SHEET_ID}/developerMetadata:search")
+    client.http_client.request("get", "https://example.com/v1/something")
+    assert booked() == [("other", "write", TITLE, ""), ("other", "read", "", "")]
+
+
+def test_429_is_booked_and_raised(client):
+    sheet = client.open(TITLE)
+    client.statuses[":append"] = 429
+    with pytest.raises(gspread.exceptions.APIError):
+        sheet.worksheet(TAB).append_rows([[2025, "wealth_factor", 1]])
+
+    usage = gsheets_metrics.quota_usage()
+    assert usage["throttled"] == usage["total_throttled"] == 1
+    assert gsheets_metrics._frame()["status"].tolist()[-1] == 429
+
+
+def test_quota_usage_and_calls_per_minute(monkeypatch):
+    clock = [6000.0]  # 100 minutes past the epoch, on a minute boundary
+    monkeypatch.setattr(gsheets_metrics, "time", SimpleNamespace(time=lambda: clock[0]))
+    gsheets_metrics.reset_metrics()
+
+    def book(kind, status=200, n=1):
+        for _ in range(n):
+            gsheets_metrics.record_call("op", kind, TITLE, "", 1.0, 0, status)
+
+    # minute 1: 30 reads (2 of them 429s), 5 writes
+    book("read", n=28)
+    book("read", status=429, n=2)
+    book("write", n=5)
+    # minute 2, 30s in: 3 reads, 12 writes, 2 drive lookups, 1 failed write with no response
+    clock[0] += 90
+    book("read", n=3)
+    book("write", n=11)
+    book("write", status=None)
+    book("drive", n=2)
+
+    usage = gsheets_metrics.quota_usage()
+    assert (usage["reads"], usage["writes"], usage["drive"], usage["throttled"]) == (3, 12, 2, 0)
+    assert usage["read_quota_pct"] == pytest.approx(5.0)
+    assert usage["write_quota_pct"] == pytest.approx(20.0)
+    assert (usage["total_calls"], usage["total_throttled"]) == (52, 2)
+
+    assert gsheets_metrics.quota_usage(window_s=120)["throttled"] == 2  # reaches back into minute 1
+
+    minutes = gsheets_metrics.calls_per_minute()
+    assert minutes[["reads", "writes", "throttled"]].values.tolist() == [[30, 5, 2], [3, 12, 0]]  # busiest read minute first
+    assert minutes["read_quota_pct"].tolist() == pytest.approx([50.0, 5.0])
+    assert minutes["write_quota_pct"].tolist() == pytest.approx([5 / 60 * 100, 20.0])
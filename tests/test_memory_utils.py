@@ -0,0 +1,68 @@
+# memory_utils against stand-ins for Streamlit's session registry: the private attributes it reads can move
+# in a Streamlit upgrade, and the panel must then show empty tables instead of failing.
+
+from types import SimpleNamespace
+
+import memory_utils
+
+
+class FakeState:
+    def __init__(self, values, id_key_mapping):
+        self.values = values
+        self._key_id_mapper = SimpleNamespace(id_key_mapping=id_key_mapping)
+
+    def _keys(self):
+        return self.values.keys()
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+
+def fake_session(state, session_id="abcdef123456"):
+    return SimpleNamespace(session=SimpleNamespace(id=session_id, session_state=state), client=object())
+
+
+def test_session_memory_sizes_every_key(monkeypatch):
+    state = FakeState({"role": "write", "$$WIDGET_ID-1": list(range(1000))}, {"$$WIDGET_ID-1": "short_grid"})
+    monkeypatch.setattr(memory_utils, "_sessions", lambda: [fake_session(state)])
+
+    df = memory_utils.session_memory()
+
+    assert set(df["key"]) == {"role", "short_grid"}
+    assert (df["session"] == "abcdef12").all() and (df["role"] == "write").all()
+    assert df.loc[df["key"] == "short_grid", "mb"].iloc[0] > df.loc[df["key"] == "role", "mb"].iloc[0]
+
+
+def test_session_memory_is_empty_when_internals_move(monkeypatch):
+    class MovedState:
+        def _keys(self):
+            return ["role"]
+
+    monkeypatch.setattr(memory_utils, "_sessions", lambda: [fake_session(MovedState())])
+    df = memory_utils.session_memory()
+    assert df.empty
+    assert list(df.columns) == ["session", "role", "active", "key", "mb"]
+
+    monkeypatch.setattr(memory_utils, "_sessions", lambda: [SimpleNamespace(client=None)])
+    assert memory_utils.session_memory().empty
+
+
+def test_sampler_starts_and_stops(monkeypatch):
+    monkeypatch.setattr(memory_utils, "take_snapshot", lambda: None)
+    assert not memory_utils.sampler_running()
+
+    memory_utils.start_sampler(interval_s=0.01)
+    memory_utils.start_sampler(interval_s=0.01)  # already running: no second thread
+    thread = memory_utils._sampler
+    assert memory_utils.sampler_running()
+
+    memory_utils.stop_sampler()
+    thread.join(timeout=2)
+    assert not memory_utils.sampler_running() and not thread.is_alive()
+
+
+def test_sampler_env_opt_in(monkeypatch):
+    monkeypatch.delenv(memory_utils.SAMPLER_ENV, raising=False)
+    assert not memory_utils.sampler_enabled_by_env()
+    monkeypatch.setenv(memory_utils.SAMPLER_ENV, "1")
+    assert memory_utils.sampler_enabled_by_env()
@@ -0,0 +1,87 @@
+# Exports of the main rating table, from the page and from the rating book, against the repo's own data workbooks.
+# Every row of the main table carries a number in Adjustment (0 where there is no override): a NaN there ends up
+# as an empty numeric cell in the workbook and as "NaN" in the grid.
+
+import re
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from export_utils import generate_custom_export
+from rating_book import build_book_tables, build_rating_book
+from rating_tables import apply_grid_edits, apply_short_overrides, build_short_table, refresh_short_totals, score_countries
+
+YEAR = 2025
+HEADER_ROW = 6  # export_utils writes the table header on row 6, data below it
+
+
+@pytest.fixture(scope="module")
+def model():
+    df_transform = pd.read_excel("transform_data.xlsx")
+    df_raw = pd.read_excel("raw_data.xlsx")
+    coeff_index = pd.read_excel("coefficients_2024_WGI_new.xlsx")
+    variable_index = pd.read_excel("index_variable_name.xlsx")
+    rating_index = pd.read_excel("index_rating_scale.xlsx")
+    rating_dict = dict(zip(rating_index["Numeric"], rating_index["Credit Rating"]))
+    countries = pd.read_excel("coverage_list.xlsx")["name"].tolist()
+    return df_transform, df_raw, coeff_index, variable_index, rating_dict, countries
+
+
+def overrides(rows):
+    return pd.DataFrame(rows, columns=["short_name", "Adjustment", "Analyst Comment"])
+
+
+def empty_adjustment_cells(xlsx_bytes):
+    # sheet -> Adjustment cells written as a number with no value: <c r="E25" t="n"><v /></c>, what a NaN becomes.
+    # (suppressed zeros are fine: those are cells without a value at all, and read back as None just the same)
+    empty = {}
+    with zipfile.ZipFile(BytesIO(xlsx_bytes)) as zf:
+        # openpyxl saves the sheets as sheet1.xml, sheet2.xml, ... in workbook order
+        for i, ws in enumerate(load_workbook(BytesIO(xlsx_bytes)).worksheets, start=1):
+            header = [cell.value for cell in ws[HEADER_ROW]]
+            letter = get_column_letter(header.index("Adjustment") + 1)
+            xml = zf.read(f"xl/worksheets/sheet{i}.xml").decode()
+            cells = re.findall(rf'<c r="({letter}\d+)"[^>]*>\s*<v\s*/>', xml) + re.findall(rf'<c r="({letter}\d+)"[^>]*>\s*<v></v>', xml)
+            if cells:
+                empty[ws.title] = cells
+    return empty
+
+
+def test_page_export_has_no_nan_adjustment(model):
+    df_transform, _, coeff_index, variable_index, rating_dict, countries = model
+    year_transform = df_transform[df_transform["year"] == YEAR]
+    row = year_transform.index[year_transform["name"] == countries[0]][0]
+    scores = score_countries(year_transform, coeff_index)
+
+    # the page: table with overrides, then the analyst's grid edits on top, then the export
+    short_df = build_short_table(year_transform.loc[row], scores.loc[row], coeff_index, variable_index)
+    short_df = apply_short_overrides(short_df, overrides([["governance_factor", 1, "x"]]), rating_dict)
+    edits = [("wealth_factor", "Adjustment", "-0.5"), ("size_factor", "Analyst Comment", "  ")]
+    updated_df = refresh_short_totals(apply_grid_edits(short_df, edits, numeric={"Adjustment": 0}, text=["Analyst Comment"]), rating_dict)
+
+    assert not updated_df["Adjustment"].isna().any()
+    final = updated_df.loc[updated_df["short_name"] == "final_rating"].iloc[0]
+    assert final["Adjustment"] == 0
+    assert updated_df.loc[updated_df["short_name"] == "predicted_rating", "Adjustment"].iloc[0] == 0.5
+
+    assert empty_adjustment_cells(generate_custom_export(updated_df.drop(columns=["short_name"]), countries[0], YEAR)) == {}
+
+
+def test_rating_book_has_no_nan_adjustment(model):
+    df_transform, df_raw, coeff_index, variable_index, rating_dict, countries = model
+    overrides_short = {countries[0]: overrides([["governance_factor", 1, "x"], ["govdebt_factor", "", ""]])}
+    overrides_long = {countries[0]: overrides([["voice_acct", 0.5, "x"]])}
+
+    tables, _ = build_book_tables(YEAR, countries, df_transform, df_raw, coeff_index, variable_index, rating_dict,
+                                  overrides_short, overrides_long)
+    assert tables
+    for name, short_df, long_df in tables:
+        assert not short_df["Adjustment"].isna().any(), name
+        assert not long_df["Adjustment"].isna().any(), name
+
+    # every sheet of the generated book, main and supplementary
+    assert empty_adjustment_cells(build_rating_book(tables, YEAR, fmt="xlsx")) == {}